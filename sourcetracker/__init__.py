@@ -8,11 +8,19 @@
 # ----------------------------------------------------------------------------
 
 from ._compare import compare_sinks, compare_sink_metrics
-from ._sourcetracker import gibbs
+from ._sourcetracker import (gibbs, iter_gibbs, gibbs_replicates,
+                             iter_gibbs_replicates)
+from ._executors import SerialExecutor, SocketExecutor
+from ._session import SourceTrackerSession
+from ._estimate import estimate_gibbs
 from ._plot import plot_heatmap
+from ._util import SparseFeatureTable
 
 
 __version__ = '2.0.1-dev'
 _readme_url = "https://github.com/biota/sourcetracker2/blob/master/README.md"
 
-__all__ = ['compare_sinks', 'compare_sink_metrics', 'gibbs', 'plot_heatmap']
+__all__ = ['compare_sinks', 'compare_sink_metrics', 'gibbs', 'iter_gibbs',
+           'gibbs_replicates', 'iter_gibbs_replicates', 'estimate_gibbs',
+           'plot_heatmap', 'SerialExecutor', 'SocketExecutor',
+           'SourceTrackerSession', 'SparseFeatureTable']
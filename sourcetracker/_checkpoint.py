@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, Biota Technology.
+# www.biota.com
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from sourcetracker._util import SparseFeatureTable
+
+MANIFEST = 'manifest.json'
+CHECKPOINT_VERSION = 1
+
+
+def hash_table(table):
+    '''Return a hash of the values, index and columns of a dataframe.
+
+    Parameters
+    ----------
+    table : pd.DataFrame, SparseFeatureTable or None
+        The table to hash. A sparse table is hashed by its sparse arrays, so
+        it hashes differently from the equal dense table.
+
+    Returns
+    -------
+    str or None
+        The SHA-256 hex digest, or `None` if `table` is `None`.
+    '''
+    if table is None:
+        return None
+    if isinstance(table, SparseFeatureTable):
+        # The stored values, their columns and the row boundaries.
+        matrix = table.matrix.sorted_indices()
+        arrays = [matrix.data, matrix.indices, matrix.indptr]
+    else:
+        arrays = [np.ascontiguousarray(table.values)]
+    h = hashlib.sha256()
+    h.update(json.dumps([arrays[0].dtype.str, table.shape,
+                         [str(i) for i in table.index],
+                         [str(c) for c in table.columns]]).encode())
+    for values in arrays:
+        h.update(np.ascontiguousarray(values).tobytes())
+    return h.hexdigest()
+
+
+def create_manifest(sources, sinks, parameters):
+    '''Describe a run of the sampler by its inputs and parameters.
+
+    Parameters
+    ----------
+    sources : pd.DataFrame
+        The validated sources.
+    sinks : pd.DataFrame or None
+        The validated sinks, or `None` for LOO.
+    parameters : dict
+        Every parameter that affects the results, keyed by name. Values that
+        are not JSON types (e.g. a dtype or a `np.random.SeedSequence`) are
+        recorded by their `str`.
+
+    Returns
+    -------
+    dict
+        The manifest.
+    '''
+    parameters = {key: value if isinstance(value, (bool, int, float, str,
+                                                   type(None))) else
+                  str(value) for key, value in parameters.items()}
+    return {'version': CHECKPOINT_VERSION,
+            'sources': hash_table(sources),
+            'sinks': hash_table(sinks),
+            'parameters': parameters}
+
+
+def _atomic_write(path, write):
+    '''Call `write` on a temporary file and move it to `path`.
+
+    The file is flushed to disk before it is renamed, so `path` either does
+    not exist or is complete, however the process is interrupted.
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def open_checkpoint(directory, manifest):
+    '''Prepare `directory` to hold the checkpoint of the run `manifest`.
+
+    Parameters
+    ----------
+    directory : str
+        The checkpoint directory. It is created if it does not exist.
+    manifest : dict
+        See `create_manifest`.
+
+    Raises
+    ------
+    ValueError
+        If `directory` holds the checkpoint of a run with different inputs or
+        parameters.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, MANIFEST)
+    if os.path.exists(path):
+        with open(path) as f:
+            existing = json.load(f)
+        if existing != manifest:
+            differ = [key for key in ['version', 'sources', 'sinks']
+                      if existing.get(key) != manifest[key]]
+            parameters = existing.get('parameters', {})
+            differ.extend(key for key in sorted(manifest['parameters'])
+                          if parameters.get(key) !=
+                          manifest['parameters'][key])
+            raise ValueError('The checkpoint in %s was written by a run with '
+                             'different inputs or parameters (%s) and can '
+                             'not be resumed. Use a new checkpoint '
+                             'directory.' % (directory, ', '.join(differ)))
+    else:
+        _atomic_write(path, lambda f: f.write(json.dumps(
+            manifest, indent=2, sort_keys=True).encode()))
+
+
+def _sink_path(directory, i):
+    return os.path.join(directory, 'sink_%d.npz' % i)
+
+
+def save_sink(directory, i, result):
+    '''Atomically save the result of the ith sink.
+
+    Parameters
+    ----------
+    directory : str
+        The checkpoint directory.
+    i : int
+        Position of the sink.
+    result : tuple
+        The result of `gibbs_sampler` with `accumulate_draws=True`, i.e.
+        `envcounts`, `feature_counts` and (with adaptive burn-in) `passes`.
+    '''
+    arrays = {'envcounts': result[0], 'feature_counts': result[1]}
+    if len(result) > 2:
+        arrays['passes'] = np.asarray(result[2])
+    _atomic_write(_sink_path(directory, i),
+                  lambda f: np.savez(f, **arrays))
+
+
+def load_sinks(directory, num_sinks):
+    '''Load the results of the sinks saved in `directory`.
+
+    Parameters
+    ----------
+    directory : str
+        The checkpoint directory.
+    num_sinks : int
+        The number of sinks of the run.
+
+    Returns
+    -------
+    dict
+        The result (see `save_sink`) of each completed sink, keyed by its
+        position.
+    '''
+    results = {}
+    for i in range(num_sinks):
+        path = _sink_path(directory, i)
+        if not os.path.exists(path):
+            continue
+        with np.load(path) as data:
+            result = (data['envcounts'], data['feature_counts'])
+            if 'passes' in data:
+                result += (int(data['passes']),)
+        results[i] = result
+    return results
@@ -18,7 +18,11 @@ from biom import Table, load_table
 from matplotlib import pyplot as plt
 
 from sourcetracker._cli.cli import cli
-from sourcetracker._gibbs import gibbs_helper
+from sourcetracker._gibbs import prepare_gibbs_replicates
+from sourcetracker._sourcetracker import (iter_gibbs, iter_gibbs_replicates,
+                                          parse_memory, prune_features)
+from sourcetracker._executors import EXECUTORS, SocketExecutor
+from sourcetracker._estimate import estimate_gibbs
 from sourcetracker._plot import plot_heatmap
 from sourcetracker._util import parse_sample_metadata, biom_to_df
 
@@ -29,7 +33,13 @@ from sourcetracker._gibbs_defaults import (DESC_TBL, DESC_MAP, DESC_OUT,
                                            DESC_RAF2, DESC_RST, DESC_DRW,
                                            DESC_BRN, DESC_DLY, DESC_PFA,
                                            DESC_RPL, DESC_SNK, DESC_SRS,
-                                           DESC_SRS2, DESC_CAT)
+                                           DESC_SRS2, DESC_CAT, DESC_ENG,
+                                           DESC_FBL, DESC_SEED, DESC_SPM,
+                                           DESC_DTYPE, DESC_ABN, DESC_RHAT,
+                                           DESC_CKPT, DESC_EXE, DESC_WRK,
+                                           DESC_AUTH, DESC_MEM, DESC_DRY,
+                                           DESC_RREP, DESC_PRN, DESC_PRV,
+                                           DESC_ABD)
 
 # import default values
 from sourcetracker._gibbs_defaults import (DEFAULT_ALPH1, DEFAULT_ALPH2,
@@ -37,7 +47,41 @@ from sourcetracker._gibbs_defaults import (DEFAULT_ALPH1, DEFAULT_ALPH2,
                                            DEFAULT_HUND, DEFAULT_THOUS,
                                            DEFAULT_FLS, DEFAULT_SNK,
                                            DEFAULT_SRS, DEFAULT_SRS2,
-                                           DEFAULT_CAT)
+                                           DEFAULT_CAT, DEFAULT_ENG, ENGINES,
+                                           DEFAULT_SEED, DEFAULT_DTYPE, DTYPES,
+                                           DEFAULT_RHAT, DEFAULT_CKPT,
+                                           DEFAULT_EXE, DEFAULT_MEM,
+                                           DEFAULT_ZERO)
+
+
+def _parse_jobs(ctx, param, value):
+    if value == 'auto':
+        return value
+    try:
+        jobs = int(value)
+    except ValueError:
+        jobs = 0
+    if jobs < 1:
+        raise click.BadParameter("%r is neither a positive integer nor "
+                                 "'auto'." % value)
+    return jobs
+
+
+def _parse_memory(ctx, param, value):
+    try:
+        return parse_memory(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def _format_bytes(size):
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = 'TiB'
+    return '%.1f %s' % (size, unit)
 
 
 @cli.command(name='gibbs')
@@ -54,9 +98,12 @@ from sourcetracker._gibbs_defaults import (DEFAULT_ALPH1, DEFAULT_ALPH2,
 @click.option('--loo', required=False, default=DEFAULT_FLS, is_flag=True,
               show_default=True,
               help=DESC_LOO)
-@click.option('--jobs', required=False, default=DEFAULT_ONE,
-              type=click.INT, show_default=True,
+@click.option('--jobs', required=False, default=str(DEFAULT_ONE),
+              type=click.STRING, show_default=True, callback=_parse_jobs,
               help=DESC_JBS)
+@click.option('--max_memory', required=False, default=DEFAULT_MEM,
+              type=click.STRING, show_default=True, callback=_parse_memory,
+              help=DESC_MEM)
 @click.option('--alpha1', required=False, default=DEFAULT_ALPH1,
               type=click.FLOAT, show_default=True,
               help=DESC_ALPH1)
@@ -106,6 +153,18 @@ from sourcetracker._gibbs_defaults import (DEFAULT_ALPH1, DEFAULT_ALPH2,
 @click.option('--sample_with_replacement', required=False,
               default=DEFAULT_FLS, show_default=True, is_flag=True,
               help=DESC_RPL)
+@click.option('--rarefaction_replicates', required=False,
+              default=DEFAULT_ONE, type=click.IntRange(min=1),
+              show_default=True, help=DESC_RREP)
+@click.option('--prune_features', 'prune', required=False,
+              default=DEFAULT_FLS, is_flag=True, show_default=True,
+              help=DESC_PRN)
+@click.option('--min_feature_prevalence', required=False,
+              default=DEFAULT_ZERO, type=click.FloatRange(min=0, max=1),
+              show_default=True, help=DESC_PRV)
+@click.option('--min_feature_abundance', required=False,
+              default=DEFAULT_ZERO, type=click.FloatRange(min=0),
+              show_default=True, help=DESC_ABD)
 @click.option('--source_sink_column', required=False, default=DEFAULT_SNK,
               type=click.STRING, show_default=True,
               help=DESC_SNK)
@@ -118,6 +177,39 @@ from sourcetracker._gibbs_defaults import (DEFAULT_ALPH1, DEFAULT_ALPH2,
 @click.option('--source_category_column', required=False, default=DEFAULT_CAT,
               type=click.STRING, show_default=True,
               help=DESC_CAT)
+@click.option('--engine', required=False, default=DEFAULT_ENG,
+              type=click.Choice(ENGINES), show_default=True,
+              help=DESC_ENG)
+@click.option('--feature_blocks', required=False, default=DEFAULT_FLS,
+              is_flag=True, show_default=True,
+              help=DESC_FBL)
+@click.option('--seed', required=False, default=DEFAULT_SEED,
+              type=click.INT, show_default=True,
+              help=DESC_SEED)
+@click.option('--sparse_model', required=False, default=DEFAULT_FLS,
+              is_flag=True, show_default=True,
+              help=DESC_SPM)
+@click.option('--dtype', required=False, default=DEFAULT_DTYPE,
+              type=click.Choice(DTYPES), show_default=True,
+              help=DESC_DTYPE)
+@click.option('--adaptive_burnin', required=False, default=DEFAULT_FLS,
+              is_flag=True, show_default=True,
+              help=DESC_ABN)
+@click.option('--rhat', required=False, default=DEFAULT_RHAT,
+              type=click.FLOAT, show_default=True,
+              help=DESC_RHAT)
+@click.option('--checkpoint_dir', required=False, default=DEFAULT_CKPT,
+              type=click.Path(dir_okay=True, file_okay=False, writable=True),
+              show_default=True, help=DESC_CKPT)
+@click.option('--executor', required=False, default=DEFAULT_EXE,
+              type=click.Choice(EXECUTORS), show_default=True,
+              help=DESC_EXE)
+@click.option('--worker', 'workers', required=False, multiple=True,
+              type=click.STRING, help=DESC_WRK)
+@click.option('--authkey', required=False, default=None, type=click.STRING,
+              envvar='SOURCETRACKER_AUTHKEY', help=DESC_AUTH)
+@click.option('--dry_run', required=False, default=DEFAULT_FLS, is_flag=True,
+              show_default=True, help=DESC_DRY)
 # Stats functions for diagnostics
 @click.option('--diagnostics', required=False, default=False, is_flag=True,
               show_default=True)
@@ -128,6 +220,7 @@ def gibbs(table_fp: Table,
           output_dir: str,
           loo: bool,
           jobs: int,
+          max_memory: int,
           alpha1: float,
           alpha2: float,
           beta: float,
@@ -139,42 +232,164 @@ def gibbs(table_fp: Table,
           delay: int,
           per_sink_feature_assignments: bool,
           sample_with_replacement: bool,
+          rarefaction_replicates: int,
+          prune: bool,
+          min_feature_prevalence: float,
+          min_feature_abundance: float,
           source_sink_column: str,
           source_column_value: str,
           sink_column_value: str,
           source_category_column: str,
+          engine: str,
+          feature_blocks: bool,
+          seed: int,
+          sparse_model: bool,
+          dtype: str,
+          adaptive_burnin: bool,
+          rhat: float,
+          checkpoint_dir: str,
+          executor: str,
+          workers: tuple,
+          authkey: str,
+          dry_run: bool,
           diagnostics: bool,
           limit: float):
     '''Gibb's sampler for Bayesian estimation of microbial sample sources.
 
     For details, see the project README file.
     '''
+    if workers and executor != 'socket':
+        raise click.UsageError('`--worker` requires `--executor socket`.')
+    if workers:
+        if authkey is None:
+            raise click.UsageError('The socket workers require `--authkey`.')
+        addresses = []
+        for worker in workers:
+            host, _, port = worker.rpartition(':')
+            if not host or not port.isdigit():
+                raise click.BadParameter('%r is not of the form host:port.'
+                                         % worker, param_hint='--worker')
+            addresses.append((host, int(port)))
+    if not prune and (min_feature_prevalence or min_feature_abundance):
+        raise click.UsageError('`--min_feature_prevalence` and '
+                               '`--min_feature_abundance` require '
+                               '`--prune_features`.')
+    if checkpoint_dir is not None and rarefaction_replicates > 1:
+        raise click.UsageError('`--checkpoint_dir` cannot be used with more '
+                               'than one `--rarefaction_replicates`.')
+    if checkpoint_dir is not None and seed is None and \
+            (source_rarefaction_depth > 0 or
+             (not loo and sink_rarefaction_depth > 0)):
+        # unseeded rarefaction changes the inputs the checkpoint records,
+        # so the run could never be resumed
+        raise click.UsageError('`--checkpoint_dir` with rarefaction requires '
+                               '`--seed`, or the run cannot be resumed. Pass '
+                               '`--seed`, or rarefaction depths of 0.')
+
     # Create results directory. Click has already checked if it exists, and
     # failed if so.
-    os.mkdir(output_dir)
+    if not dry_run:
+        os.mkdir(output_dir)
 
     # Load the metadata file and feature table.
     sample_metadata = parse_sample_metadata(open(mapping_fp, 'U'))
-    feature_table = biom_to_df(load_table(table_fp))
-
-    # run the gibbs sampler helper function (same used for q2)
-    results = gibbs_helper(feature_table, sample_metadata, loo, jobs,
-                           alpha1, alpha2, beta, source_rarefaction_depth,
-                           sink_rarefaction_depth, restarts, draws_per_restart,
-                           burnin, delay, per_sink_feature_assignments,
-                           sample_with_replacement, source_sink_column,
-                           source_column_value, sink_column_value,
-                           source_category_column)
-    # import the results (will change based on per_sink_feature_assignments)
-    if len(results) == 3:
-        mpm, mps, fas = results
-        # write the feature tables from fas
-        for sink, fa in zip(mpm.columns, fas):
-            fa.to_csv(os.path.join(output_dir, sink + '.feature_table.txt'),
-                      sep='\t')
-    else:
-        # get the results (without fas)
-        mpm, mps = results
+    feature_table = biom_to_df(load_table(table_fp), sparse=True)
+
+    # prepare the sources and sinks (same used for q2)
+    replicates = prepare_gibbs_replicates(feature_table, sample_metadata, loo,
+                                          source_rarefaction_depth,
+                                          sink_rarefaction_depth,
+                                          sample_with_replacement,
+                                          source_sink_column,
+                                          source_column_value,
+                                          sink_column_value,
+                                          source_category_column, seed=seed,
+                                          jobs=jobs,
+                                          replicates=rarefaction_replicates)
+    features = replicates[0][0].columns
+    if prune:
+        replicates, pruned = prune_features(replicates,
+                                            min_feature_prevalence,
+                                            min_feature_abundance)
+        click.echo('Pruned %d of %d features' % (len(pruned), len(features)))
+        if not dry_run:
+            pruned.to_csv(os.path.join(output_dir, 'pruned_features.txt'),
+                          sep='\t', index_label='feature')
+    csources, sinks = replicates[0]
+    sink_ids = csources.index if loo else sinks.index
+
+    if dry_run:
+        estimate = estimate_gibbs(csources, sinks, alpha1, alpha2, beta,
+                                  restarts, draws_per_restart, burnin, delay,
+                                  jobs, per_sink_feature_assignments,
+                                  engine=engine,
+                                  feature_blocks=feature_blocks, seed=seed,
+                                  sparse_model=sparse_model, dtype=dtype,
+                                  adaptive_burnin=adaptive_burnin, rhat=rhat,
+                                  executor=executor, max_memory=max_memory)
+        click.echo('Sinks: %d' % len(sink_ids))
+        if rarefaction_replicates > 1:
+            click.echo('Rarefaction replicates: %d (the estimates below are '
+                       'for one replicate)' % rarefaction_replicates)
+        click.echo('Jobs: %d (%d tasks)' % (estimate.jobs, estimate.tasks))
+        click.echo('Sequence reassignments: %d (%.0f per second per job)'
+                   % (estimate.updates, estimate.updates_per_second))
+        click.echo('Predicted sampling time: %.1f s (%.1f CPU s)'
+                   % (estimate.wall_seconds, estimate.cpu_seconds))
+        click.echo('Predicted peak memory: %s'
+                   % _format_bytes(estimate.peak_memory))
+        click.echo('Predicted output size: %s'
+                   % _format_bytes(estimate.output_bytes))
+        return
+
+    if workers:
+        executor = SocketExecutor(addresses, authkey=authkey.encode())
+
+    # run the gibbs sampler, writing the feature table of each sink as soon
+    # as it is done (with replicates, once all its replicates are done)
+    kwargs = {'engine': engine, 'feature_blocks': feature_blocks,
+              'seed': seed, 'sparse_model': sparse_model, 'dtype': dtype,
+              'adaptive_burnin': adaptive_burnin, 'rhat': rhat,
+              'executor': executor, 'max_memory': max_memory}
+    results = {}
+    try:
+        if rarefaction_replicates > 1:
+            sink_results = iter_gibbs_replicates(
+                replicates, alpha1, alpha2, beta, restarts,
+                draws_per_restart, burnin, delay, jobs,
+                per_sink_feature_assignments, **kwargs)
+        else:
+            sink_results = iter_gibbs(
+                csources, sinks, alpha1, alpha2, beta, restarts,
+                draws_per_restart, burnin, delay, jobs,
+                per_sink_feature_assignments, checkpoint_dir=checkpoint_dir,
+                **kwargs)
+        for result in sink_results:
+            if per_sink_feature_assignments:
+                feature_table = result.feature_table
+                if prune:
+                    # the pruned features have counts of 0
+                    feature_table = feature_table.reindex(columns=features,
+                                                          fill_value=0)
+                feature_table.to_csv(
+                    os.path.join(output_dir,
+                                 result.sink_id + '.feature_table.txt'),
+                    sep='\t')
+            results[result.sink_id] = result._replace(feature_table=None)
+    finally:
+        if workers:
+            executor.shutdown()
+    results = [results[sink_id] for sink_id in sink_ids]
+    # rows are sources, columns are sinks
+    mpm = pd.concat([result.proportions for result in results], axis=1)
+    mps = pd.concat([result.proportions_std for result in results], axis=1)
+    # the number of passes made for each sink is only reported with adaptive
+    # burn-in
+    if adaptive_burnin:
+        passes = pd.Series([result.passes for result in results],
+                           index=sink_ids, name='passes')
+        passes.to_csv(os.path.join(output_dir, 'burnin_passes.txt'),
+                      sep='\t', header=True)
 
     # Write results.
     mpm.to_csv(os.path.join(output_dir, 'mixing_proportions.txt'), sep='\t')
@@ -187,9 +402,9 @@ def gibbs(table_fp: Table,
 
     if diagnostics:
         os.mkdir(output_dir + 'diagnostics')
-        data = np.load('envcounts.npy', allow_pickle=True)
-        sink_ids = np.load('sink_ids.npy', allow_pickle=True)
-        source_ids = np.load('source_ids.npy', allow_pickle=True)
+        data = [result.envcounts for result in results]
+        # with LOO the held out source has no column in the envcounts
+        source_ids = csources.index[:-1] if loo else csources.index
         file_path = output_dir + 'diagnostics'
 
         source_ids = np.append(source_ids, ['unknown'])
@@ -237,7 +452,3 @@ def gibbs(table_fp: Table,
             df.columns.values[0] = ''
             df.set_index('').T
             df.to_csv(file_path + '/' + 'table.txt', sep='\t', index=False)
-
-    os.remove('envcounts.npy')
-    os.remove('sink_ids.npy')
-    os.remove('source_ids.npy')
@@ -9,11 +9,15 @@
 # ----------------------------------------------------------------------------
 
 import os
+import shutil
 import unittest
 import tempfile
 import pandas as pd
 from click.testing import CliRunner
 from sourcetracker._cli.gibbs import gibbs
+from sourcetracker._gibbs import gibbs_helper
+from sourcetracker._util import biom_to_df, parse_sample_metadata
+from biom import load_table
 from numpy.testing import assert_allclose
 
 
@@ -163,6 +167,138 @@ class Test_standalone_gibbs(unittest.TestCase):
                                            exp_mp.columns],
                                 atol=.50)
 
+    def test_dry_run(self):
+        tst_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               os.pardir, os.pardir, os.pardir)
+        tbl_pth = os.path.join(tst_pth, 'data/tiny-test/otu_table.biom')
+        mta_pth = os.path.join(tst_pth, 'data/tiny-test/map.txt')
+        with tempfile.TemporaryDirectory() as temp_dir_name:
+            res_pth = os.path.join(temp_dir_name, 'res')
+            result = CliRunner().invoke(gibbs, ['--table_fp', tbl_pth,
+                                                '--mapping_fp', mta_pth,
+                                                '--output_dir', res_pth,
+                                                '--jobs', 'auto',
+                                                '--burnin', 10,
+                                                '--dry_run'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn('Predicted sampling time', result.output)
+            self.assertIn('Predicted peak memory', result.output)
+            # nothing is written
+            self.assertFalse(os.path.exists(res_pth))
+
+    def test_rarefaction_replicates(self):
+        tst_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               os.pardir, os.pardir, os.pardir)
+        tbl_pth = os.path.join(tst_pth, 'data/tiny-test/otu_table.biom')
+        mta_pth = os.path.join(tst_pth, 'data/tiny-test/map.txt')
+        with tempfile.TemporaryDirectory() as temp_dir_name:
+            args = ['--table_fp', tbl_pth, '--mapping_fp', mta_pth,
+                    '--burnin', 3, '--restarts', 2, '--seed', 4,
+                    '--rarefaction_replicates', 3]
+            results = []
+            for jobs in ['1', '2']:
+                res_pth = os.path.join(temp_dir_name, jobs)
+                result = CliRunner().invoke(gibbs, args + ['--output_dir',
+                                                           res_pth,
+                                                           '--jobs', jobs])
+                self.assertEqual(result.exit_code, 0)
+                results.append(pd.read_csv(
+                    os.path.join(res_pth, 'mixing_proportions.txt'),
+                    sep='\t', index_col=0))
+            # The pooled proportions do not depend on the number of jobs.
+            pd.testing.assert_frame_equal(*results)
+            result = CliRunner().invoke(
+                gibbs, args + ['--output_dir',
+                               os.path.join(temp_dir_name, 'ckpt'),
+                               '--checkpoint_dir',
+                               os.path.join(temp_dir_name, 'state')])
+            self.assertNotEqual(result.exit_code, 0)
+
+    def test_checkpoint_requires_seed(self):
+        tst_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               os.pardir, os.pardir, os.pardir)
+        tbl_pth = os.path.join(tst_pth, 'data/tiny-test/otu_table.biom')
+        mta_pth = os.path.join(tst_pth, 'data/tiny-test/map.txt')
+        with tempfile.TemporaryDirectory() as temp_dir_name:
+            args = ['--table_fp', tbl_pth, '--mapping_fp', mta_pth,
+                    '--burnin', 3, '--restarts', 2, '--checkpoint_dir',
+                    os.path.join(temp_dir_name, 'state')]
+            # unseeded rarefaction could never be resumed
+            result = CliRunner().invoke(gibbs, args + [
+                '--output_dir', os.path.join(temp_dir_name, 'res1')])
+            self.assertEqual(result.exit_code, 2)
+            self.assertIn('--seed', result.output)
+            # without rarefaction, or with a seed, it can be
+            for add_ in [['--source_rarefaction_depth', 0,
+                          '--sink_rarefaction_depth', 0],
+                         ['--seed', 4]]:
+                res_pth = os.path.join(temp_dir_name, str(len(add_)))
+                result = CliRunner().invoke(gibbs, args + add_ + [
+                    '--output_dir', res_pth])
+                self.assertEqual(result.exit_code, 0)
+                shutil.rmtree(os.path.join(temp_dir_name, 'state'))
+
+    def test_prune_features(self):
+        tst_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               os.pardir, os.pardir, os.pardir)
+        tbl_pth = os.path.join(tst_pth, 'data/tiny-test/otu_table.biom')
+        mta_pth = os.path.join(tst_pth, 'data/tiny-test/map.txt')
+        with tempfile.TemporaryDirectory() as temp_dir_name:
+            res_pth = os.path.join(temp_dir_name, 'res')
+            result = CliRunner().invoke(gibbs, ['--table_fp', tbl_pth,
+                                                '--mapping_fp', mta_pth,
+                                                '--output_dir', res_pth,
+                                                '--burnin', 3,
+                                                '--restarts', 2,
+                                                '--seed', 4,
+                                                '--per_sink_feature_'
+                                                'assignments',
+                                                '--prune_features',
+                                                '--min_feature_abundance',
+                                                600])
+            self.assertEqual(result.exit_code, 0)
+            pruned = pd.read_csv(os.path.join(res_pth,
+                                              'pruned_features.txt'),
+                                 sep='\t', index_col=0)
+            self.assertTrue(0 < len(pruned) < 20)
+            self.assertTrue((pruned['abundance'] < 600).all())
+            # the feature tables have every feature, with no counts of the
+            # pruned ones
+            table = pd.read_csv(os.path.join(res_pth, 's0.feature_table.txt'),
+                                sep='\t', index_col=0)
+            self.assertEqual(table.shape[1], 20)
+            self.assertEqual(table[pruned.index].values.sum(), 0)
+            # the thresholds require --prune_features
+            result = CliRunner().invoke(gibbs, ['--table_fp', tbl_pth,
+                                                '--mapping_fp', mta_pth,
+                                                '--output_dir',
+                                                os.path.join(temp_dir_name,
+                                                             'res2'),
+                                                '--min_feature_abundance',
+                                                600])
+            self.assertEqual(result.exit_code, 2)
+            self.assertIn('--prune_features', result.output)
+
+    def test_gibbs_helper_prune_report(self):
+        tst_pth = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               os.pardir, os.pardir, os.pardir)
+        table = biom_to_df(load_table(os.path.join(
+            tst_pth, 'data/tiny-test/otu_table.biom')), sparse=True)
+        metadata = parse_sample_metadata(open(os.path.join(
+            tst_pth, 'data/tiny-test/map.txt')))
+        args = [table, metadata, False, 1, .001, .1, 10, 1000, 1000, 2, 1, 3,
+                1, True, False, 'SourceSink', 'source', 'sink', 'Env']
+        kwargs = {'seed': 4, 'prune_features': True,
+                  'min_feature_abundance': 600}
+        results = gibbs_helper(*args, **kwargs)
+        # the report of the pruned features is returned last
+        self.assertEqual(len(results), 4)
+        pruned = results[3]
+        self.assertTrue((pruned['abundance'] < 600).all())
+        self.assertEqual(results[2][0][pruned.index].values.sum(), 0)
+        self.assertRaises(ValueError, gibbs_helper, *args, seed=4,
+                          min_feature_abundance=600)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, Biota Technology.
+# www.biota.com
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import click
+
+from sourcetracker._cli.cli import cli
+from sourcetracker._executors import serve_worker
+from sourcetracker._gibbs_defaults import (DEFAULT_HOST, DEFAULT_PORT,
+                                           DESC_HOST, DESC_PORT, DESC_AUTH)
+
+
+@cli.command(name='worker')
+@click.option('--host', required=False, default=DEFAULT_HOST,
+              type=click.STRING, show_default=True, help=DESC_HOST)
+@click.option('--port', required=False, default=DEFAULT_PORT,
+              type=click.IntRange(min=1, max=65535), show_default=True,
+              help=DESC_PORT)
+@click.option('--authkey', required=True, type=click.STRING,
+              envvar='SOURCETRACKER_AUTHKEY', help=DESC_AUTH)
+def worker(host: str, port: int, authkey: str):
+    '''Run a worker for `sourcetracker2 gibbs --executor socket`.
+
+    The worker runs the sampling tasks sent to it by one run of gibbs at a
+    time, until it is stopped.
+    '''
+    click.echo('Worker listening on %s:%d' % (host, port))
+    serve_worker((host, port), authkey.encode())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, Biota Technology.
+# www.biota.com
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import heapq
+import time
+from collections import namedtuple
+
+import numpy as np
+import scipy.sparse
+
+from sourcetracker._sourcetracker import (ConditionalProbability,
+                                          LOCKSTEP_ENGINES, gibbs_sampler,
+                                          _validate_gibbs, _plan_run,
+                                          _count_matrix, _row_nonzeros,
+                                          _dense)
+
+# Bytes of a float and of an integer count written to a tab separated table,
+# including the separator.
+_FLOAT_CELL = 20
+_ZERO_CELL = 2
+
+GibbsEstimate = namedtuple('GibbsEstimate', ['jobs', 'tasks', 'updates',
+                                             'updates_per_second',
+                                             'cpu_seconds', 'wall_seconds',
+                                             'peak_memory', 'output_bytes'])
+
+
+def calibrate_sampler(sources, sink, alpha1=.001, alpha2=.1, beta=10,
+                      restarts=10, engine='python', feature_blocks=False,
+                      sparse_model=False, dtype=np.float64, depth=1000,
+                      passes=10, seed=0):
+    '''Measure how many sequences per second `gibbs_sampler` reassigns.
+
+    Parameters
+    ----------
+    sources : np.array
+        2D array of ints, the source data (rows are sources, columns are
+        features).
+    sink : np.array
+        1D array of ints, the sink to time the sampler on. It is rarefied to
+        `depth` sequences if it is deeper.
+    alpha1, alpha2, beta, restarts, engine, feature_blocks, sparse_model
+    dtype
+        See `gibbs`. `restarts` only matters for the engines in
+        `LOCKSTEP_ENGINES`, which grow all restarts together.
+    depth : int, optional
+        Most sequences to time the sampler on.
+    passes : int, optional
+        Number of passes to time.
+    seed : int, optional
+        Seed of the rarefaction and of the sampler. The global PRNG is left
+        untouched.
+
+    Returns
+    -------
+    float
+        Sequences reassigned per second by a single job, i.e. the sink depth
+        x passes x restarts the sampler gets through in a second.
+
+    Notes
+    -----
+    The engine is run once on a few sequences before it is timed, so that
+    the compilation of the 'numba' engine is not counted. The time includes
+    the precalculation of the source model for the sink.
+    '''
+    rng = np.random.default_rng(seed)
+    sink = np.asarray(sink, dtype=np.int64)
+    if sink.sum() > depth:
+        sink = rng.multivariate_hypergeometric(sink, depth)
+    chains = restarts if engine in LOCKSTEP_ENGINES else 1
+    cp = ConditionalProbability(alpha1, alpha2, beta, sources, dtype=dtype)
+    kwargs = {'engine': engine, 'feature_blocks': feature_blocks,
+              'seed': seed, 'sparse_model': sparse_model,
+              'accumulate_draws': True}
+    gibbs_sampler(rng.multivariate_hypergeometric(sink, min(10, sink.sum())),
+                  cp, chains, 1, 0, 1, **kwargs)
+    start = time.perf_counter()
+    gibbs_sampler(sink, cp, chains, 1, passes - 1, 1, **kwargs)
+    elapsed = time.perf_counter() - start
+    return sink.sum() * passes * chains / max(elapsed, 1e-9)
+
+
+def _makespan(costs, jobs):
+    '''Return the finishing time of tasks handed out in order to `jobs`.'''
+    finish = [0] * jobs
+    for cost in costs:
+        heapq.heapreplace(finish, finish[0] + cost)
+    return max(finish)
+
+
+def estimate_gibbs(sources, sinks=None, alpha1=.001, alpha2=.1, beta=10,
+                   restarts=10, draws_per_restart=1, burnin=100, delay=1,
+                   jobs=1, create_feature_tables=True, engine='python',
+                   feature_blocks=False, seed=None, sparse_model=False,
+                   dtype=np.float64, adaptive_burnin=False, rhat=1.1,
+                   executor='process', max_memory=None,
+                   calibration_depth=1000, calibration_passes=10):
+    '''Estimate the time, memory and output of `gibbs` without running it.
+
+    Parameters
+    ----------
+    sources, sinks, alpha1, alpha2, beta, restarts, draws_per_restart, burnin
+    delay, jobs, create_feature_tables, engine, feature_blocks, seed
+    sparse_model, dtype, adaptive_burnin, rhat, executor, max_memory
+        See `gibbs`. The arguments are validated like those of `gibbs`.
+    calibration_depth, calibration_passes : int, optional
+        The sampler is timed on the deepest sink (or source with LOO)
+        rarefied to `calibration_depth` sequences for `calibration_passes`
+        passes, see `calibrate_sampler`.
+
+    Returns
+    -------
+    GibbsEstimate
+        jobs : the number of jobs `gibbs` would run (see `jobs='auto'`).
+        tasks : the number of tasks the sinks are split into.
+        updates : the total number of sequence reassignments, i.e. the sum
+            of sink depth x passes x restarts.
+        updates_per_second : the throughput of a single job measured on this
+            machine.
+        cpu_seconds : the predicted sampling time summed over all jobs.
+        wall_seconds : the predicted sampling time of the run, with the
+            tasks handed out longest first to `jobs` jobs.
+        peak_memory : the predicted peak bytes of the run, see `_task_memory`.
+        output_bytes : the predicted bytes of the tables written by the
+            command line interface (the mixing proportions, their standard
+            deviations and, with `create_feature_tables`, one feature table
+            per sink).
+
+    Notes
+    -----
+    The predictions scale the measured throughput by the depth and passes of
+    every task, and assume the jobs run in parallel on their own CPUs. They
+    leave out the start-up of the workers and the memory of the Python
+    interpreters. With `adaptive_burnin`, `burnin` passes are assumed, so
+    the times are upper bounds. With `feature_blocks`, whose passes cost
+    less for deep sinks than their depth suggests, they are upper bounds too.
+
+    Examples
+    --------
+    >>> estimate = estimate_gibbs(source_df, sink_df, jobs='auto')
+    >>> estimate.wall_seconds, estimate.peak_memory
+    '''
+    sources, sinks = _validate_gibbs(sources, sinks, alpha1, alpha2, beta,
+                                     restarts, draws_per_restart, burnin,
+                                     delay, engine, feature_blocks,
+                                     adaptive_burnin, rhat, executor, jobs,
+                                     max_memory)
+    counts = _count_matrix(sources if sinks is None else sinks)
+    depths = np.asarray(counts.sum(1)).ravel()
+    num_sinks, num_features = counts.shape
+    num_sources = sources.shape[0] + 1
+    total_passes = burnin + (draws_per_restart - 1) * delay + 1
+    plan = _plan_run(sources, sinks, list(range(num_sinks)), restarts,
+                     total_passes, jobs, engine, seed, sparse_model, dtype,
+                     adaptive_burnin, executor, max_memory)
+
+    rate = calibrate_sampler(sources.values,
+                             _dense(counts[np.argmax(depths)]).ravel(),
+                             alpha1, alpha2, beta, restarts, engine,
+                             feature_blocks, sparse_model, dtype,
+                             calibration_depth, calibration_passes)
+    costs = [depths[plan.units[unit]].sum() * total_passes * (stop - start)
+             for unit, start, stop in plan.tasks]
+    updates = int(sum(costs))
+
+    # The running tasks take at most the budget, or the largest task alone
+    # if it does not fit.
+    running = sum(sorted(plan.memory, reverse=True)[:plan.jobs])
+    if plan.task_budget is not None:
+        running = min(running, max(plan.task_budget, max(plan.memory)))
+    # The parent holds the input tables and the accumulated results of every
+    # sink until they are collated.
+    results = num_sinks * (restarts * draws_per_restart * num_sources * 8 +
+                           num_sources * num_features * 8)
+    if scipy.sparse.issparse(counts):
+        inputs = counts.data.nbytes + counts.indices.nbytes
+    else:
+        inputs = counts.nbytes
+    peak_memory = (plan.shared_memory + plan.jobs * plan.worker_memory +
+                   running + sources.values.nbytes + inputs + results)
+
+    output_bytes = 2 * num_sinks * num_sources * _FLOAT_CELL
+    if create_feature_tables:
+        # A feature table has a count per source and feature, which is 0
+        # unless the feature is in the sink.
+        width = len(str(restarts * draws_per_restart * depths.max())) + 1
+        present = num_sources * _row_nonzeros(counts).sum()
+        output_bytes += (present * width +
+                         (num_sinks * num_sources * num_features - present) *
+                         _ZERO_CELL)
+    return GibbsEstimate(plan.jobs, len(plan.tasks), updates, rate,
+                         updates / rate, _makespan(costs, plan.jobs) / rate,
+                         int(peak_memory), int(output_bytes))
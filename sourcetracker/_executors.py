@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, Biota Technology.
+# www.biota.com
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import (Executor, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+from multiprocessing.connection import Client, Listener
+
+# The executors `gibbs` can create itself, see `get_executor`.
+EXECUTORS = ['process', 'thread', 'serial', 'socket']
+
+
+class SerialExecutor(Executor):
+    '''Executor running every task in the calling thread when submitted.
+
+    Parameters
+    ----------
+    initializer : callable, optional
+        Called with `initargs` when the executor is created.
+    initargs : tuple, optional
+
+    Notes
+    -----
+    Useful for debugging and profiling, since tasks run in the calling
+    process without any pickling.
+    '''
+
+    def __init__(self, initializer=None, initargs=()):
+        self._shutdown = False
+        if initializer is not None:
+            initializer(*initargs)
+
+    def submit(self, fn, *args, **kwargs):
+        if self._shutdown:
+            raise RuntimeError('cannot schedule new futures after shutdown')
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self._shutdown = True
+
+
+def serve_worker(address, authkey, ready=None):
+    '''Run a worker executing the tasks sent by a `SocketExecutor`.
+
+    Parameters
+    ----------
+    address : tuple
+        (host, port) to listen on. Port 0 picks a free port.
+    authkey : bytes
+        Shared secret a `SocketExecutor` must present to connect. Tasks are
+        sent as pickles, so only executors holding the key are accepted.
+    ready : multiprocessing.connection.Connection, optional
+        If given, the address listened on is sent through it once the worker
+        accepts connections.
+
+    Notes
+    -----
+    The worker serves one executor at a time and runs until it is killed.
+    Every executor connected to it gets its own fresh task loop, while any
+    state kept by the tasks (e.g. the source model of `gibbs`) lives on in
+    the worker process.
+    '''
+    with Listener(tuple(address), authkey=authkey) as listener:
+        if ready is not None:
+            ready.send(listener.address)
+            ready.close()
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, multiprocessing.AuthenticationError):
+                continue
+            with conn:
+                _serve_connection(conn)
+
+
+def _serve_connection(conn):
+    while True:
+        try:
+            fn, args, kwargs = conn.recv()
+        except (EOFError, OSError):
+            return
+        except Exception as e:
+            # The task could not be unpickled, e.g. it refers to a module that
+            # is not installed on this worker.
+            conn.send((False, e))
+            continue
+        try:
+            result = (True, fn(*args, **kwargs))
+        except Exception as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            conn.send((False, RuntimeError('The result of the task could not '
+                                           'be sent: %r' % e)))
+
+
+class SocketExecutor(Executor):
+    '''Executor running tasks on workers reached over sockets.
+
+    Parameters
+    ----------
+    addresses : list of tuple, optional
+        (host, port) of each worker, started on its machine with
+        `serve_worker` (or `sourcetracker2 worker`).
+    workers : int, optional
+        If `addresses` is not given, this many workers are started as local
+        processes. This stands in for several machines on a single one.
+    authkey : bytes, optional
+        The key the workers were started with. Required with `addresses`;
+        local workers are given a random key.
+    initializer : callable, optional
+        Run with `initargs` on every worker before its first task, like the
+        initializer of `concurrent.futures.ProcessPoolExecutor`.
+    initargs : tuple, optional
+
+    Notes
+    -----
+    Each worker runs one task at a time. Tasks are handed out in the order in
+    which they are submitted to whichever worker is free. Functions and
+    arguments are pickled, so the functions must be importable on every
+    worker.
+    '''
+
+    def __init__(self, addresses=None, workers=None, authkey=None,
+                 initializer=None, initargs=()):
+        if (addresses is None) == (workers is None):
+            raise ValueError('Either the addresses of the workers or the '
+                             'number of local workers to start must be '
+                             'given.')
+        self._processes = []
+        if addresses is None:
+            if workers < 1:
+                raise ValueError('At least one worker is required, not %d.'
+                                 % workers)
+            if authkey is None:
+                authkey = os.urandom(32)
+            addresses = [self._start_local_worker(authkey)
+                         for _ in range(workers)]
+        elif authkey is None:
+            raise ValueError('The authkey of the workers is required.')
+        self._tasks = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._initializer = initializer
+        self._initargs = initargs
+        try:
+            connections = [Client(tuple(address), authkey=authkey)
+                           for address in addresses]
+        except BaseException:
+            self._stop_local_workers()
+            raise
+        self._threads = [threading.Thread(target=self._dispatch,
+                                          args=(conn,), daemon=True)
+                         for conn in connections]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def num_workers(self):
+        return len(self._threads)
+
+    def _start_local_worker(self, authkey):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=serve_worker,
+                                          args=(('localhost', 0), authkey,
+                                                sender),
+                                          daemon=True)
+        process.start()
+        self._processes.append(process)
+        sender.close()
+        return receiver.recv()
+
+    def _stop_local_workers(self):
+        for process in self._processes:
+            process.terminate()
+            process.join()
+        self._processes = []
+
+    def _dispatch(self, conn):
+        with conn:
+            if self._initializer is not None:
+                # A failed initializer shows up as failures of the tasks.
+                try:
+                    conn.send((self._initializer, self._initargs, {}))
+                    conn.recv()
+                except BaseException:
+                    pass
+            while True:
+                item = self._tasks.get()
+                if item is None:
+                    return
+                future, fn, args, kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    conn.send((fn, args, kwargs))
+                    ok, value = conn.recv()
+                except BaseException as e:
+                    future.set_exception(e)
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after '
+                                   'shutdown')
+            future = Future()
+            self._tasks.put((future, fn, args, kwargs))
+            return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            if cancel_futures:
+                pending = []
+                while True:
+                    try:
+                        pending.append(self._tasks.get_nowait())
+                    except queue.Empty:
+                        break
+                for future, fn, args, kwargs in pending:
+                    future.cancel()
+            for _ in self._threads:
+                self._tasks.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+            self._stop_local_workers()
+
+
+def get_executor(executor, jobs, initializer=None, initargs=()):
+    '''Return the executor to run the tasks of `gibbs` on.
+
+    Parameters
+    ----------
+    executor : str or Executor
+        One of `EXECUTORS`, or any object with a `concurrent.futures`
+        `submit` method.
+    jobs : int
+        The number of workers of an executor created here.
+    initializer : callable, optional
+        Run with `initargs` by every worker of an executor created here
+        before its first task.
+    initargs : tuple, optional
+
+    Returns
+    -------
+    executor : Executor
+    owned : bool
+        `True` if the executor was created here and must be shut down by the
+        caller.
+
+    Raises
+    ------
+    ValueError
+        If `executor` is neither a known name nor has a `submit` method.
+    '''
+    validate_executor(executor)
+    kwargs = {'initializer': initializer, 'initargs': initargs}
+    if executor == 'process':
+        return ProcessPoolExecutor(jobs, **kwargs), True
+    if executor == 'thread':
+        return ThreadPoolExecutor(jobs, **kwargs), True
+    if executor == 'serial':
+        return SerialExecutor(**kwargs), True
+    if executor == 'socket':
+        return SocketExecutor(workers=jobs, **kwargs), True
+    return executor, False
+
+
+def validate_executor(executor):
+    '''Raise a ValueError if `get_executor` would not accept `executor`.'''
+    if isinstance(executor, str):
+        if executor not in EXECUTORS:
+            raise ValueError('Unknown executor %r. Available executors are: '
+                             '%s.' % (executor, ', '.join(EXECUTORS)))
+    elif not callable(getattr(executor, 'submit', None)):
+        raise ValueError('The executor must be one of %s or have a `submit` '
+                         'method like a `concurrent.futures.Executor`, not '
+                         '%r.' % (', '.join(EXECUTORS), executor))
@@ -10,21 +10,27 @@
 
 from __future__ import division
 
+import numpy as np
 import pandas as pd
 from biom import Table
 from sourcetracker._sourcetracker import (intersect_and_sort_samples,
                                           get_samples, collapse_source_data,
                                           subsample_dataframe,
-                                          validate_gibbs_input)
+                                          validate_gibbs_input, spawn_seeds)
 from sourcetracker._sourcetracker import gibbs as _gibbs
-from sourcetracker._util import biom_to_df
+from sourcetracker._sourcetracker import gibbs_replicates
+from sourcetracker._sourcetracker import prune_features as _prune_features
+from sourcetracker._util import biom_to_df, SparseFeatureTable
 # import default values
 from sourcetracker._gibbs_defaults import (DEFAULT_ALPH1, DEFAULT_ALPH2,
                                            DEFAULT_TEN, DEFAULT_ONE,
                                            DEFAULT_HUND, DEFAULT_THOUS,
                                            DEFAULT_FLS, DEFAULT_SNK,
                                            DEFAULT_SRS, DEFAULT_SRS2,
-                                           DEFAULT_CAT, DEFAULT_TRU)
+                                           DEFAULT_CAT, DEFAULT_TRU,
+                                           DEFAULT_ENG, DEFAULT_SEED,
+                                           DEFAULT_DTYPE, DEFAULT_RHAT,
+                                           DEFAULT_ZERO)
 
 
 def gibbs(feature_table: Table,
@@ -45,10 +51,21 @@ def gibbs(feature_table: Table,
           source_sink_column: str = DEFAULT_SNK,
           source_column_value: str = DEFAULT_SRS,
           sink_column_value: str = DEFAULT_SRS2,
-          source_category_column: str = DEFAULT_CAT)\
+          source_category_column: str = DEFAULT_CAT,
+          engine: str = DEFAULT_ENG,
+          feature_blocks: bool = DEFAULT_FLS,
+          seed: int = DEFAULT_SEED,
+          sparse_model: bool = DEFAULT_FLS,
+          dtype: str = DEFAULT_DTYPE,
+          adaptive_burnin: bool = DEFAULT_FLS,
+          rhat: float = DEFAULT_RHAT,
+          rarefaction_replicates: int = DEFAULT_ONE,
+          prune_features: bool = DEFAULT_FLS,
+          min_feature_prevalence: float = DEFAULT_ZERO,
+          min_feature_abundance: float = DEFAULT_ZERO)\
               -> (pd.DataFrame, pd.DataFrame, Table, pd.DataFrame):
     # convert tables
-    feature_table = biom_to_df(feature_table)
+    feature_table = biom_to_df(feature_table, sparse=True)
     sample_metadata = sample_metadata.to_dataframe()
     # run the gibbs sampler helper function (same used for q2)
     results = gibbs_helper(feature_table, sample_metadata, loo, jobs,
@@ -57,10 +74,18 @@ def gibbs(feature_table: Table,
                            burnin, delay, per_sink_feature_assignments,
                            sample_with_replacement, source_sink_column,
                            source_column_value, sink_column_value,
-                           source_category_column)
+                           source_category_column, engine, feature_blocks,
+                           seed, sparse_model, dtype, adaptive_burnin, rhat,
+                           rarefaction_replicates, prune_features,
+                           min_feature_prevalence, min_feature_abundance)
+    # report the pruned features (shown by QIIME 2 with --verbose)
+    if prune_features:
+        pruned = results[-1]
+        print('Pruned %d features: %s' % (len(pruned),
+                                          ', '.join(map(str, pruned.index))))
     # get the results (with fas)
     # here we only return the three df (via q2)
-    mpm, mps, fas = results
+    mpm, mps, fas = results[:3]
     # make list filter
 
     def filter_list(inds, factor): return [ind for ind in list(inds)
@@ -110,14 +135,143 @@ def gibbs_helper(feature_table: Table,
                  source_sink_column: str,
                  source_column_value: str,
                  sink_column_value: str,
-                 source_category_column: str) -> (pd.DataFrame,
-                                                  pd.DataFrame,
-                                                  list):
+                 source_category_column: str,
+                 engine: str = DEFAULT_ENG,
+                 feature_blocks: bool = DEFAULT_FLS,
+                 seed: int = DEFAULT_SEED,
+                 sparse_model: bool = DEFAULT_FLS,
+                 dtype: str = DEFAULT_DTYPE,
+                 adaptive_burnin: bool = DEFAULT_FLS,
+                 rhat: float = DEFAULT_RHAT,
+                 rarefaction_replicates: int = DEFAULT_ONE,
+                 prune_features: bool = DEFAULT_FLS,
+                 min_feature_prevalence: float = DEFAULT_ZERO,
+                 min_feature_abundance: float = DEFAULT_ZERO) -> (
+                     pd.DataFrame, pd.DataFrame, list):
     '''Gibb's sampler for Bayesian estimation of microbial sample sources.
 
     This function is a helper that applies to both the click and QIIME2
-    command line functionality.
+    command line functionality. If `adaptive_burnin` is `True` the number of
+    passes made for each sink is appended to the returned tuple. With more
+    than one `rarefaction_replicates`, the sources and sinks are rarefied
+    that many times and the draws of all replicates are pooled (see
+    `gibbs_replicates`). With `prune_features`, the features absent from
+    (or, given the thresholds, rare in) the prepared sources and sinks are
+    dropped before sampling (see `prune_features`), and have counts of 0 in
+    the feature tables. The report of the pruned features (a dataframe of
+    their prevalence and abundance) is then appended to the returned tuple,
+    after the number of passes.
     '''
+    if rarefaction_replicates < 1:
+        raise ValueError('`rarefaction_replicates` must be a positive '
+                         'integer, not %r.' % (rarefaction_replicates,))
+    if not prune_features and (min_feature_prevalence or
+                               min_feature_abundance):
+        raise ValueError('`min_feature_prevalence` and '
+                         '`min_feature_abundance` require '
+                         '`prune_features`.')
+    replicates = prepare_gibbs_replicates(feature_table, sample_metadata, loo,
+                                          source_rarefaction_depth,
+                                          sink_rarefaction_depth,
+                                          sample_with_replacement,
+                                          source_sink_column,
+                                          source_column_value,
+                                          sink_column_value,
+                                          source_category_column, seed=seed,
+                                          jobs=jobs,
+                                          replicates=rarefaction_replicates)
+    features = replicates[0][0].columns
+    if prune_features:
+        replicates, pruned = _prune_features(replicates,
+                                             min_feature_prevalence,
+                                             min_feature_abundance)
+
+    # Run the computations.
+    kwargs = {'create_feature_tables': per_sink_feature_assignments,
+              'engine': engine, 'feature_blocks': feature_blocks,
+              'seed': seed, 'sparse_model': sparse_model, 'dtype': dtype,
+              'adaptive_burnin': adaptive_burnin, 'rhat': rhat}
+    if rarefaction_replicates == 1:
+        csources, sinks = replicates[0]
+        results = _gibbs(csources, sinks, alpha1, alpha2, beta, restarts,
+                         draws_per_restart, burnin, delay, jobs, **kwargs)
+    else:
+        results = gibbs_replicates(replicates, alpha1, alpha2, beta,
+                                   restarts, draws_per_restart, burnin, delay,
+                                   jobs, **kwargs)
+    mpm, mps, fas = results[:3]
+    passes = results[3:]
+    if prune_features:
+        # map the feature tables back onto all features
+        if fas is not None:
+            fas = [ft.reindex(columns=features, fill_value=0) for ft in fas]
+        passes += (pruned,)
+    # number of returns chnages based on flag
+    # this was refactored for QIIME2
+    # transpose to follow convention
+    # rows are features (i.e. taxa)
+    # columns are samples
+    if per_sink_feature_assignments:
+        return (mpm.T, mps.T, fas) + passes
+    else:
+        return (mpm.T, mps.T) + passes
+
+
+def prepare_gibbs_input(feature_table: pd.DataFrame,
+                        sample_metadata: pd.DataFrame,
+                        loo: bool,
+                        source_rarefaction_depth: int,
+                        sink_rarefaction_depth: int,
+                        sample_with_replacement: bool,
+                        source_sink_column: str,
+                        source_column_value: str,
+                        sink_column_value: str,
+                        source_category_column: str,
+                        seed: int = DEFAULT_SEED,
+                        jobs: int = DEFAULT_ONE) -> (pd.DataFrame,
+                                                     pd.DataFrame):
+    '''Prepare the collapsed sources and the sinks for the Gibb's sampler.
+
+    See `prepare_gibbs_replicates`, of which this is the single replicate.
+    '''
+    return prepare_gibbs_replicates(feature_table, sample_metadata, loo,
+                                    source_rarefaction_depth,
+                                    sink_rarefaction_depth,
+                                    sample_with_replacement,
+                                    source_sink_column, source_column_value,
+                                    sink_column_value, source_category_column,
+                                    seed=seed, jobs=jobs)[0]
+
+
+def prepare_gibbs_replicates(feature_table: pd.DataFrame,
+                             sample_metadata: pd.DataFrame,
+                             loo: bool,
+                             source_rarefaction_depth: int,
+                             sink_rarefaction_depth: int,
+                             sample_with_replacement: bool,
+                             source_sink_column: str,
+                             source_column_value: str,
+                             sink_column_value: str,
+                             source_category_column: str,
+                             seed: int = DEFAULT_SEED,
+                             jobs: int = DEFAULT_ONE,
+                             replicates: int = DEFAULT_ONE) -> list:
+    '''Prepare rarefied replicates of the sources and sinks.
+
+    The table is validated, and the sources collapsed, once. Each of the
+    `replicates` is then a (sources, sinks) tuple rarefied from it with
+    draws of its own, for `gibbs_replicates`.
+
+    The sinks are `None` if `loo` is `True`. See `gibbs_helper`. If
+    `feature_table` is a `SparseFeatureTable` it is never densified: the
+    sinks are returned as a `SparseFeatureTable` and only the collapsed
+    sources are dense.
+
+    With a `seed`, or more than one job, the sources and sinks are rarefied
+    by `rarefy` in parallel blocks, each from a stream of its own that is
+    apart from those of the sampler.
+    '''
+    seeds = _rarefaction_seeds(seed, replicates)
 
     # Do high level check on feature data.
     feature_table = validate_gibbs_input(feature_table)
@@ -160,14 +314,21 @@ def gibbs_helper(feature_table: Table,
                               'shallowest of these is %s sequences.') %
                              (source_rarefaction_depth, count_too_shallow,
                               shallowest))
-        else:
-            csources = subsample_dataframe(csources, source_rarefaction_depth,
-                                           replace=sample_with_replacement)
+        source_tables = [
+            subsample_dataframe(csources, source_rarefaction_depth,
+                                replace=sample_with_replacement,
+                                seed=source_seed, jobs=jobs)
+            for source_seed, sink_seed in seeds]
+    else:
+        source_tables = [csources] * replicates
 
     # Prepare to rarify sink data if we are not doing LOO. If we are doing loo,
     # we skip the rarefaction, and set sinks to `None`.
     if not loo:
-        sinks = feature_table.loc[sink_samples, :]
+        if isinstance(feature_table, SparseFeatureTable):
+            sinks = feature_table.select(sink_samples)
+        else:
+            sinks = feature_table.loc[sink_samples, :]
         if sink_rarefaction_depth > 0:
             d = (sinks.sum(1) >= sink_rarefaction_depth)
             if not d.all():
@@ -179,22 +340,30 @@ def gibbs_helper(feature_table: Table,
                                   'shallowest of these is %s sequences.') %
                                  (sink_rarefaction_depth, count_too_shallow,
                                   shallowest))
-            else:
-                sinks = subsample_dataframe(sinks, sink_rarefaction_depth,
-                                            replace=sample_with_replacement)
+            sink_tables = [
+                subsample_dataframe(sinks, sink_rarefaction_depth,
+                                    replace=sample_with_replacement,
+                                    seed=sink_seed, jobs=jobs)
+                for source_seed, sink_seed in seeds]
+        else:
+            sink_tables = [sinks] * replicates
     else:
-        sinks = None
+        sink_tables = [None] * replicates
+    return list(zip(source_tables, sink_tables))
 
-    # Run the computations.
-    mpm, mps, fas = _gibbs(csources, sinks, alpha1, alpha2, beta, restarts,
-                           draws_per_restart, burnin, delay, jobs,
-                           create_feature_tables=per_sink_feature_assignments)
-    # number of returns chnages based on flag
-    # this was refactored for QIIME2
-    # transpose to follow convention
-    # rows are features (i.e. taxa)
-    # columns are samples
-    if per_sink_feature_assignments:
-        return mpm.T, mps.T, fas
-    else:
-        return mpm.T, mps.T
+
+# Entropy mixed into the seed of the rarefaction, so that its streams differ
+# from those `spawn_seeds` derives from the seed for the sinks of `gibbs`.
+_RAREFACTION_STREAM = 0x72617265
+
+
+def _rarefaction_seeds(seed, replicates=1):
+    '''Return the seeds of the source and sink rarefaction of each replicate.
+    '''
+    if seed is None:
+        return [(None, None)] * replicates
+    seeds = spawn_seeds(np.random.SeedSequence([seed, _RAREFACTION_STREAM]),
+                        2)
+    if replicates == 1:
+        return [seeds]
+    return list(zip(*[spawn_seeds(s, replicates) for s in seeds]))
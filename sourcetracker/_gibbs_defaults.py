@@ -12,6 +12,18 @@ DEFAULT_SNK = 'SourceSink'
 DEFAULT_SRS = 'source'
 DEFAULT_SRS2 = 'sink'
 DEFAULT_CAT = 'Env'
+DEFAULT_ENG = 'python'
+DEFAULT_SEED = None
+DEFAULT_DTYPE = 'float64'
+DTYPES = ['float64', 'float32']
+DEFAULT_RHAT = 1.1
+DEFAULT_CKPT = None
+DEFAULT_EXE = 'process'
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 6000
+DEFAULT_MEM = None
+DEFAULT_ZERO = 0
+ENGINES = ['python', 'numba', 'vectorized']
 
 DESC_TBL = 'Path to input table.'
 DESC_MAP = 'Path to sample metadata mapping file.'
@@ -19,7 +31,8 @@ DESC_OUT = 'Path to the output directory to be created.'
 DESC_LOO = ('Classify each sample in `sources` using a leave-one-out '
             'strategy. Replicates -s option in Knights et al. '
             'sourcetracker.')
-DESC_JBS = 'Number of processes to launch.'
+DESC_JBS = ('Number of processes to launch, or `auto` for one per available '
+            'CPU but no more than the sinks need or fit in `--max_memory`.')
 DESC_ALPH1 = ('Prior counts of each feature in the training '
               'environments. Higher values decrease the trust in the '
               'training environments, and make the source environment '
@@ -64,6 +77,23 @@ DESC_PFA = ('If True, this option will cause SourceTracker2 to write '
             ' this is non-optional and always set to true.')
 DESC_RPL = ('Sample with replacement instead of '
             'sample without replacement')
+DESC_RREP = ('Number of times the sources and sinks are rarefied. The '
+             'sinks of every replicate are sampled in the same pool of jobs '
+             'and the draws of all replicates are pooled into the mixing '
+             'proportions, their standard deviations and the feature '
+             'tables, which reduces the bias a single rarefaction puts on '
+             'shallow sinks.')
+DESC_PRN = ('Drop the features that have no counts in any collapsed and '
+            'rarefied source or sink before sampling. They only enlarge the '
+            'source model and the feature tables, but they count towards '
+            'the priors of the model, so the results differ slightly from '
+            'those of the full table. The pruned features are listed in '
+            'pruned_features.txt and have counts of 0 in the feature tables.')
+DESC_PRV = ('With `--prune_features`, also drop the features present in '
+            'less than this fraction of the sources and sinks.')
+DESC_ABD = ('With `--prune_features`, also drop the features with fewer '
+            'counts than this over all sources and sinks (averaged over '
+            'the rarefaction replicates).')
 DESC_SNK = ('Sample metadata column indicating which samples should be'
             ' treated as sources and which as sinks.')
 DESC_SRS = ('Value in source_sink_column indicating which samples '
@@ -72,6 +102,65 @@ DESC_SRS2 = ('Value in source_sink_column indicating which samples '
              'should be treated as sinks.')
 DESC_CAT = ('Sample metadata column indicating the type of each '
             'source sample.')
+DESC_ENG = ('Implementation of the innermost loop of the Gibbs sampler. '
+            '`python` is the reference implementation. `numba` runs the '
+            'loop as compiled code and requires the optional numba '
+            'package. Both give identical results for the same random '
+            'state. `vectorized` advances all restarts of a sink in '
+            'lockstep with array operations, which is faster when there '
+            'are many restarts.')
+DESC_FBL = ('Reassign all sequences of a feature together with a single '
+            'multinomial draw instead of one sequence at a time. The cost '
+            'of a pass then scales with the number of distinct features in '
+            'a sink rather than its depth. This is an approximation of the '
+            'standard sampler and requires the `python` engine.')
+DESC_SEED = ('Seed for the random number generator. If given, each sink '
+             '(or source if `--loo` is passed) and each restart draws from '
+             'its own stream derived from the seed, so results are '
+             'reproducible regardless of the number of jobs and identical '
+             'across engines. The sources and sinks are then rarefied from '
+             'streams derived from the seed as well.')
+DESC_SPM = ('Precalculate the source model for each sink only over the '
+            'features present in that sink rather than over all features. '
+            'This saves time and memory on wide, sparse tables and gives '
+            'identical results.')
+DESC_DTYPE = ('Floating point precision of the source model. `float32` '
+              'halves the memory used by the model in every job; the '
+              'probabilities differ from `float64` by a relative error of '
+              'about 1e-7.')
+DESC_ABN = ('Treat `burnin` as an upper bound. The restarts of each sink '
+            'are grown together and burn-in stops as soon as the '
+            'Gelman-Rubin R-hat between them is below `rhat` for every '
+            'source. The number of passes made for each sink is reported. '
+            'Requires at least 2 restarts.')
+DESC_RHAT = ('Convergence threshold (greater than 1) of adaptive burn-in.')
+DESC_EXE = ('What runs the sampling tasks: a pool of `--jobs` processes, a '
+            'pool of `--jobs` threads, every task in turn in this process '
+            '(serial), or workers reached over sockets. Threads share one '
+            'copy of the source model and run in parallel with `--engine '
+            'numba`. With `socket`, the workers given by `--worker` are '
+            'used, or `--jobs` local workers are started if there are none.')
+DESC_WRK = ('host:port of a worker started with `sourcetracker2 worker`. '
+            'Repeat for every worker. Requires `--executor socket`.')
+DESC_AUTH = ('Shared key of the socket workers. Tasks are exchanged as '
+             'pickles, so use a secret key and only trusted networks. Can '
+             'also be set with the SOURCETRACKER_AUTHKEY environment '
+             'variable.')
+DESC_HOST = 'Interface the worker listens on.'
+DESC_PORT = 'Port the worker listens on.'
+DESC_DRY = ('Do not sample. Load and prepare the inputs, time the sampler '
+            'briefly on this machine and report the predicted run time, '
+            'peak memory and output size of the run with the given '
+            'options. The output directory is not created.')
+DESC_MEM = ('Memory budget of the run, e.g. 512M or 16G. Sampling tasks are '
+            'only started while their estimated memory, together with the '
+            'source models of the jobs, fits in the budget. The estimates '
+            'are approximate, so leave some headroom.')
+DESC_CKPT = ('Directory in which the result of every sink is saved as soon as '
+             'it is done. Rerunning with the same inputs, parameters and '
+             '`--seed` skips the sinks that were saved; a checkpoint of a run '
+             'with different inputs or parameters is refused. Requires '
+             '`--seed` unless the rarefaction depths are 0.')
 OUT_MEAN = ('The mixing_proporitions output is a table with sinks'
             ' as rows and sources as columns. The values in the '
             'table are the mean fractional contributions of each '
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, Biota Technology.
+# www.biota.com
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import division
+
+try:
+    import numba
+except ImportError:  # pragma: no cover
+    numba = None
+
+
+def _gibbs_pass(order, seq_env_assignments, taxon_sequence, envcounts,
+                unknown_vector, unknown_sum, uniforms, known_source_cp, beta,
+                alpha2_n, alpha2_n_tau, denominator_p_v, joint_probability):
+    '''Withdraw and reassign every sequence in the sink once.
+
+    Parameters
+    ----------
+    order : np.array
+        1D array of ints. The order in which sequences are visited.
+    seq_env_assignments : np.array
+        1D array of ints. The current environment of each sequence. Updated
+        in place.
+    taxon_sequence : np.array
+        1D array of ints. The feature index of each sequence.
+    envcounts : np.array
+        1D array of ints. Count of sequences assigned to each environment.
+        Updated in place.
+    unknown_vector : np.array
+        1D array of ints. Count of each feature currently assigned to the
+        'unknown' environment. Updated in place.
+    unknown_sum : int
+        Sum of `unknown_vector`.
+    uniforms : np.array
+        1D array of floats in [0, 1). The ith entry is used to draw the new
+        environment of the ith sequence visited.
+    known_source_cp, beta, alpha2_n, alpha2_n_tau, denominator_p_v
+        Precomputed quantities of a `ConditionalProbability` instance.
+    joint_probability : np.array
+        1D float buffer of length V used to hold the cumulative joint
+        probability. Its dtype (float32 or float64) sets the precision of
+        the cumulative sum.
+
+    Returns
+    -------
+    unknown_sum : int
+        The updated sum of `unknown_vector`.
+
+    Notes
+    -----
+    This is a line-for-line translation of the innermost loop of
+    `gibbs_sampler` which is compiled with numba when it is available. The
+    compiled function releases the GIL, so threads sampling different sinks
+    (or restarts) run it in parallel. The
+    floating point operations are carried out in the same order as in
+    `ConditionalProbability.calculate_cp_slice`, followed by `np.cumsum` and
+    `np.searchsorted`, so given the same uniforms both paths make identical
+    reassignments.
+    '''
+    num_sources = envcounts.shape[0]
+    unknown_idx = num_sources - 1
+    for i in range(order.shape[0]):
+        seq_index = order[i]
+        e = seq_env_assignments[seq_index]
+        t = taxon_sequence[seq_index]
+
+        envcounts[e] -= 1
+        if e == unknown_idx:
+            unknown_vector[t] -= 1
+            unknown_sum -= 1
+
+        # Calculation of the joint probability and its cumulative sum. Each
+        # term is stored before it is accumulated so that the sum is carried
+        # out in the precision of `joint_probability`, as `np.cumsum` does.
+        for v in range(unknown_idx):
+            joint_probability[v] = known_source_cp[v, t] * (envcounts[v] +
+                                                            beta)
+        joint_probability[unknown_idx] = \
+            ((unknown_vector[t] + alpha2_n) *
+             (envcounts[unknown_idx] + beta)) / \
+            ((unknown_sum + alpha2_n_tau) * denominator_p_v)
+        for v in range(1, num_sources):
+            joint_probability[v] += joint_probability[v - 1]
+        total = joint_probability[unknown_idx]
+
+        # Equivalent to `np.searchsorted(cs, x)` with the default 'left' side,
+        # i.e. the first index whose cumulative probability is >= x.
+        x = total * uniforms[i]
+        lo = 0
+        hi = unknown_idx
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if joint_probability[mid] < x:
+                lo = mid + 1
+            else:
+                hi = mid
+        new_e_idx = lo
+
+        seq_env_assignments[seq_index] = new_e_idx
+        envcounts[new_e_idx] += 1
+        if new_e_idx == unknown_idx:
+            unknown_vector[t] += 1
+            unknown_sum += 1
+    return unknown_sum
+
+
+if numba is not None:
+    gibbs_pass = numba.njit(_gibbs_pass, nogil=True)
+else:  # pragma: no cover
+    gibbs_pass = None
@@ -34,7 +34,11 @@ from sourcetracker._gibbs_defaults import (DESC_TBL, DESC_MAP, DESC_FMAP,
                                            DESC_RPL, DESC_SNK, DESC_SRS,
                                            DESC_SRS2, DESC_CAT, OUT_MEAN,
                                            OUT_STD, OUT_PFA, DESC_PVAL,
-                                           OUT_PFAM)
+                                           OUT_PFAM, DESC_ENG, ENGINES,
+                                           DESC_FBL, DESC_SEED, DESC_SPM,
+                                           DESC_DTYPE, DTYPES, DESC_ABN,
+                                           DESC_RHAT, DESC_RREP, DESC_PRN,
+                                           DESC_PRV, DESC_ABD)
 
 PARAMETERS = {'sample_metadata': Metadata,
               'loo': Bool,
@@ -53,7 +57,18 @@ PARAMETERS = {'sample_metadata': Metadata,
               'source_sink_column': Str,
               'source_column_value': Str,
               'sink_column_value': Str,
-              'source_category_column': Str}
+              'source_category_column': Str,
+              'engine': Str % Choices(ENGINES),
+              'feature_blocks': Bool,
+              'seed': Int,
+              'sparse_model': Bool,
+              'dtype': Str % Choices(DTYPES),
+              'adaptive_burnin': Bool,
+              'rhat': Float,
+              'rarefaction_replicates': Int,
+              'prune_features': Bool,
+              'min_feature_prevalence': Float,
+              'min_feature_abundance': Float}
 PARAMETERDESC = {'sample_metadata': DESC_MAP,
                  'loo': DESC_LOO,
                  'jobs': DESC_JBS,
@@ -73,7 +88,18 @@ PARAMETERDESC = {'sample_metadata': DESC_MAP,
                  'source_sink_column': DESC_SNK,
                  'source_column_value': DESC_SRS,
                  'sink_column_value': DESC_SRS2,
-                 'source_category_column': DESC_CAT}
+                 'source_category_column': DESC_CAT,
+                 'engine': DESC_ENG,
+                 'feature_blocks': DESC_FBL,
+                 'seed': DESC_SEED,
+                 'sparse_model': DESC_SPM,
+                 'dtype': DESC_DTYPE,
+                 'adaptive_burnin': DESC_ABN,
+                 'rhat': DESC_RHAT,
+                 'rarefaction_replicates': DESC_RREP,
+                 'prune_features': DESC_PRN,
+                 'min_feature_prevalence': DESC_PRV,
+                 'min_feature_abundance': DESC_ABD}
 
 citations = qiime2.plugin.Citations.load(
     '_q2/citations.bib', package='sourcetracker')
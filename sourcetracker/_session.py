@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, Biota Technology.
+# www.biota.com
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from concurrent.futures import wait
+
+import numpy as np
+
+from sourcetracker._executors import get_executor
+from sourcetracker._sourcetracker import (ConditionalProbability,
+                                          _validate_gibbs, _validate_counts,
+                                          _validate_columns, _publish_model,
+                                          _load_model, _run_sinks,
+                                          _sink_result, _collate_sinks,
+                                          _model_memory, _resolve_jobs,
+                                          parse_memory)
+
+
+class SourceTrackerSession(object):
+    '''Sample sink batches against fixed sources with a warm worker pool.
+
+    Parameters
+    ----------
+    sources : DataFrame
+        A dataframe containing source data (rows are sources, columns are
+        features), see `gibbs`.
+    alpha1, alpha2, beta, restarts, draws_per_restart, burnin, delay, jobs
+    engine, feature_blocks, sparse_model, dtype, adaptive_burnin, rhat
+    executor, max_memory
+        See `gibbs`. They apply to every call of `predict`. With
+        `jobs='auto'`, the workers started are as many as there are CPUs or
+        as fit in `max_memory` with their models, and the tasks of each call
+        are then admitted within `max_memory` like those of `gibbs`.
+
+    Notes
+    -----
+    The sources and parameters are validated, and the source model is built
+    and published to the workers (see `_publish_model`), once when the
+    session is created. The workers are started right away and each loads
+    the model, so a call of `predict` only sends the sinks and collects
+    their results. Given the same `seed`, `predict` returns the same results
+    as `gibbs` called with the sources and sinks.
+
+    A session holds its workers and the shared copy of the model until it is
+    closed, either with `close` or by using it as a context manager. An
+    executor object passed as `executor` is left running.
+
+    Examples
+    --------
+    >>> with SourceTrackerSession(source_df, jobs=4) as session:
+    ...     for sink_df in batches:
+    ...         mpm, mps, fas = session.predict(sink_df, seed=0)
+    '''
+
+    def __init__(self, sources, alpha1=.001, alpha2=.1, beta=10, restarts=10,
+                 draws_per_restart=1, burnin=100, delay=1, jobs=1,
+                 engine='python', feature_blocks=False, sparse_model=False,
+                 dtype=np.float64, adaptive_burnin=False, rhat=1.1,
+                 executor='process', max_memory=None):
+        self.sources, _ = _validate_gibbs(sources, None, alpha1, alpha2, beta,
+                                          restarts, draws_per_restart,
+                                          burnin, delay, engine,
+                                          feature_blocks, adaptive_burnin,
+                                          rhat, executor, jobs, max_memory)
+        self.parameters = {'alpha1': alpha1, 'alpha2': alpha2, 'beta': beta,
+                           'restarts': restarts,
+                           'draws_per_restart': draws_per_restart,
+                           'burnin': burnin, 'delay': delay, 'jobs': jobs,
+                           'engine': engine, 'feature_blocks': feature_blocks,
+                           'sparse_model': sparse_model, 'dtype': dtype,
+                           'adaptive_burnin': adaptive_burnin, 'rhat': rhat,
+                           'max_memory': max_memory}
+        # The sinks are not known yet, so the workers are sized by the
+        # models they hold alone.
+        num_workers = _resolve_jobs(
+            jobs, executor, np.inf,
+            _model_memory(self.sources.shape[0] + 1, self.sources.shape[1],
+                          np.dtype(dtype).itemsize), 0,
+            parse_memory(max_memory))
+        cp = ConditionalProbability(alpha1, alpha2, beta, self.sources.values,
+                                    dtype=dtype)
+        self._model, self._close_model = _publish_model(
+            cp, executor, share_known_p_tv=not sparse_model)
+        try:
+            self._executor, self._owned = get_executor(
+                executor, num_workers, initializer=_load_model,
+                initargs=(self._model,))
+            # Start every worker now rather than on the first request.
+            wait([self._executor.submit(_load_model, self._model)
+                  for _ in range(num_workers)])
+        except BaseException:
+            self._close_model()
+            raise
+        self.closed = False
+
+    def _sample(self, sinks, seed):
+        if self.closed:
+            raise ValueError('The session is closed.')
+        _validate_counts(sinks)
+        _validate_columns(self.sources, sinks)
+        sinks = sinks.astype(np.int32, copy=False)
+        p = self.parameters
+        results = _run_sinks(self.sources, sinks, range(sinks.shape[0]),
+                             p['alpha1'], p['alpha2'], p['beta'],
+                             p['restarts'], p['draws_per_restart'],
+                             p['burnin'], p['delay'], p['jobs'], p['engine'],
+                             p['feature_blocks'], seed, p['sparse_model'],
+                             p['dtype'], p['adaptive_burnin'], p['rhat'],
+                             None, self._executor, p['max_memory'],
+                             model=self._model)
+        return sinks, results
+
+    def predict(self, sinks, seed=None, create_feature_tables=True):
+        '''Estimate the mixing proportions of `sinks`.
+
+        Parameters
+        ----------
+        sinks : DataFrame
+            A dataframe containing sink data (rows are sinks, columns are
+            features, which must be those of the sources of the session).
+        seed : int, np.random.SeedSequence, np.random.Generator or None
+            See `gibbs`.
+        create_feature_tables : boolean
+            See `gibbs`.
+
+        Returns
+        -------
+        tuple
+            See `gibbs`.
+        '''
+        sinks, results = self._sample(sinks, seed)
+        return _collate_sinks(results, self.sources, sinks,
+                              create_feature_tables,
+                              self.parameters['adaptive_burnin'])
+
+    def iter_predict(self, sinks, seed=None, create_feature_tables=True):
+        '''Yield the results of each of `sinks` as soon as it is done.
+
+        Parameters
+        ----------
+        sinks, seed, create_feature_tables
+            See `predict`.
+
+        Returns
+        -------
+        generator
+            Yields a `SinkResult` for every sink, see `iter_gibbs`.
+        '''
+        sinks, results = self._sample(sinks, seed)
+        return (_sink_result(i, result, self.sources, sinks,
+                             create_feature_tables) for i, result in results)
+
+    def close(self):
+        '''Stop the workers started by the session and release the model.'''
+        if self.closed:
+            return
+        self.closed = True
+        if self._owned:
+            self._executor.shutdown()
+        self._close_model()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -12,10 +12,28 @@ from __future__ import division
 import numpy as np
 import pandas as pd
 
+import os
+import pickle
+import re
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from copy import copy
 from functools import partial
-from multiprocessing import Pool
+from itertools import chain
+from multiprocessing import shared_memory
+import scipy.sparse
 from skbio.stats import subsample_counts
 
+from sourcetracker._kernels import gibbs_pass as _compiled_gibbs_pass
+from sourcetracker._util import SparseFeatureTable
+from sourcetracker._executors import (SerialExecutor, get_executor,
+                                      validate_executor)
+from sourcetracker._checkpoint import (create_manifest, open_checkpoint,
+                                       load_sinks, save_sink)
+
 
 def validate_gibbs_input(sources, sinks=None):
     '''Validate `gibbs` inputs and coerce/round to type `np.int32`.
@@ -23,20 +41,21 @@ def validate_gibbs_input(sources, sinks=None):
     Summary
     -------
     Checks if data contains `nan` or `null` values, and returns data as
-    type `np.int32`. If both `sources` and `sinks` are passed, columns must
-    match exactly (including order).
+    type `np.int32`. Fractional counts are truncated. If both `sources` and
+    `sinks` are passed, columns must match exactly (including order).
 
     Parameters
     ----------
-    sources : pd.DataFrame
+    sources : pd.DataFrame or SparseFeatureTable
         A dataframe containing count data. Must be castable to `np.int32`.
-    sinks : optional, pd.DataFrame or None
+    sinks : optional, pd.DataFrame, SparseFeatureTable or None
         If not `None` a dataframe containing count data that is castable to
         `np.int32`.
 
     Returns
     -------
-    pd.Dataframe(s)
+    pd.Dataframe(s) or SparseFeatureTable(s)
+        Sparse tables are validated and cast without densifying them.
 
     Raises
     ------
@@ -44,6 +63,8 @@ def validate_gibbs_input(sources, sinks=None):
         If `nan` or `null` values found in inputs.
     ValueError
         If any values are smaller than 0.
+    ValueError
+        If any values are infinite or too large for `np.int32`.
     ValueError
         If any columns of an input dataframe are non-numeric.
     ValueError
@@ -55,32 +76,89 @@ def validate_gibbs_input(sources, sinks=None):
         dfs = [sources]
 
     for df in dfs:
-        # Because of this bug (https://github.com/numpy/numpy/issues/6114)
-        # we can't use e.g. np.isreal(df.dtypes).all(). Instead we use
-        # applymap. Based on:
-        # http://stackoverflow.com/questions/21771133/finding-non-numeric-rows-in-dataframe-in-pandas
-        if not df.applymap(np.isreal).values.all():
-            raise ValueError('A dataframe contains one or more values which '
-                             'are not numeric. Data must be exclusively '
-                             'positive integers.')
-        if np.isnan(df.values).any():
-            raise ValueError('A dataframe has `nan` or `null` values. Data '
-                             'must be exclusively positive integers.')
-        if (df.values < 0).any():
-            raise ValueError('A dataframe has a negative count. Data '
-                             'must be exclusively positive integers.')
+        _validate_counts(df)
 
     if sinks is not None:
-        if not (sinks.columns == sources.columns).all():
-            raise ValueError('Dataframes do not contain identical (and '
-                             'identically ordered) columns. Columns must '
-                             'match exactly.')
+        _validate_columns(sources, sinks)
         return (sources.astype(np.int32, copy=False),
                 sinks.astype(np.int32, copy=False))
     else:
         return sources.astype(np.int32, copy=False)
 
 
+# Number of values `_validate_counts` scans at a time, small enough for a
+# chunk to stay in the CPU cache between its reductions.
+_VALIDATION_CHUNK = 2 ** 16
+_INT32_MAX = np.iinfo(np.int32).max
+
+
+def _validate_counts(df):
+    '''Raise a ValueError unless `df` holds non-negative numbers only.
+
+    Numeric columns are recognized by their dtype. Their values are scanned
+    once, in chunks, for `nan`, negative and infinite values and for values
+    too large for `np.int32`, without making temporary arrays of the table.
+    Only the values of object columns are checked one by one.
+    '''
+    if isinstance(df, SparseFeatureTable):
+        # Only the stored values need checking, the rest are zeros.
+        _validate_count_array(df.matrix.data)
+        return
+    dtypes = set(df.dtypes)
+    if len(dtypes) == 1 and df.dtypes.iloc[0] != object:
+        # A single block of values, scanned without copying it.
+        _validate_count_array(df.values)
+        return
+    for j in range(df.shape[1]):
+        column = df.iloc[:, j].values
+        if column.dtype == object:
+            if not all(np.isreal(x) for x in column):
+                _raise_non_numeric()
+            column = column.astype(np.float64)
+        _validate_count_array(column)
+
+
+def _raise_non_numeric():
+    raise ValueError('A dataframe contains one or more values which '
+                     'are not numeric. Data must be exclusively '
+                     'positive integers.')
+
+
+def _validate_count_array(values):
+    '''Validate an array of counts for `_validate_counts`.'''
+    kind = values.dtype.kind
+    if kind == 'b':
+        return
+    if kind not in 'uif':
+        _raise_non_numeric()
+    # A view of the values in memory order, for C and Fortran ordered
+    # blocks alike.
+    flat = values.ravel(order='K')
+    for start in range(0, flat.size, _VALIDATION_CHUNK):
+        chunk = flat[start:start + _VALIDATION_CHUNK]
+        # `nan` propagates through both reductions.
+        low, high = chunk.min(), chunk.max()
+        if np.isnan(low):
+            raise ValueError('A dataframe has `nan` or `null` values. Data '
+                             'must be exclusively positive integers.')
+        if low < 0:
+            raise ValueError('A dataframe has a negative count. Data '
+                             'must be exclusively positive integers.')
+        if high > _INT32_MAX:
+            raise ValueError('A dataframe has a count of %s, which is '
+                             'infinite or larger than %d. Data must be '
+                             'exclusively positive integers.'
+                             % (high, _INT32_MAX))
+
+
+def _validate_columns(sources, sinks):
+    '''Raise a ValueError unless `sources` and `sinks` have equal columns.'''
+    if not (sinks.columns == sources.columns).all():
+        raise ValueError('Dataframes do not contain identical (and '
+                         'identically ordered) columns. Columns must '
+                         'match exactly.')
+
+
 def validate_gibbs_parameters(alpha1, alpha2, beta, restarts,
                               draws_per_restart, burnin, delay):
     '''Return `True` if params numerically acceptable. See `gibbs` for docs.'''
@@ -107,13 +185,14 @@ def intersect_and_sort_samples(sample_metadata, feature_table):
     ----------
     sample_metadata : pd.DataFrame
         Contingency table with rows, columns = samples, metadata.
-    feature_table : pd.DataFrame
+    feature_table : pd.DataFrame or SparseFeatureTable
         Contingency table with rows, columns = samples, features.
 
     Returns
     -------
     sample_metadata, feature_table : pd.DataFrame, pd.DataFrame
         Input tables with unshared samples removed and ordered equivalently.
+        A sparse `feature_table` stays sparse.
 
     Raises
     ------
@@ -125,6 +204,10 @@ def intersect_and_sort_samples(sample_metadata, feature_table):
         raise ValueError('There are no shared samples between the feature '
                          'table and the sample metadata. Ensure that you have '
                          'passed the correct files.')
+    elif isinstance(feature_table, SparseFeatureTable):
+        s_metadata = sample_metadata.loc[np.in1d(sample_metadata.index,
+                                                 shared_samples), :].copy()
+        return s_metadata, feature_table.select(s_metadata.index)
     elif (shared_samples.size == sample_metadata.shape[0] ==
           feature_table.shape[0]):
         s_metadata = sample_metadata.copy()
@@ -150,7 +233,7 @@ def collapse_source_data(sample_metadata, feature_table, source_samples,
     ----------
     sample_metadata : pd.DataFrame
         Contingency table where rows are features and columns are metadata.
-    feature_table : pd.DataFrame
+    feature_table : pd.DataFrame or SparseFeatureTable
         Contingency table where rows are features and columns are samples.
     source_samples : iterable
         Samples which should be considered for collapsing (i.e. are sources).
@@ -170,6 +253,10 @@ def collapse_source_data(sample_metadata, feature_table, source_samples,
     This function calls `validate_gibbs_input` before returning the collapsed
     source table to ensure aggregation has not introduced non-integer values.
 
+    The collapsed sources are always a dense dataframe. With a sparse
+    `feature_table`, 'sum' and 'mean' are computed on the sparse source
+    samples, and other methods densify the samples of one source at a time.
+
     The order of the collapsed sources is determined by the sort order of their
     names. For instance, in the example below, .4 comes before 3.0 so the
     collapsed sources will have the 0th row as .4.
@@ -208,36 +295,325 @@ def collapse_source_data(sample_metadata, feature_table, source_samples,
     3.0           10  75  20  75
     '''
     sources = sample_metadata.loc[source_samples, :]
+    if isinstance(feature_table, SparseFeatureTable):
+        return validate_gibbs_input(_collapse_sparse(
+            feature_table.select(sources.index), sources[category], method))
     table = feature_table.loc[sources.index, :].copy()
     table['collapse_col'] = sources[category]
     return validate_gibbs_input(table.groupby('collapse_col').agg(method))
 
 
-def subsample_dataframe(df, depth, replace=False):
+def _collapse_sparse(table, groups, method):
+    '''Aggregate the rows of a `SparseFeatureTable` like `DataFrame.groupby`.
+
+    Groups are sorted by name and samples without a group are dropped, as
+    `groupby` does.
+    '''
+    codes, names = pd.factorize(groups, sort=True)
+    samples = np.flatnonzero(codes >= 0)
+    if method in ('sum', 'mean'):
+        indicator = scipy.sparse.csr_matrix(
+            (np.ones(samples.size), (codes[samples], samples)),
+            shape=(len(names), table.shape[0]))
+        data = (indicator @ table.matrix).toarray()
+        if method == 'mean':
+            data /= np.bincount(codes[samples], minlength=len(names))[:, None]
+    else:
+        data = np.array([pd.DataFrame(table.matrix[codes == group].toarray())
+                         .agg(method).values
+                         for group in range(len(names))])
+    return pd.DataFrame(data, index=pd.Index(names, name='collapse_col'),
+                        columns=table.columns)
+
+
+def subsample_dataframe(df, depth, replace=False, seed=None, jobs=1,
+                        executor='process'):
     '''Subsample (rarify) input dataframe without replacement.
 
     Parameters
     ----------
-    df : pd.DataFrame
+    df : pd.DataFrame or SparseFeatureTable
         Feature table where rows are features and columns are samples.
     depth : int
         Number of sequences to choose per sample.
     replace : bool, optional
         If ``True``, subsample with replacement. If ``False`` (the default),
         subsample without replacement.
+    seed : int, np.random.SeedSequence, np.random.Generator or None, optional
+        Seed of the rarefaction, see `rarefy`. If `None` and `jobs` is 1 (the
+        default), every sample is subsampled in turn from the global
+        `np.random` state (the legacy behavior).
+    jobs : int or 'auto', optional
+        Number of jobs `rarefy` subsamples the blocks of samples with.
+    executor : str or concurrent.futures.Executor, optional
+        Executor of the jobs, see `get_executor`.
 
     Returns
     -------
-    pd.DataFrame
-        Subsampled dataframe.
+    pd.DataFrame or SparseFeatureTable
+        Subsampled dataframe. A sparse table stays sparse, and the same
+        random numbers are drawn as for the dense table.
     '''
+    if seed is not None or jobs != 1:
+        if seed is None:
+            # The seed is drawn from the global state, so that the legacy
+            # `np.random.seed` still reproduces the run.
+            seed = np.random.randint(np.iinfo(np.int64).max, dtype=np.int64)
+        if isinstance(df, SparseFeatureTable):
+            return SparseFeatureTable(rarefy(df.matrix, depth, replace, seed,
+                                             jobs, executor),
+                                      df.index, df.columns)
+        return pd.DataFrame(rarefy(df.values, depth, replace, seed, jobs,
+                                   executor),
+                            index=df.index, columns=df.columns)
+
+    if isinstance(df, SparseFeatureTable):
+        matrix = df.matrix.copy()
+        row = np.zeros(matrix.shape[1], dtype=matrix.dtype)
+        for start, stop in zip(matrix.indptr[:-1], matrix.indptr[1:]):
+            features = matrix.indices[start:stop]
+            if replace:
+                # The multinomial draws a number for every feature, including
+                # the absent ones, so a sample is densified to draw the same
+                # numbers as the dense table.
+                row[features] = matrix.data[start:stop]
+                matrix.data[start:stop] = subsample_counts(
+                    row, n=depth, replace=True)[features]
+                row[features] = 0
+            else:
+                matrix.data[start:stop] = subsample_counts(
+                    matrix.data[start:stop], n=depth)
+        matrix.eliminate_zeros()
+        return SparseFeatureTable(matrix, df.index, df.columns)
+
     def subsample(x):
         return pd.Series(subsample_counts(x.values, n=depth, replace=replace),
                          index=x.index)
     return df.apply(subsample, axis=1)
 
 
-def generate_environment_assignments(n, num_sources):
+# Number of samples `rarefy` subsamples with a generator of their own. It
+# does not depend on the number of jobs, so neither do the results.
+_RAREFACTION_BLOCK = 256
+
+
+def rarefy(counts, depth, replace=False, seed=None, jobs=1,
+           executor='process'):
+    '''Subsample every row of a count matrix to `depth` sequences.
+
+    Parameters
+    ----------
+    counts : np.array or scipy.sparse matrix
+        2D array of non-negative ints, rows are samples and columns are
+        features.
+    depth : int
+        Number of sequences to choose per sample.
+    replace : bool, optional
+        If ``True``, subsample with replacement (a multinomial draw),
+        otherwise without replacement (a multivariate hypergeometric draw).
+    seed : int, np.random.SeedSequence, np.random.Generator or None, optional
+        Root seed. Every block of `_RAREFACTION_BLOCK` samples draws from a
+        generator seeded with the seed `spawn_seeds` derives for it, so the
+        results depend on `seed` only, whatever the number of jobs. A
+        generator is drawn from once, see `_root_seed`.
+    jobs : int or 'auto', optional
+        Number of jobs the blocks are subsampled with. With 'auto', as many
+        as there are CPUs.
+    executor : str or concurrent.futures.Executor, optional
+        Executor of the jobs if there are more than one, see `get_executor`.
+
+    Returns
+    -------
+    np.array or scipy.sparse.csr_matrix
+        The subsampled counts, with the dtype of `counts`. A sparse matrix is
+        returned as a CSR matrix without the features that were not drawn.
+
+    Raises
+    ------
+    ValueError
+        If a sample has fewer than `depth` sequences and `replace` is
+        ``False``, or none at all.
+
+    Notes
+    -----
+    Only the non-zero counts of a sample are drawn from, and the draws of a
+    block are made for all its samples at once: the counts of the kth
+    feature present in each sample are drawn together, conditioned on the
+    draws of the features before it.
+    '''
+    _validate_jobs(jobs)
+    if jobs == 'auto':
+        jobs = _available_cpus()
+    sparse = scipy.sparse.issparse(counts)
+    matrix = scipy.sparse.csr_matrix(counts)
+    totals = np.asarray(matrix.sum(1)).ravel()
+    if (totals < (1 if replace else depth)).any():
+        raise ValueError('A sample has %d sequences, too few to rarefy to %d '
+                         'sequences%s.' % (totals.min(), depth,
+                                           ' with replacement' if replace
+                                           else ''))
+
+    blocks = range(0, matrix.shape[0], _RAREFACTION_BLOCK)
+    seeds = spawn_seeds(seed, len(blocks))
+    args = []
+    for start, block_seed in zip(blocks, seeds):
+        stop = min(start + _RAREFACTION_BLOCK, matrix.shape[0])
+        indptr = matrix.indptr[start:stop + 1]
+        args.append((matrix.data[indptr[0]:indptr[-1]], indptr - indptr[0],
+                     depth, replace, block_seed))
+    if jobs == 1 or len(args) == 1:
+        drawn = [_rarefy_block(*a) for a in args]
+    else:
+        executor, owned = get_executor(executor, jobs)
+        try:
+            drawn = list(executor.map(_rarefy_block, *zip(*args)))
+        finally:
+            if owned:
+                executor.shutdown()
+
+    # The structure is copied, as it may be that of `counts`.
+    matrix = scipy.sparse.csr_matrix(
+        (np.concatenate(drawn).astype(matrix.dtype, copy=False),
+         matrix.indices.copy(), matrix.indptr.copy()), shape=matrix.shape)
+    if sparse:
+        matrix.eliminate_zeros()
+        return matrix
+    return matrix.toarray()
+
+
+def _rarefy_block(data, indptr, depth, replace, seed):
+    '''Subsample the CSR rows `data`, `indptr` for `rarefy`.'''
+    rng = np.random.default_rng(seed)
+    data = data.astype(np.int64)
+    lengths = np.diff(indptr)
+    # The sequences of each sample that are left to draw from, and to draw.
+    cumulative = np.concatenate(([0], np.cumsum(data)))
+    left = cumulative[indptr[1:]] - cumulative[indptr[:-1]]
+    wanted = np.full(len(lengths), depth, dtype=np.int64)
+    drawn = np.zeros_like(data)
+    for k in range(lengths.max(initial=0)):
+        rows = np.flatnonzero(lengths > k)
+        at = indptr[rows] + k
+        present = data[at]
+        if replace:
+            # The last feature of a sample gets all that is left to draw.
+            draw = rng.binomial(wanted[rows], present / left[rows])
+        else:
+            draw = rng.hypergeometric(present, left[rows] - present,
+                                      wanted[rows])
+        drawn[at] = draw
+        wanted[rows] -= draw
+        left[rows] -= present
+    return drawn
+
+
+def prune_features(replicates, min_prevalence=0, min_abundance=0):
+    '''Drop the features that are absent, or rare, in the sources and sinks.
+
+    Parameters
+    ----------
+    replicates : list
+        (sources, sinks) tuples of the run, e.g. the collapsed and rarefied
+        tables of `prepare_gibbs_replicates` (the sinks are `None` for LOO).
+        The sinks may be `SparseFeatureTable`s. All tables must have the
+        same features.
+    min_prevalence : float, optional
+        Least fraction of the samples (sources and sinks) of the replicates a
+        feature must be present in to be kept.
+    min_abundance : float, optional
+        Least count of a feature, summed over the sources and sinks and
+        averaged over the replicates, for it to be kept.
+
+    Returns
+    -------
+    list
+        The replicates without the pruned features, in the same order.
+    pd.DataFrame
+        The pruned features (rows), with their 'prevalence' and 'abundance'
+        as defined above.
+
+    Raises
+    ------
+    ValueError
+        If `min_prevalence` is not between 0 and 1, or `min_abundance` is
+        negative.
+    ValueError
+        If no features would remain, or a source or sink would be left
+        without counts (it would have no mixing proportions).
+
+    Notes
+    -----
+    Features with no counts in any source or sink are always pruned. They
+    only add to the number of features (`tau`) of the model of the sources,
+    and to the size of the model and of the feature tables. Pruning them
+    changes the priors of the model slightly, so results differ from those
+    of the full table. The same features are pruned from every replicate.
+    To map a feature table of the pruned features back onto all features,
+    reindex its columns with the features of the full table, filling in 0.
+    '''
+    if not 0 <= min_prevalence <= 1:
+        raise ValueError('`min_prevalence` must be between 0 and 1, not %r.'
+                         % (min_prevalence,))
+    if min_abundance < 0:
+        raise ValueError('`min_abundance` must not be negative, not %r.'
+                         % (min_abundance,))
+    features = replicates[0][0].columns
+    present = np.zeros(len(features), dtype=np.int64)
+    totals = np.zeros(len(features), dtype=np.float64)
+    num_samples = 0
+    for table in chain.from_iterable(replicates):
+        if table is None:
+            continue
+        counts = _count_matrix(table)
+        if scipy.sparse.issparse(counts):
+            present += np.bincount(counts.indices[counts.data > 0],
+                                   minlength=len(features))
+        else:
+            present += (counts > 0).sum(0)
+        totals += np.asarray(counts.sum(0)).ravel()
+        num_samples += counts.shape[0]
+    prevalence = present / num_samples
+    abundance = totals / len(replicates)
+    keep = ((present > 0) & (prevalence >= min_prevalence) &
+            (abundance >= min_abundance))
+    report = pd.DataFrame({'prevalence': prevalence[~keep],
+                           'abundance': abundance[~keep]},
+                          index=features[~keep])
+    if keep.all():
+        return list(replicates), report
+    if not keep.any():
+        raise ValueError('Pruning would remove all %d features. Lower '
+                         '`min_prevalence` or `min_abundance`.'
+                         % len(features))
+    columns = np.flatnonzero(keep)
+
+    def take(table):
+        if table is None:
+            return None
+        if isinstance(table, SparseFeatureTable):
+            return table.take_features(columns)
+        return table.iloc[:, columns]
+    pruned = [(take(sources), take(sinks)) for sources, sinks in replicates]
+
+    # Samples left without counts have no mixing proportions.
+    emptied = {'sources': [], 'sinks': []}
+    for replicate in pruned:
+        for kind, table in zip(['sources', 'sinks'], replicate):
+            if table is None:
+                continue
+            totals = np.asarray(_count_matrix(table).sum(1)).ravel()
+            emptied[kind].extend(sample for sample in table.index[totals == 0]
+                                 if sample not in emptied[kind])
+    if emptied['sources'] or emptied['sinks']:
+        raise ValueError('Pruning would remove all counts of %s. Lower '
+                         '`min_prevalence` or `min_abundance`.' %
+                         ' and '.join('the %s %s' % (kind, ', '.join(
+                             map(str, samples)))
+                             for kind, samples in emptied.items() if samples))
+    return pruned, report
+
+
+def generate_environment_assignments(n, num_sources, rng=np.random):
     '''Randomly assign `n` counts to one of `num_sources` environments.
 
     Parameters
@@ -246,6 +622,8 @@ def generate_environment_assignments(n, num_sources):
         Number of environment assignments to generate.
     num_sources : int
         Number of possible environment states (this includes the 'Unknown').
+    rng : np.random.Generator or module, optional
+        Source of randomness. Defaults to the global `np.random` state.
 
     Returns
     -------
@@ -256,14 +634,14 @@ def generate_environment_assignments(n, num_sources):
         1D vector of length `num_sources`. The ith entry is the total number of
         entries in `seq_env_assignments` which are equal to i.
     '''
-    seq_env_assignments = np.random.choice(np.arange(num_sources), size=n,
-                                           replace=True)
+    seq_env_assignments = rng.choice(np.arange(num_sources), size=n,
+                                     replace=True)
     envcounts = np.bincount(seq_env_assignments, minlength=num_sources)
     return seq_env_assignments, envcounts
 
 
 class ConditionalProbability(object):
-    def __init__(self, alpha1, alpha2, beta, source_data):
+    def __init__(self, alpha1, alpha2, beta, source_data, dtype=np.float64):
         r"""Set properties used for calculating the conditional probability.
 
         Paramaters
@@ -281,6 +659,10 @@ class ConditionalProbability(object):
             Columns are features, rows are collapsed samples. The [i,j]
             entry is the sum of the counts of features j in all samples which
             were considered part of source i.
+        dtype : np.dtype, optional
+            Floating point type of the source model and the joint probability
+            buffer, either float64 (the default) or float32. float32 halves
+            the memory used by the (V-1, tau) arrays. See Notes.
 
         Attributes
         ----------
@@ -298,21 +680,32 @@ class ConditionalProbability(object):
             Number of features.
         joint_probability : np.array
             The joint conditional distribution. Until the `precalculate` method
-            is called, this will be uniformly zero.
+            is called, this will be uniformly zero. After a call to `draw` it
+            holds the cumulative joint distribution.
         n : int
             Number of sequences in the sink.
+        features : np.array or None
+            Indices of the features the per-feature quantities were
+            precalculated for (see `precalculate`). `None` means all `tau`
+            features.
+        rows : np.array or None
+            Indices of the rows of `m_xivs` that are the known sources of the
+            model. `None` means all rows. Set by `hold_out`.
         known_p_tv : np.array
             An array giving the precomputable parts of the probability of
             finding the xith taxon in the vth environment given the known
-            sources, aka p_tv in the R implementation. Rows are (known)
-            sources, columns are features, shape is (V-1, tau).
+            sources, aka p_tv in the R implementation. Rows are the rows of
+            `m_xivs` (including any held out source), columns are features,
+            shape is (len(m_xivs), tau), or (len(m_xivs), len(features)) if
+            `features` is set.
         denominator_p_v : float
             The denominator of the calculation for finding the probability of
             a sequence being in the vth environment given the training data
             (source data).
         known_source_cp : np.array
             All precomputable portions of the conditional probability array.
-            Dimensions are the same as self.known_p_tv.
+            Rows are the known sources (`rows`), so the shape is (V-1, tau),
+            or (V-1, len(features)) if `features` is set.
 
         Notes
         -----
@@ -330,6 +723,15 @@ class ConditionalProbability(object):
         The variables are named in the class, as well as its methods, in
         accordance with the variable names used in [1]_.
 
+        With float32 the joint probabilities carry a relative error of about
+        1e-7 compared to float64 (the depth dependent scalars are always kept
+        in float64). Individual reassignments differ only when a uniform
+        lands within that error of an interval boundary, so a seeded run
+        follows the float64 chain for many passes and the mixing proportions
+        agree to well within the variability between restarts (see
+        `test_float32_accuracy`). The source counts are stored exactly as
+        long as they are below 2**24.
+
         Examples
         --------
         The class is written so that it will be created before being passed to
@@ -368,24 +770,59 @@ class ConditionalProbability(object):
         self.alpha1 = alpha1
         self.alpha2 = alpha2
         self.beta = beta
-        self.m_xivs = source_data.astype(np.float64)
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.float64):
+            raise ValueError('The dtype of the conditional probability must '
+                             'be float32 or float64, not %s.' % self.dtype)
+        self.m_xivs = source_data.astype(self.dtype)
         self.m_vs = np.expand_dims(source_data.sum(1),
-                                   axis=1).astype(np.float64)
+                                   axis=1).astype(self.dtype)
         self.V = source_data.shape[0] + 1
         self.tau = source_data.shape[1]
         # Create the joint probability vector which will be overwritten each
         # time self.calculate_cp_slice is called.
-        self.joint_probability = np.zeros(self.V, dtype=np.float64)
+        self.joint_probability = np.zeros(self.V, dtype=self.dtype)
+        self.features = None
+        self.rows = None
+        self.known_p_tv = None
+        # The sink depth the sink dependent quantities were last computed for.
+        self._precalculated_n = None
 
     def set_n(self, n):
         """Set the sum of the sink."""
         self.n = n
 
-    def precalculate(self):
-        """Precompute all static quantities of the probability matrix."""
-        # Known source.
-        self.known_p_tv = (self.m_xivs + self.alpha1) / \
-                          (self.m_vs + self.tau * self.alpha1)
+    def precalculate(self, features=None):
+        """Precompute all static quantities of the probability matrix.
+
+        Parameters
+        ----------
+        features : np.array, optional
+            Sorted indices of the features present in the sink. If given,
+            `known_p_tv` and `known_source_cp` are computed only for these
+            columns, and the sampler must refer to the ith of them as feature
+            i (e.g. `calculate_cp_slice(i, ...)`). `tau` and `m_vs` still
+            describe the full feature set, so the probabilities are identical
+            to those of the full model. If `None`, all features are used.
+
+        Notes
+        -----
+        `known_p_tv` does not depend on the sink depth and is only recomputed
+        when `features` changes. The remaining quantities depend only on `n`
+        (and the columns), so they are recomputed only if either has changed
+        since the previous call. Sinks of equal depth (e.g. rarefied sinks)
+        therefore share one precalculation of the full model.
+        """
+        if features is None or self.features is None:
+            same_features = features is None and self.features is None
+        else:
+            same_features = np.array_equal(features, self.features)
+        if self._precalculated_n == self.n and same_features:
+            return
+        if self.known_p_tv is None or not same_features:
+            self._calculate_known_p_tv(features)
+        self.features = features
+        self._precalculated_n = self.n
         self.denominator_p_v = self.n - 1 + (self.beta * self.V)
 
         # We are going to be accessing columns of this array in the innermost
@@ -393,12 +830,76 @@ class ConditionalProbability(object):
         # 'Fortran-contiguous' - we've set it so that accessing column slices
         # is faster. Tests indicate about 2X speed up in this operation from
         # 'F' order as opposed to the default 'C' order.
-        self.known_source_cp = np.array(self.known_p_tv / self.denominator_p_v,
-                                        order='F', dtype=np.float64)
+        # With held out sources the rows are gathered straight into it.
+        self.known_source_cp = np.empty((self.V - 1,
+                                         self.known_p_tv.shape[1]),
+                                        order='F', dtype=self.dtype)
+        if self.rows is None:
+            self.known_source_cp[...] = self.known_p_tv
+        else:
+            np.take(self.known_p_tv, self.rows, axis=0,
+                    out=self.known_source_cp)
+        self.known_source_cp /= self.denominator_p_v
 
         self.alpha2_n = self.alpha2 * self.n
         self.alpha2_n_tau = self.alpha2_n * self.tau
 
+    def _calculate_known_p_tv(self, features):
+        """Calculate `known_p_tv` for all rows of `m_xivs`."""
+        # Known source.
+        m_xivs = self.m_xivs if features is None else self.m_xivs[:, features]
+        self.known_p_tv = (m_xivs + self.alpha1) / \
+                          (self.m_vs + self.tau * self.alpha1)
+
+    def hold_out(self, source):
+        """Return this model with one of its sources left out.
+
+        Parameters
+        ----------
+        source : int
+            Index of the known source (of this model) to leave out.
+
+        Returns
+        -------
+        ConditionalProbability
+            A model whose known sources are those of this model except
+            `source`. It is identical to a model built from the source data
+            without that row, but shares `m_xivs`, `m_vs` and `known_p_tv`
+            with this model rather than copying them. Only the quantities
+            that depend on the sink (see `precalculate`) are its own.
+
+        Notes
+        -----
+        `known_p_tv` is the same for every row whichever other rows are in
+        the model, so in leave-one-out it is computed once (for all
+        features) and every held out model selects its rows from it.
+        """
+        rows = np.arange(self.V - 1) if self.rows is None else self.rows
+        if not 0 <= source < rows.size:
+            raise ValueError('There is no source %s to hold out of %d '
+                             'sources.' % (source, rows.size))
+        if self.known_p_tv is None:
+            self._calculate_known_p_tv(None)
+            self.features = None
+        cp = copy(self)
+        cp.rows = np.delete(rows, source)
+        cp.V = self.V - 1
+        cp.joint_probability = np.zeros(cp.V, dtype=self.dtype)
+        cp._precalculated_n = None
+        return cp
+
+    def copy(self):
+        """Return this model with its own sink dependent state.
+
+        The copy shares the source arrays (`m_xivs`, `m_vs` and `known_p_tv`)
+        with this model, but is precalculated for its sinks independently, so
+        that the two can be used by different threads.
+        """
+        cp = copy(self)
+        cp.joint_probability = np.zeros(self.V, dtype=self.dtype)
+        cp._precalculated_n = None
+        return cp
+
     def calculate_cp_slice(self, xi, m_xiV, m_V, n_vnoti):
         """Calculate slice of the conditional probability matrix.
 
@@ -406,7 +907,8 @@ class ConditionalProbability(object):
         ----------
         xi : int
             Index of the column (taxon) of the conditional probability matrix
-            that should be calculated.
+            that should be calculated. If the model was precalculated for a
+            subset of `features`, this is the position in that subset.
         m_xiV : float
             Count of the training sequences (that are taxon xi) currently
             assigned to the unknown environment.
@@ -424,23 +926,366 @@ class ConditionalProbability(object):
             taxon based on the current state of the sampler.
         """
         # Components for known sources, i.e. indices {0,1...V-2}.
-        self.joint_probability[:-1] = \
-            self.known_source_cp[:, xi] * (n_vnoti[:-1] + self.beta)
+        np.multiply(self.known_source_cp[:, xi], n_vnoti[:-1] + self.beta,
+                    out=self.joint_probability[:-1])
         # Component for unknown source, i.e. index V-1.
         self.joint_probability[-1] = \
             ((m_xiV + self.alpha2_n) * (n_vnoti[-1] + self.beta)) / \
             ((m_V + self.alpha2_n_tau) * self.denominator_p_v)
         return self.joint_probability
 
+    def draw(self, xi, m_xiV, m_V, n_vnoti, u):
+        """Draw an environment from a slice of the conditional probability.
+
+        Parameters
+        ----------
+        xi, m_xiV, m_V, n_vnoti
+            See `calculate_cp_slice`.
+        u : float
+            A uniform variate in [0, 1).
+
+        Returns
+        -------
+        int
+            Index of the drawn environment.
+
+        Notes
+        -----
+        By stacking (cumsum) the probability of the slice, `u` is scaled to x
+        in [0, total sum), and we find which interval that value lies in with
+        searchsorted. Visual representation below
+                 e1    e2  e3 e4  e5     unk
+        jp:    |     |    |  |  |    |          |
+        x:                          x
+        index == 4 (zero indexed)
+        The cumulative sum is taken in place in `self.joint_probability`
+        rather than into a new array. The result is
+        identical to `np.searchsorted(cs, cs[-1] * u)` with
+        `cs = calculate_cp_slice(...).cumsum()`.
+        """
+        jp = self.calculate_cp_slice(xi, m_xiV, m_V, n_vnoti)
+        jp.cumsum(out=jp)
+        return jp.searchsorted(jp[-1] * u)
+
+
+def _python_gibbs_pass(order, seq_env_assignments, taxon_sequence, envcounts,
+                       unknown_vector, unknown_sum, uniforms, cp):
+    '''Reference engine: withdraw and reassign every sequence in the sink.'''
+    unknown_idx = cp.V - 1
+    for i, seq_index in enumerate(order):
+        e = seq_env_assignments[seq_index]
+        t = taxon_sequence[seq_index]
+
+        # Remove the ith sequence and update the probability associated with
+        # that environment.
+        envcounts[e] -= 1
+        if e == unknown_idx:
+            unknown_vector[t] -= 1
+            unknown_sum -= 1
+
+        # Calculate the new joint probability vector based on the removal of
+        # the ith sequence. Reassign the sequence to a new source environment
+        # (drawn with the ith uniform of the pass) and update counts for each
+        # environment and the unknown source if necessary.
+        # `cp.draw` is in contrast to the more intuitive, but much slower call
+        # it replaced:
+        # np.random.choice(num_sources, jp/jp.sum())
+        new_e_idx = cp.draw(t, unknown_vector[t], unknown_sum, envcounts,
+                            uniforms[i])
+
+        seq_env_assignments[seq_index] = new_e_idx
+        envcounts[new_e_idx] += 1
+
+        if new_e_idx == unknown_idx:
+            unknown_vector[t] += 1
+            unknown_sum += 1
+    return unknown_sum
+
+
+def _numba_gibbs_pass(order, seq_env_assignments, taxon_sequence, envcounts,
+                      unknown_vector, unknown_sum, uniforms, cp):
+    '''Compiled engine: withdraw and reassign every sequence in the sink.'''
+    return _compiled_gibbs_pass(order, seq_env_assignments, taxon_sequence,
+                                envcounts, unknown_vector, unknown_sum,
+                                uniforms, cp.known_source_cp, cp.beta,
+                                cp.alpha2_n, cp.alpha2_n_tau,
+                                cp.denominator_p_v, cp.joint_probability)
+
+
+def _vectorized_gibbs_pass(orders, seq_env_assignments, taxon_sequences,
+                           envcounts, unknown_vector, unknown_sum, uniforms,
+                           cp):
+    '''Vectorized engine: make one pass of every chain in lockstep.
+
+    All arguments describing the state of the sampler have a leading axis
+    with one entry per chain, e.g. `envcounts` is (chains, V). Chains may be
+    restarts of one sink or of several sinks of equal depth. At each step the
+    ith sequence in every chain's order is withdrawn, the joint probability
+    is calculated for all chains at once and every chain is reassigned with a
+    single vectorized draw.
+    '''
+    num_chains, sink_sum = orders.shape
+    unknown_idx = cp.V - 1
+    chains = np.arange(num_chains)
+    known_source_cp = cp.known_source_cp
+    jp = np.empty((num_chains, cp.V), dtype=cp.dtype)
+
+    for i in range(sink_sum):
+        seq_index = orders[:, i]
+        e = seq_env_assignments[chains, seq_index]
+        t = taxon_sequences[chains, seq_index]
+
+        # Remove the ith sequence of every chain.
+        envcounts[chains, e] -= 1
+        in_unknown = (e == unknown_idx)
+        unknown_vector[chains, t] -= in_unknown
+        unknown_sum -= in_unknown
+
+        # The same calculation as `ConditionalProbability.calculate_cp_slice`
+        # for every chain, followed by the cumulative sum of each row.
+        np.multiply(known_source_cp[:, t].T, envcounts[:, :-1] + cp.beta,
+                    out=jp[:, :-1])
+        jp[:, -1] = ((unknown_vector[chains, t] + cp.alpha2_n) *
+                     (envcounts[:, -1] + cp.beta)) / \
+            ((unknown_sum + cp.alpha2_n_tau) * cp.denominator_p_v)
+        cs = np.cumsum(jp, axis=1, out=jp)
+        # Row-wise equivalent of `np.searchsorted(cs, x)`.
+        x = cs[:, -1] * uniforms[:, i]
+        new_e_idx = (cs < x[:, np.newaxis]).sum(1)
+
+        seq_env_assignments[chains, seq_index] = new_e_idx
+        envcounts[chains, new_e_idx] += 1
+        in_unknown = (new_e_idx == unknown_idx)
+        unknown_vector[chains, t] += in_unknown
+        unknown_sum += in_unknown
+    return unknown_sum
+
+
+SAMPLER_ENGINES = {'python': _python_gibbs_pass,
+                   'numba': _numba_gibbs_pass,
+                   'vectorized': _vectorized_gibbs_pass}
+# Engines which advance all restarts of a sink together rather than one after
+# another.
+LOCKSTEP_ENGINES = {'vectorized'}
+
+
+def get_sampler_engine(engine):
+    '''Return the function that makes a single pass of the Gibbs sampler.
+
+    Parameters
+    ----------
+    engine : str
+        One of the keys of `SAMPLER_ENGINES`. 'python' is the reference
+        implementation. 'numba' runs the innermost loop as compiled code and
+        requires numba to be installed. 'vectorized' advances all restarts in
+        lockstep with array operations (see `LOCKSTEP_ENGINES`).
+
+    Returns
+    -------
+    function
+
+    Raises
+    ------
+    ValueError
+        If `engine` is not a known engine.
+    ImportError
+        If `engine` requires an optional dependency which is not installed.
+    '''
+    if engine not in SAMPLER_ENGINES:
+        raise ValueError('Unknown sampler engine %r. Available engines are: '
+                         '%s.' % (engine, ', '.join(sorted(SAMPLER_ENGINES))))
+    if engine == 'numba' and _compiled_gibbs_pass is None:
+        raise ImportError('The `numba` sampler engine requires numba. Install '
+                          'it (e.g. `pip install numba`) or use the `python` '
+                          'engine.')
+    return SAMPLER_ENGINES[engine]
+
+
+def _validate_adaptive_burnin(restarts, rhat, feature_blocks):
+    if restarts < 2:
+        raise ValueError('Adaptive burn-in compares restarts and requires at '
+                         'least 2 of them, not %d.' % restarts)
+    if not rhat > 1:
+        raise ValueError('The R-hat threshold of adaptive burn-in must be '
+                         'greater than 1, not %r.' % rhat)
+    if feature_blocks:
+        raise ValueError('Adaptive burn-in cannot be combined with feature '
+                         'block sampling.')
+
+
+def _validate_feature_blocks_engine(engine):
+    if engine != 'python':
+        raise ValueError('Feature block sampling is only available with the '
+                         '`python` engine, not %r.' % engine)
+
+
+def _root_seed(seed):
+    '''Return `seed`, with a `np.random.Generator` replaced by a root seed.
+
+    The root seed is a `np.random.SeedSequence` of entropy drawn from the
+    generator, which advances it: successive calls given one generator get
+    different streams, and a generator seeded alike gets the same ones.
+    '''
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(seed.integers(2**63, size=4).tolist())
+    return seed
+
 
-def gibbs_sampler(sink, cp, restarts, draws_per_restart, burnin, delay):
+def spawn_seeds(seed, n):
+    '''Derive `n` independent seeds from `seed`.
+
+    Parameters
+    ----------
+    seed : int, np.random.SeedSequence, np.random.Generator or None
+        Root seed. If `None`, no seeds are derived. A generator is drawn
+        from once, see `_root_seed`.
+    n : int
+        Number of seeds to derive.
+
+    Returns
+    -------
+    list
+        `n` `np.random.SeedSequence` objects, or `n` `None`s if `seed` is
+        `None`. The ith seed depends only on `seed` and `i`, so the same
+        stream is handed to the ith sink (or restart) however the work is
+        later split up between processes.
+    '''
+    if seed is None:
+        return [None] * n
+    seed = _root_seed(seed)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [np.random.SeedSequence(seed.entropy,
+                                   spawn_key=seed.spawn_key + (i,))
+            for i in range(n)]
+
+
+def _restart_rngs(seed, restarts):
+    '''Return a source of randomness for each restart.
+
+    With a `seed` every restart gets its own `np.random.Generator`, otherwise
+    all restarts share the global `np.random` state (the legacy behavior).
+    `seed` may also be a list with the seed of each restart, e.g. a slice of
+    `spawn_seeds(seed, n)` when the restarts of a sink are split into chunks
+    (see `_schedule_restart_chunks`).
+    '''
+    if seed is None:
+        return [np.random] * restarts
+    if isinstance(seed, list):
+        if len(seed) != restarts:
+            raise ValueError('%d restart seeds were given for %d restarts.' %
+                             (len(seed), restarts))
+        return [np.random.default_rng(s) for s in seed]
+    return [np.random.default_rng(s) for s in spawn_seeds(seed, restarts)]
+
+
+def _model_columns(sinks, sparse_model):
+    '''Return the model columns and taxon sequences of sinks.
+
+    Parameters
+    ----------
+    sinks : np.array or scipy.sparse.csr_matrix
+        2D array of ints. Rows are sinks of equal depth, columns are features.
+        CSR sinks are only densified over the model columns.
+    sparse_model : bool
+        If `True`, the model is restricted to the features present in any of
+        the sinks.
+
+    Returns
+    -------
+    features : np.array or None
+        Indices of the features the model should be precalculated for, or
+        `None` for all features.
+    taxon_sequences : np.array
+        2D array of ints. The ith row holds the model column of every
+        sequence of the ith sink (see `gibbs_sampler`).
+    '''
+    if sparse_model and scipy.sparse.issparse(sinks):
+        start, stop = sinks.indptr[0], sinks.indptr[-1]
+        present = sinks.data[start:stop] > 0
+        features = np.unique(sinks.indices[start:stop][present])
+        sinks = sinks[:, features].toarray()
+    elif sparse_model:
+        features = np.flatnonzero(sinks.sum(0))
+        sinks = sinks[:, features]
+    else:
+        features = None
+        sinks = _dense(sinks)
+    columns = np.arange(sinks.shape[1])
+    taxon_sequences = np.array([np.repeat(columns, sink) for sink in sinks],
+                               dtype=np.int32)
+    return features, taxon_sequences.reshape(sinks.shape[0], -1)
+
+
+def _count_matrix(table):
+    '''Return the counts of a dataframe or `SparseFeatureTable`.'''
+    if isinstance(table, SparseFeatureTable):
+        return table.matrix
+    return table.values
+
+
+def _row_nonzeros(counts):
+    '''Return the number of features of every row of a count matrix.'''
+    if scipy.sparse.issparse(counts):
+        return counts.getnnz(axis=1)
+    return np.count_nonzero(counts, axis=1)
+
+
+def _dense(sinks):
+    '''Return the sink (or sinks) of a task as a dense array.
+
+    The sinks of a sparse table are sent to the tasks as CSR rows and only
+    densified by the sampler, over all features. With a `sparse_model` they
+    are not densified, see `_model_columns`.
+    '''
+    if scipy.sparse.issparse(sinks):
+        return sinks.toarray()
+    return sinks
+
+
+def _rows(sinks):
+    '''Iterate over the rows of a dense or CSR count matrix.'''
+    if scipy.sparse.issparse(sinks):
+        return (sinks[i] for i in range(sinks.shape[0]))
+    return iter(sinks)
+
+
+def _feature_sequence(features, taxon_sequence):
+    '''Map model columns of sequences back to feature indices.'''
+    if features is None:
+        return taxon_sequence
+    return features[taxon_sequence].astype(np.int32)
+
+
+def _count_assignments(feature_counts, seq_env_assignments, taxon_sequence):
+    '''Add the environment of every sequence to a (V, columns) table.'''
+    num_columns = feature_counts.shape[1]
+    feature_counts += np.bincount(
+        seq_env_assignments * num_columns + taxon_sequence,
+        minlength=feature_counts.size).reshape(feature_counts.shape)
+
+
+def _feature_counts(feature_counts, features, num_features):
+    '''Map a (V, model columns) table back to a (V, features) table.'''
+    if features is None:
+        return feature_counts.astype(np.int32)
+    table = np.zeros((feature_counts.shape[0], num_features), dtype=np.int32)
+    table[:, features] = feature_counts
+    return table
+
+
+def gibbs_sampler(sink, cp, restarts, draws_per_restart, burnin, delay,
+                  engine='python', feature_blocks=False, seed=None,
+                  sparse_model=False, adaptive_burnin=False, rhat=1.1,
+                  accumulate_draws=False):
     """Run Gibbs Sampler to estimate feature contributions from a sink sample.
 
     Parameters
     ----------
-    sink : np.array
+    sink : np.array or scipy.sparse.csr_matrix
         A one dimentional array containing counts of features whose sources are
-        to be estimated.
+        to be estimated, or a CSR matrix holding it as its only row. With a
+        `sparse_model` only the features present in a CSR sink are densified.
     cp : ConditionalProbability object
         Instantiation of the class handling probability calculations.
     restarts : int
@@ -461,6 +1306,41 @@ def gibbs_sampler(sink, cp, restarts, draws_per_restart, burnin, delay):
         additional samples will be drawn every `delay` number of passes. This
         is also known as 'thinning'. Thinning helps reduce the impact of
         correlation between adjacent states of the Markov chain.
+    engine : str, optional
+        Implementation of the innermost loop, see `get_sampler_engine`. The
+        'python' and 'numba' engines make identical reassignments for a given
+        PRNG state. Without a `seed`, engines in `LOCKSTEP_ENGINES` consume
+        the global PRNG in a different order (identical results only when
+        `restarts` is 1).
+    feature_blocks : bool, optional
+        If `True`, reassign the sequences of each feature as a block, see
+        `feature_block_gibbs_sampler`. Only the 'python' engine is available
+        in this mode.
+    seed : int, np.random.SeedSequence, np.random.Generator or list, optional
+        If given, each restart draws from its own `np.random.Generator`
+        seeded with `spawn_seeds(seed, restarts)`, and all engines give
+        identical results. A list gives the seed of each restart. If `None`
+        (the default) the global `np.random` state is used.
+    sparse_model : bool, optional
+        If `True`, `cp` is precalculated only for the features present in the
+        sink (see `ConditionalProbability.precalculate`), which saves time and
+        memory when the sink contains a small fraction of all features. The
+        results are identical.
+    adaptive_burnin : bool, optional
+        If `True`, `burnin` is an upper bound on the number of burn-in
+        passes. The restarts are grown together and burn-in ends as soon as
+        the Gelman-Rubin R-hat between them is below `rhat` for every
+        environment (see `_grow_chains`). Requires at least two restarts and
+        cannot be combined with `feature_blocks`.
+    rhat : float, optional
+        Convergence threshold of adaptive burn-in, greater than 1.
+    accumulate_draws : bool, optional
+        If `True`, the environment of every sequence is added to a
+        (environment x feature) table at each draw, and this table is
+        returned instead of `final_env_assignments` and
+        `final_taxon_assignments`. The memory used (and the size of the
+        result) then no longer grows with the depth of the sink and the
+        number of draws.
 
     Returns
     -------
@@ -477,22 +1357,40 @@ def gibbs_sampler(sink, cp, restarts, draws_per_restart, burnin, delay):
         ordering (same ordering as `final_env_assignments`). The [i, j] entry
         is the environment that the taxon `final_env_assignments[i, j]` is
         determined to have come from in draw i (j is the environment).
+    feature_counts : np.array
+        Only returned, in place of the two arrays above, if `accumulate_draws`
+        is `True`. 2D array of ints, (V, features). The [i, j] entry is the
+        number of times a sequence of feature j was assigned to environment
+        i, summed over all draws.
+    passes : int
+        Only returned if `adaptive_burnin` is `True`. The number of passes
+        made by each restart, i.e. the burn-in passes plus those needed for
+        the draws.
     """
+    gibbs_pass = get_sampler_engine(engine)
+    if adaptive_burnin:
+        _validate_adaptive_burnin(restarts, rhat, feature_blocks)
+    if feature_blocks:
+        _validate_feature_blocks_engine(engine)
+        return feature_block_gibbs_sampler(_dense(sink).ravel(), cp,
+                                           restarts, draws_per_restart,
+                                           burnin, delay,
+                                           seed=seed,
+                                           sparse_model=sparse_model,
+                                           accumulate_draws=accumulate_draws)
+
     # Basic bookkeeping information we will use throughout the function.
     num_sources = cp.V
-    num_features = cp.tau
+    if not sparse_model:
+        sink = _dense(sink).ravel()
     sink = sink.astype(np.int32)
     sink_sum = sink.sum()
+    num_features = sink.shape[-1]
 
     # Calculate the number of passes that need to be conducted.
     total_draws = restarts * draws_per_restart
     total_passes = burnin + (draws_per_restart - 1) * delay + 1
 
-    # Results containers.
-    final_envcounts = np.zeros((total_draws, num_sources), dtype=np.int32)
-    final_env_assignments = np.zeros((total_draws, sink_sum), dtype=np.int32)
-    final_taxon_assignments = np.zeros((total_draws, sink_sum), dtype=np.int32)
-
     # Sequences from the sink will be randomly assigned a source environment
     # and then reassigned based on an increasingly accurate set of
     # probabilities. The order in which the sequences are selected for
@@ -507,105 +1405,938 @@ def gibbs_sampler(sink, cp, restarts, draws_per_restart, burnin, delay):
     # sink. Each one will be randomly assigned an environment, and then
     # reassigned based on the increasinly accurate distribution. sink[i] i's
     # will be placed in the `taxon_sequence` vector to allow each individual
-    # count to be removed and reassigned.
-    taxon_sequence = np.repeat(np.arange(num_features), sink).astype(np.int32)
+    # count to be removed and reassigned. With a sparse model, sequences are
+    # labelled by the column of their feature in `cp` and only mapped back to
+    # feature indices (`feature_sequence`) when the results are returned.
+    sinks = sink if scipy.sparse.issparse(sink) else sink[np.newaxis]
+    features, taxon_sequence = _model_columns(sinks, sparse_model)
+    taxon_sequence = taxon_sequence[0]
+    feature_sequence = _feature_sequence(features, taxon_sequence)
+    num_columns = num_features if features is None else features.size
 
     # Update the conditional probability class now that we have the sink sum.
     cp.set_n(sink_sum)
-    cp.precalculate()
+    cp.precalculate(features)
+
+    rngs = _restart_rngs(seed, restarts)
+    if engine in LOCKSTEP_ENGINES or adaptive_burnin:
+        envcounts, draws, passes = _grow_chains(
+            gibbs_pass, taxon_sequence[np.newaxis], cp, restarts,
+            draws_per_restart, burnin, delay, rngs,
+            lockstep=engine in LOCKSTEP_ENGINES,
+            rhat=rhat if adaptive_burnin else None,
+            accumulate_draws=accumulate_draws)
+        if accumulate_draws:
+            results = (envcounts[0],
+                       _feature_counts(draws[0], features, num_features))
+        else:
+            results = (envcounts[0], draws[0],
+                       np.tile(feature_sequence, (total_draws, 1)))
+        if adaptive_burnin:
+            return results + (passes[0],)
+        return results
+
+    # Results containers.
+    final_envcounts = np.zeros((total_draws, num_sources), dtype=np.int32)
+    if accumulate_draws:
+        feature_counts = np.zeros((num_sources, num_columns), dtype=np.int64)
+    else:
+        final_env_assignments = np.zeros((total_draws, sink_sum),
+                                         dtype=np.int32)
+        final_taxon_assignments = np.zeros((total_draws, sink_sum),
+                                           dtype=np.int32)
 
     # Several bookkeeping variables that are used within the for loops.
     drawcount = 0
     unknown_idx = num_sources - 1
 
     for restart in range(restarts):
+        rng = rngs[restart]
+        if seed is not None:
+            # Start every restart from the same order so that a chain is
+            # determined by its own stream alone and restarts can be grown in
+            # any order (or in lockstep). Without a seed, the order carries
+            # over between restarts as it always has.
+            order = np.arange(sink_sum, dtype=np.int32)
+
         # Generate random source assignments for each sequence in the sink
         # using a uniform distribution.
         seq_env_assignments, envcounts = \
-            generate_environment_assignments(sink_sum, num_sources)
-
-        # Initially, the count of each taxon in the 'unknown' source should be
-        # 0.
-        unknown_vector = np.zeros(num_features, dtype=np.int32)
-        unknown_sum = 0
+            generate_environment_assignments(sink_sum, num_sources, rng)
 
         # If a sequence's random environmental assignment is to the 'unknown'
         # environment we alter the training data to include those sequences
         # in the 'unknown' source.
-        for e, t in zip(seq_env_assignments, taxon_sequence):
-            if e == unknown_idx:
-                unknown_vector[t] += 1
-                unknown_sum += 1
+        unknown_vector = np.bincount(
+            taxon_sequence[seq_env_assignments == unknown_idx],
+            minlength=num_columns).astype(np.int32)
+        unknown_sum = int(unknown_vector.sum())
 
         for rep in range(1, total_passes + 1):
             # Iterate through sequences in a random order so that no
             # systematic bias is introduced based on position in the taxon
             # vector (i.e. taxa appearing at the end of the vector getting
             # better estimates of the probability).
-            np.random.shuffle(order)
-
-            for seq_index in order:
-                e = seq_env_assignments[seq_index]
-                t = taxon_sequence[seq_index]
-
-                # Remove the ith sequence and update the probability
-                # associated with that environment.
-                envcounts[e] -= 1
-                if e == unknown_idx:
-                    unknown_vector[t] -= 1
-                    unknown_sum -= 1
-
-                # Calculate the new joint probability vector based on the
-                # removal of the ith sequence. Reassign the sequence to a new
-                # source environment and update counts for each environment and
-                # the unknown source if necessary.
-                # This is the fastest way I've currently found to draw from
-                # `jp`. By stacking (cumsum) the probability of `jp`, we can
-                # draw x from uniform variable in [0, total sum), and then find
-                # which interval that value lies in with searchsorted. Visual
-                # representation below
-                #          e1    e2  e3 e4  e5     unk
-                # jp:    |     |    |  |  |    |          |
-                # x:                          x
-                # new_e_idx == 4 (zero indexed)
-                # This is in contrast to the more intuitive, but much slower
-                # call it replaced:
-                # np.random.choice(num_sources, jp/jp.sum())
-                jp = cp.calculate_cp_slice(t, unknown_vector[t], unknown_sum,
-                                           envcounts)
-                cs = jp.cumsum()
-                new_e_idx = np.searchsorted(cs, np.random.uniform(0, cs[-1]))
-
-                seq_env_assignments[seq_index] = new_e_idx
-                envcounts[new_e_idx] += 1
-
-                if new_e_idx == unknown_idx:
-                    unknown_vector[t] += 1
-                    unknown_sum += 1
+            rng.shuffle(order)
+
+            # The uniforms for the whole pass are drawn as one block. For the
+            # global state this consumes the PRNG exactly as drawing
+            # `np.random.uniform(0, x)` (computed as `x * random_sample()`)
+            # once per sequence would.
+            uniforms = rng.random(sink_sum)
+            unknown_sum = gibbs_pass(order, seq_env_assignments,
+                                     taxon_sequence, envcounts,
+                                     unknown_vector, unknown_sum, uniforms,
+                                     cp)
 
             if rep > burnin and ((rep - (burnin + 1)) % delay) == 0:
                 # Update envcounts array with the assigned envs.
                 final_envcounts[drawcount] = envcounts
 
                 # Assign vectors necessary for feature table reconstruction.
-                final_env_assignments[drawcount] = seq_env_assignments
-                final_taxon_assignments[drawcount] = taxon_sequence
+                if accumulate_draws:
+                    _count_assignments(feature_counts, seq_env_assignments,
+                                       taxon_sequence)
+                else:
+                    final_env_assignments[drawcount] = seq_env_assignments
+                    final_taxon_assignments[drawcount] = feature_sequence
 
                 # We've made a draw, update this index so that the next
                 # iteration will be placed in the correct index of results.
                 drawcount += 1
 
+    if accumulate_draws:
+        return (final_envcounts,
+                _feature_counts(feature_counts, features, num_features))
     return (final_envcounts, final_env_assignments, final_taxon_assignments)
 
 
-def _gibbs_loo(cp_and_sink, restarts, draws_per_restart, burnin, delay):
-    return gibbs_sampler(cp_and_sink[1], cp_and_sink[0], restarts,
-                         draws_per_restart, burnin, delay)
+def _potential_scale_reduction(sums, sumsqs, n):
+    '''Calculate the Gelman-Rubin R-hat of each environment.
+
+    Parameters
+    ----------
+    sums : np.array
+        2D array of floats, (chains, V). Sum over the last `n` passes of each
+        chain of the proportion of the sink assigned to each environment.
+    sumsqs : np.array
+        2D array of floats, (chains, V). Sum of the squares of the same
+        proportions.
+    n : int
+        Number of passes summed, at least 2.
+
+    Returns
+    -------
+    np.array
+        1D array of floats, (V,). The potential scale reduction factor of each
+        environment. It is 1 for an environment on which all chains agree
+        without any variation, and infinite if the chains are each constant
+        but disagree.
+    '''
+    means = sums / n
+    within = (np.maximum(sumsqs - n * means ** 2, 0) / (n - 1)).mean(0)
+    between = means.var(0, ddof=1)
+    var_plus = (n - 1) / n * within + between
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rhat = np.sqrt(var_plus / within)
+    rhat[var_plus == 0] = 1.
+    return rhat
+
+
+# Number of passes after which adaptive burn-in first checks convergence.
+MIN_ADAPTIVE_BURNIN = 10
+
+
+def _grow_chains(gibbs_pass, taxon_sequences, cp, restarts, draws_per_restart,
+                 burnin, delay, rngs, lockstep=True, rhat=None,
+                 accumulate_draws=False):
+    '''Grow all restarts of one or more sinks of equal depth together.
+
+    Parameters
+    ----------
+    gibbs_pass : function
+        A sampler engine, see `get_sampler_engine`.
+    taxon_sequences : np.array
+        2D array of ints. Each row is the `taxon_sequence` of a sink (see
+        `gibbs_sampler`). `cp` must have been precalculated for their depth
+        and model columns.
+    cp, restarts, draws_per_restart, burnin, delay
+        See `gibbs_sampler`.
+    rngs : list
+        Source of randomness of each chain (see `_restart_rngs`).
+    lockstep : bool, optional
+        If `True`, `gibbs_pass` is an engine from `LOCKSTEP_ENGINES` and
+        advances all chains at once. Otherwise it is called for each chain in
+        turn.
+    rhat : float, optional
+        If given, burn-in is adaptive and `burnin` is only an upper bound. The
+        chains of a sink are considered burnt in as soon as the R-hat of
+        every environment (see `_potential_scale_reduction`), taken over the
+        second half of the passes made so far, is below `rhat`. This is first
+        checked after `MIN_ADAPTIVE_BURNIN` passes.
+    accumulate_draws : bool, optional
+        See `gibbs_sampler`.
+
+    Returns
+    -------
+    final_envcounts : np.array
+        3D array of ints, (sinks, draws, V).
+    final_env_assignments : np.array
+        3D array of ints, (sinks, draws, depth). With `accumulate_draws` the
+        `feature_counts` of each sink over the model columns instead, i.e.
+        (sinks, V, columns).
+    passes : np.array
+        1D array of ints. The number of passes made by the chains of each
+        sink.
+
+    Notes
+    -----
+    The state of every chain is held in 2D arrays whose rows are chains, and
+    each iteration advances all of them by one pass. The chains of a sink are
+    dropped from these arrays once they have made all of their draws. Draws
+    of each sink are stored in the same (restart-major) order as
+    `gibbs_sampler` uses. Each chain consumes its own entry of `rngs` exactly
+    as the corresponding restart of `gibbs_sampler` does.
+
+    With adaptive burn-in, running sums of the proportions of every chain are
+    kept for each burn-in pass, i.e. (burnin + 1) * chains * V floats.
+    '''
+    num_sources = cp.V
+    unknown_idx = num_sources - 1
+    num_sinks, sink_sum = taxon_sequences.shape
+    num_chains = num_sinks * restarts
+    total_draws = restarts * draws_per_restart
+    draw_passes = (draws_per_restart - 1) * delay + 1
+
+    num_columns = cp.known_source_cp.shape[1]
+    final_envcounts = np.zeros((num_sinks, total_draws, num_sources),
+                               dtype=np.int32)
+    if accumulate_draws:
+        feature_counts = np.zeros((num_sinks, num_sources, num_columns),
+                                  dtype=np.int64)
+    else:
+        final_env_assignments = np.zeros((num_sinks, total_draws, sink_sum),
+                                         dtype=np.int32)
+
+    # Chain c is restart c % restarts of sink c // restarts. `chains` holds
+    # the chains which are still growing; the ith row of every state array
+    # belongs to chain chains[i].
+    chains = np.arange(num_chains)
+    chain_sinks = chains // restarts
+    draw_rows = (chains % restarts) * draws_per_restart
+    chain_sequences = np.repeat(taxon_sequences, restarts, axis=0)
+    seq_env_assignments = np.empty((num_chains, sink_sum), dtype=np.int64)
+    envcounts = np.empty((num_chains, num_sources), dtype=np.int64)
+    unknown_vector = np.zeros((num_chains, num_columns), dtype=np.int32)
+    for c in range(num_chains):
+        seq_env_assignments[c], envcounts[c] = \
+            generate_environment_assignments(sink_sum, num_sources, rngs[c])
+        unknown_vector[c] = np.bincount(
+            chain_sequences[c][seq_env_assignments[c] == unknown_idx],
+            minlength=num_columns)
+    unknown_sum = unknown_vector.sum(1)
+    orders = np.tile(np.arange(sink_sum, dtype=np.int32), (num_chains, 1))
+    uniforms = np.empty((num_chains, sink_sum), dtype=np.float64)
+
+    # The pass after which the chains of each sink are burnt in, -1 while
+    # that is still to be decided.
+    adaptive = rhat is not None and burnin > 0
+    burnt_in = np.full(num_sinks, -1 if adaptive else burnin)
+    if adaptive:
+        sums = np.zeros((burnin + 1, num_chains, num_sources))
+        sumsqs = np.zeros((burnin + 1, num_chains, num_sources))
+
+    rep = 0
+    while chains.size > 0:
+        rep += 1
+        for order, c in zip(orders, chains):
+            rngs[c].shuffle(order)
+        for i, c in enumerate(chains):
+            uniforms[i] = rngs[c].random(sink_sum)
+
+        if lockstep:
+            unknown_sum = gibbs_pass(orders, seq_env_assignments,
+                                     chain_sequences, envcounts,
+                                     unknown_vector, unknown_sum, uniforms,
+                                     cp)
+        else:
+            for i in range(chains.size):
+                unknown_sum[i] = gibbs_pass(orders[i], seq_env_assignments[i],
+                                            chain_sequences[i], envcounts[i],
+                                            unknown_vector[i], unknown_sum[i],
+                                            uniforms[i], cp)
+
+        sinks = chain_sinks[chains]
+        if adaptive and (burnt_in[sinks] < 0).any():
+            burning = burnt_in[sinks] < 0
+            proportions = envcounts[burning] / sink_sum
+            burning_chains = chains[burning]
+            sums[rep, burning_chains] = \
+                sums[rep - 1, burning_chains] + proportions
+            sumsqs[rep, burning_chains] = \
+                sumsqs[rep - 1, burning_chains] + proportions ** 2
+            half = rep // 2
+            for sink in np.unique(sinks[burning]):
+                cs = np.arange(sink * restarts, (sink + 1) * restarts)
+                if rep >= MIN_ADAPTIVE_BURNIN:
+                    converged = (_potential_scale_reduction(
+                        sums[rep, cs] - sums[half, cs],
+                        sumsqs[rep, cs] - sumsqs[half, cs],
+                        rep - half) < rhat).all()
+                else:
+                    converged = False
+                if converged or rep == burnin:
+                    burnt_in[sink] = rep
+
+        since = rep - burnt_in[sinks] - 1
+        drawing = (burnt_in[sinks] >= 0) & (since >= 0) & \
+            (since % delay == 0)
+        if drawing.any():
+            rows = draw_rows[chains[drawing]]
+            final_envcounts[sinks[drawing], rows] = envcounts[drawing]
+            if accumulate_draws:
+                for i in np.flatnonzero(drawing):
+                    _count_assignments(feature_counts[sinks[i]],
+                                       seq_env_assignments[i],
+                                       chain_sequences[i])
+            else:
+                final_env_assignments[sinks[drawing], rows] = \
+                    seq_env_assignments[drawing]
+            draw_rows[chains[drawing]] += 1
+
+        growing = (burnt_in[sinks] < 0) | (since < draw_passes - 1)
+        if not growing.all():
+            chains = chains[growing]
+            orders = orders[growing]
+            seq_env_assignments = seq_env_assignments[growing]
+            chain_sequences = chain_sequences[growing]
+            envcounts = envcounts[growing]
+            unknown_vector = unknown_vector[growing]
+            unknown_sum = unknown_sum[growing]
+            uniforms = uniforms[growing]
+
+    if accumulate_draws:
+        return final_envcounts, feature_counts, burnt_in + draw_passes
+    return final_envcounts, final_env_assignments, burnt_in + draw_passes
+
+
+def gibbs_sampler_batch(sinks, cp, restarts, draws_per_restart, burnin, delay,
+                        engine='vectorized', seeds=None, sparse_model=False,
+                        adaptive_burnin=False, rhat=1.1,
+                        accumulate_draws=False):
+    '''Run the Gibbs sampler on several sinks which share a source model.
+
+    Parameters
+    ----------
+    sinks : np.array or scipy.sparse.csr_matrix
+        2D array of ints. Rows are sinks, columns are features. With a
+        `sparse_model` CSR sinks are only densified over the features present
+        in them.
+    cp, restarts, draws_per_restart, burnin, delay, engine, sparse_model
+    adaptive_burnin, rhat, accumulate_draws
+        See `gibbs_sampler`.
+    seeds : list, optional
+        The `seed` (see `gibbs_sampler`) of each sink. If `None`, the global
+        `np.random` state is used for all sinks.
+
+    Returns
+    -------
+    list
+        The ith entry is the `gibbs_sampler` output (a tuple of
+        `final_envcounts`, `final_env_assignments` and
+        `final_taxon_assignments`, or `final_envcounts` and `feature_counts`
+        with `accumulate_draws`, followed by `passes` with `adaptive_burnin`)
+        for the ith sink.
+
+    Notes
+    -----
+    With an engine from `LOCKSTEP_ENGINES` sinks are grouped by depth, `cp`
+    is precalculated once per depth (so rarefied sinks share a single
+    precalculation) and all restarts of all sinks in a group are advanced
+    together, so many shallow sinks are sampled at array speed. With
+    `adaptive_burnin` each sink of a group stops burning in on its own and
+    its chains are dropped once its draws are made. With
+    `sparse_model` a group shares a model restricted to the union of its
+    sinks' features. Other
+    engines sample the sinks one after another in the order given, reusing
+    the precalculation of `cp` between consecutive sinks of equal depth.
+    '''
+    gibbs_pass = get_sampler_engine(engine)
+    if sparse_model and scipy.sparse.issparse(sinks):
+        sinks = sinks.tocsr().astype(np.int32)
+        depths = np.asarray(sinks.sum(1)).ravel()
+    else:
+        sinks = np.asarray(_dense(sinks)).astype(np.int32)
+        depths = sinks.sum(1)
+    total_draws = restarts * draws_per_restart
+    if seeds is None:
+        seeds = [None] * sinks.shape[0]
+    if adaptive_burnin:
+        _validate_adaptive_burnin(restarts, rhat, False)
+
+    if engine not in LOCKSTEP_ENGINES:
+        return [gibbs_sampler(sink, cp, restarts, draws_per_restart, burnin,
+                              delay, engine=engine, seed=seed,
+                              sparse_model=sparse_model,
+                              adaptive_burnin=adaptive_burnin, rhat=rhat,
+                              accumulate_draws=accumulate_draws)
+                for sink, seed in zip(_rows(sinks), seeds)]
+
+    results = [None] * sinks.shape[0]
+    for depth in np.unique(depths):
+        group = np.flatnonzero(depths == depth)
+        features, taxon_sequences = _model_columns(sinks[group], sparse_model)
+        cp.set_n(depth)
+        cp.precalculate(features)
+        rngs = [rng for i in group for rng in
+                _restart_rngs(seeds[i], restarts)]
+        envcounts, draws, passes = _grow_chains(
+            gibbs_pass, taxon_sequences, cp, restarts, draws_per_restart,
+            burnin, delay, rngs, rhat=rhat if adaptive_burnin else None,
+            accumulate_draws=accumulate_draws)
+        for j, i in enumerate(group):
+            if accumulate_draws:
+                results[i] = (envcounts[j], _feature_counts(draws[j], features,
+                                                            sinks.shape[1]))
+            else:
+                feature_sequence = _feature_sequence(features,
+                                                     taxon_sequences[j])
+                results[i] = (envcounts[j], draws[j],
+                              np.tile(feature_sequence, (total_draws, 1)))
+            if adaptive_burnin:
+                results[i] += (passes[j],)
+    return results
+
+
+def feature_block_gibbs_sampler(sink, cp, restarts, draws_per_restart,
+                                burnin, delay, seed=None, sparse_model=False,
+                                accumulate_draws=False):
+    """Run a Gibbs sampler whose state is a (feature x environment) table.
+
+    Parameters
+    ----------
+    sink, cp, restarts, draws_per_restart, burnin, delay, seed, sparse_model
+    accumulate_draws
+        See `gibbs_sampler`.
+
+    Returns
+    -------
+    final_envcounts, final_env_assignments, final_taxon_assignments
+        See `gibbs_sampler` (`final_envcounts` and `feature_counts` with
+        `accumulate_draws`). The assignments are expanded from the feature
+        counts only when a draw is taken, in the same `np.repeat` ordering of
+        the sink that `gibbs_sampler` uses.
+
+    Notes
+    -----
+    Instead of withdrawing and reassigning each sequence of the sink, every
+    pass visits each feature present in the sink (in random order) and
+    reassigns all of its sequences as a block with a single multinomial draw
+    from `ConditionalProbability.calculate_cp_slice`. The cost of a pass
+    therefore scales with the number of distinct features in the sink rather
+    than with its depth.
+
+    The conditional used for a block is the one an average sequence of that
+    feature sees in the per-sequence sampler: the counts with a single
+    sequence withdrawn in proportion to the block's current assignments. The
+    remaining sequences of the block stay in place, so a feature which is
+    largely assigned to the 'unknown' environment keeps reinforcing it as it
+    would in `gibbs_sampler`. Sequences within a block do not see each
+    other's new assignments, so this is an approximation of the per-sequence
+    sampler; its mixing proportions agree with `gibbs_sampler` to within the
+    variability between restarts.
+    """
+    num_sources = cp.V
+    sink = sink.astype(np.int32)
+    sink_sum = sink.sum()
+
+    total_draws = restarts * draws_per_restart
+    total_passes = burnin + (draws_per_restart - 1) * delay + 1
+
+    # Only the features present in the sink carry any state.
+    features = np.flatnonzero(sink)
+    feature_counts = sink[features]
+
+    final_envcounts = np.zeros((total_draws, num_sources), dtype=np.int32)
+    if accumulate_draws:
+        draw_counts = np.zeros((features.size, num_sources), dtype=np.int64)
+    else:
+        final_env_assignments = np.zeros((total_draws, sink_sum),
+                                         dtype=np.int32)
+        final_taxon_assignments = np.zeros((total_draws, sink_sum),
+                                           dtype=np.int32)
+    taxon_sequence = np.repeat(features, feature_counts).astype(np.int32)
+    env_sequence = np.tile(np.arange(num_sources, dtype=np.int32),
+                           features.size)
+    order = np.arange(features.size)
+    uniform = np.ones(num_sources) / num_sources
+
+    cp.set_n(sink_sum)
+    if sparse_model:
+        cp.precalculate(features)
+        columns = np.arange(features.size)
+    else:
+        cp.precalculate()
+        columns = features
+
+    drawcount = 0
+    for rng in _restart_rngs(seed, restarts):
+        # Assigning each sequence of a feature uniformly at random is a
+        # multinomial draw of the feature's count.
+        assignments = np.array([rng.multinomial(c, uniform) for c in
+                                feature_counts], dtype=np.int64)
+        assignments = assignments.reshape(features.size, num_sources)
+        envcounts = assignments.sum(0)
+        unknown_sum = assignments[:, -1].sum()
+
+        for rep in range(1, total_passes + 1):
+            rng.shuffle(order)
+            for i in order:
+                # Withdraw one average sequence of the feature.
+                share = assignments[i] / feature_counts[i]
+                jp = cp.calculate_cp_slice(columns[i],
+                                           assignments[i, -1] - share[-1],
+                                           unknown_sum - share[-1],
+                                           envcounts - share)
+                jp = np.asarray(jp, dtype=np.float64)
+                new_assignments = rng.multinomial(feature_counts[i],
+                                                  jp / jp.sum())
+
+                envcounts += new_assignments - assignments[i]
+                unknown_sum += new_assignments[-1] - assignments[i, -1]
+                assignments[i] = new_assignments
+
+            if rep > burnin and ((rep - (burnin + 1)) % delay) == 0:
+                final_envcounts[drawcount] = envcounts
+                if accumulate_draws:
+                    draw_counts += assignments
+                else:
+                    final_env_assignments[drawcount] = \
+                        np.repeat(env_sequence, assignments.ravel())
+                    final_taxon_assignments[drawcount] = taxon_sequence
+                drawcount += 1
+
+    if accumulate_draws:
+        return (final_envcounts,
+                _feature_counts(draw_counts.T, features, sink.size))
+    return (final_envcounts, final_env_assignments, final_taxon_assignments)
+
+
+# The models of the runs of `gibbs` run in this process by in-process
+# executors, keyed by the token of the run. See `_publish_model`.
+_local_models = {}
+# The models used by the tasks run in this thread, keyed by the token of the
+# run. Each thread has its own since a model holds the state of its sink.
+_thread_models = threading.local()
+
+
+def _share_arrays(arrays):
+    '''Copy each array in `arrays` into its own shared memory block.
+
+    Parameters
+    ----------
+    arrays : dict
+        Arrays to share, keyed by name.
+
+    Returns
+    -------
+    blocks : list
+        The `shared_memory.SharedMemory` blocks. The caller must `close` and
+        `unlink` them once the workers are done.
+    specs : dict
+        (block name, shape, dtype) of each array, keyed like `arrays`. These
+        are all a worker needs to attach to the arrays.
+    '''
+    blocks = []
+    specs = {}
+    for key, array in arrays.items():
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=max(array.nbytes, 1))
+        blocks.append(shm)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        specs[key] = (shm.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def _attach_shared_model(cp, specs):
+    '''Attach to the source model shared by `gibbs`.
+
+    Parameters
+    ----------
+    cp : ConditionalProbability
+        The model without its source arrays, which are taken from the shared
+        `m_xivs`, `m_vs` and (if it was shared) `known_p_tv` arrays.
+    specs : dict
+        See `_share_arrays`.
+
+    Returns
+    -------
+    cp : ConditionalProbability
+        A copy of `cp` whose shared arrays are read-only views of the shared
+        memory, not copies.
+    blocks : list
+        The attached `shared_memory.SharedMemory` blocks. The views are only
+        valid while these are open.
+    '''
+    blocks = []
+    arrays = {}
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        blocks.append(shm)
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        array.flags.writeable = False
+        arrays[key] = array
+    cp = copy(cp)
+    cp.m_xivs = arrays['m_xivs']
+    cp.m_vs = arrays['m_vs']
+    if 'known_p_tv' in arrays:
+        cp.known_p_tv = arrays['known_p_tv']
+    return cp, blocks
+
+
+# How the tasks run by each built-in executor get the model, see
+# `_publish_model`.
+_MODEL_KINDS = {'serial': 'local', 'thread': 'local', 'process': 'shared',
+                'socket': 'pickled'}
+
+
+def _model_kind(executor):
+    if isinstance(executor, str):
+        return _MODEL_KINDS[executor]
+    if isinstance(executor, (SerialExecutor, ThreadPoolExecutor)):
+        return 'local'
+    if isinstance(executor, ProcessPoolExecutor):
+        return 'shared'
+    return 'pickled'
+
+
+def _publish_model(cp, executor, share_known_p_tv=False):
+    '''Make the source model available to the tasks run by `executor`.
+
+    Parameters
+    ----------
+    cp : ConditionalProbability
+        The model shared by every task of a run of `gibbs`.
+    executor : str or Executor
+        The executor the tasks will be run on, or the name of a built-in one
+        (see `get_executor`).
+    share_known_p_tv : bool, optional
+        If `True` and the tasks run on this machine, `known_p_tv` is computed
+        for all features once here and shared by every thread (or, with a
+        process pool, every process). Pass it unless the tasks only use a
+        `sparse_model`, which computes its own.
+
+    Returns
+    -------
+    model : tuple
+        The handle of the model, passed to `_get_model` by every task.
+    close : function
+        Releases the model once the tasks are done.
+
+    Notes
+    -----
+    How the model reaches a task depends on where the executor runs it.
+    Executors running tasks in this process (threads, or serially) look it up
+    in `_local_models`, and their threads share its arrays rather than each
+    holding copies. Process pools on this machine attach to a copy of the
+    source arrays in shared memory. Any other executor, which may run tasks
+    on other machines, is sent the pickled model with each task. Every worker
+    thread unpacks the model once per run, on its first task.
+    '''
+    token = uuid.uuid4().hex
+    kind = _model_kind(executor)
+    if share_known_p_tv and kind != 'pickled' and cp.known_p_tv is None:
+        cp._calculate_known_p_tv(None)
+    if kind == 'local':
+        _local_models[token] = cp
+
+        def close():
+            _local_models.pop(token, None)
+            # Serial tasks ran in this thread.
+            getattr(_thread_models, 'models', {}).pop(token, None)
+        return ('local', token, None), close
+    if kind == 'shared':
+        arrays = {'m_xivs': cp.m_xivs, 'm_vs': cp.m_vs}
+        if cp.known_p_tv is not None:
+            arrays['known_p_tv'] = cp.known_p_tv
+        template = copy(cp)
+        template.m_xivs = template.m_vs = template.known_p_tv = None
+        blocks, specs = _share_arrays(arrays)
+
+        def close():
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+        return ('shared', token, (template, specs)), close
+    payload = pickle.dumps(cp, protocol=pickle.HIGHEST_PROTOCOL)
+    return ('pickled', token, payload), lambda: None
+
+
+def _get_model(model):
+    '''Return the source model of a task, see `_publish_model`.'''
+    kind, token, payload = model
+    if not hasattr(_thread_models, 'models'):
+        _thread_models.models = {}
+    models = _thread_models.models
+    if token not in models:
+        # Release the models of earlier runs before loading this one. The
+        # views of a shared model must be gone before its blocks are closed.
+        blocks = [shm for cp, cp_blocks in models.values()
+                  for shm in cp_blocks]
+        models.clear()
+        for shm in blocks:
+            shm.close()
+        if kind == 'local':
+            models[token] = (_local_models[token].copy(), [])
+        elif kind == 'shared':
+            models[token] = _attach_shared_model(*payload)
+        else:
+            models[token] = (pickle.loads(payload), [])
+    return models[token][0]
+
+
+def _load_model(model):
+    '''Load the model of a run in a worker ahead of its tasks.'''
+    _get_model(model)
+
+
+def _model_task(f, model, indexed_task):
+    index, task = indexed_task
+    return index, f(task, _get_model(model))
+
+
+def _gibbs_loo(task, cp, **kwargs):
+    index, sink, seed, restarts = task
+    return gibbs_sampler(sink, cp.hold_out(index), restarts, seed=seed,
+                         **kwargs)
+
+
+def _gibbs_sink(task, cp, **kwargs):
+    sink, seed, restarts = task
+    return gibbs_sampler(sink, cp, restarts, seed=seed, **kwargs)
+
+
+def _gibbs_batch(task, cp, **kwargs):
+    sinks, seeds, restarts = task
+    return gibbs_sampler_batch(sinks, cp, restarts, seeds=seeds, **kwargs)
+
+
+def _schedule_restart_chunks(depths, restarts, passes, jobs,
+                             split_restarts=True):
+    '''Split the work of `gibbs` into (unit, restart chunk) tasks.
+
+    Parameters
+    ----------
+    depths : list
+        The number of sequences in each unit of work (a sink, or a batch of
+        sinks sampled together).
+    restarts : int
+        Number of restarts of every sink.
+    passes : int
+        Number of passes made by each restart.
+    jobs : int
+        Number of processes the tasks will be run on.
+    split_restarts : bool, optional
+        If `False`, every unit is a single task holding all restarts.
+
+    Returns
+    -------
+    list
+        (unit, start, stop) tuples. The task runs restarts `start` to `stop`
+        of `unit`. The tasks are sorted by their estimated cost (depth x
+        passes x restarts), longest first.
+
+    Notes
+    -----
+    When there are fewer units than `jobs`, the restarts of every unit are
+    split into enough chunks to give each process work. Handing out the
+    longest tasks first keeps a deep sink from being started last and
+    holding up the end of the run.
+    '''
+    chunks = 1
+    if split_restarts and len(depths) > 0:
+        chunks = min(restarts, -(-jobs // len(depths)))
+    tasks = []
+    for unit, depth in enumerate(depths):
+        for chunk in np.array_split(np.arange(restarts), chunks):
+            cost = depth * passes * chunk.size
+            tasks.append((cost, unit, chunk[0], chunk[-1] + 1))
+    tasks.sort(key=lambda task: task[0], reverse=True)
+    return [task[1:] for task in tasks]
+
+
+def _chunk_seeds(seed, restarts, start, stop):
+    '''Return the seeds of restarts `start` to `stop` of a sink.'''
+    if seed is None:
+        return None
+    return spawn_seeds(seed, restarts)[start:stop]
+
+
+def _merge_restart_chunks(results):
+    '''Combine accumulated `gibbs_sampler` results of consecutive chunks.'''
+    if len(results) == 1:
+        return results[0]
+    return (np.vstack([result[0] for result in results]),
+            sum(result[1] for result in results))
+
+
+def parse_memory(memory):
+    '''Return a number of bytes given as an int or a string like '16G'.
+
+    Parameters
+    ----------
+    memory : int, str or None
+        Bytes, or a number followed by one of the (binary) units K, M, G or
+        T, e.g. '512M' or '1.5G'. `None` is returned as it is.
+
+    Returns
+    -------
+    int or None
+
+    Raises
+    ------
+    ValueError
+        If `memory` is not a positive amount of memory.
+    '''
+    if memory is None:
+        return None
+    if isinstance(memory, str):
+        match = re.fullmatch(r'\s*(\d+(?:\.\d*)?)\s*([KMGT]?)B?\s*',
+                             memory.upper())
+        if match is None:
+            raise ValueError('%r is not an amount of memory, e.g. 512M or 16G.'
+                             % memory)
+        power = ' KMGT'.index(match.group(2) or ' ')
+        memory = int(float(match.group(1)) * 1024 ** power)
+    if not isinstance(memory, (int, np.integer)) or memory <= 0:
+        raise ValueError('The memory must be a positive number of bytes, not '
+                         '%r.' % memory)
+    return int(memory)
+
+
+def _validate_jobs(jobs):
+    if jobs == 'auto':
+        return
+    if not isinstance(jobs, (int, np.integer)) or jobs < 1:
+        raise ValueError("`jobs` must be a positive integer or 'auto', not "
+                         "%r." % (jobs,))
+
+
+def _available_cpus():
+    '''Return the number of CPUs this process may run on.'''
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+def _task_memory(depth, num_sinks, restarts, num_sources, num_columns,
+                 chains_together):
+    '''Estimate the bytes a task of `gibbs` allocates while it runs.
+
+    Parameters
+    ----------
+    depth : int
+        Number of sequences in each sink of the task.
+    num_sinks : int
+        Number of sinks sampled by the task.
+    restarts : int
+        Number of restarts of each sink run by the task.
+    num_sources : int
+        Number of environments, V (including the unknown).
+    num_columns : int
+        Number of model columns of a sink (the features, or only those in the
+        sink with a sparse model).
+    chains_together : bool
+        If `True` the restarts are grown together (lockstep engines and
+        adaptive burn-in), otherwise one after another.
+
+    Returns
+    -------
+    int
+
+    Notes
+    -----
+    A restart keeps a handful of arrays with an entry per sequence (feature,
+    environment and visiting order of every sequence, and the uniforms of a
+    pass) of 44 bytes per sequence in all. Chains grown together keep about
+    24 bytes per sequence each. Each sink also accumulates a (V, columns)
+    table of its draws. This is an estimate for admission control, not an
+    exact account.
+    '''
+    tables = 16 * num_sources * num_columns
+    if chains_together:
+        return num_sinks * (restarts * 24 * depth + 4 * depth + tables)
+    return num_sinks * (44 * depth + tables)
+
+
+def _model_memory(num_sources, num_columns, itemsize):
+    '''Estimate the bytes of the model precalculated by each worker.
+
+    `known_p_tv` and `known_source_cp` have a row per known source and a
+    column per model column.
+    '''
+    return 2 * (num_sources - 1) * num_columns * itemsize
+
+
+def _unit_memory(depths, columns, unit, restarts, num_sources,
+                 chains_together):
+    '''Estimate the bytes of a task sampling the sinks at positions `unit`.
+
+    `depths` and `columns` hold the depth and number of model columns of
+    every sink. The sinks of a lockstep batch are summed, which overestimates
+    batches with sinks of different depths since those are run one after
+    another.
+    '''
+    return sum(_task_memory(int(depths[i]), 1, restarts, num_sources,
+                            int(columns[i]), chains_together) for i in unit)
+
+
+def _resolve_jobs(jobs, executor, max_tasks, worker_memory, task_memory,
+                  max_memory):
+    '''Return the number of jobs to run `gibbs` with.
+
+    Parameters
+    ----------
+    jobs : int or 'auto'
+        See `gibbs`. An int is returned as it is.
+    executor : str or Executor
+        See `gibbs`. With 'auto', an executor object's number of workers is
+        used if it can be told, otherwise the number of CPUs.
+    max_tasks : int
+        The most tasks the run can be split into.
+    worker_memory : int
+        Bytes each worker holds in addition to its task, see `_model_memory`.
+    task_memory : int
+        Bytes of the largest task, see `_task_memory`.
+    max_memory : int or None
+        Memory budget of the workers in bytes.
+
+    Returns
+    -------
+    int
+        With 'auto', the number of CPUs (or workers), but no more than the
+        number of tasks or than fit in `max_memory` running their largest
+        task. Always at least 1.
+    '''
+    if jobs != 'auto':
+        return jobs
+    jobs = _available_cpus()
+    if not isinstance(executor, str):
+        jobs = getattr(executor, '_max_workers',
+                       getattr(executor, 'num_workers', jobs))
+    jobs = min(jobs, max_tasks)
+    if max_memory is not None:
+        jobs = min(jobs, max_memory // (worker_memory + task_memory))
+    return max(jobs, 1)
 
 
 def gibbs(sources, sinks=None, alpha1=.001, alpha2=.1, beta=10, restarts=10,
           draws_per_restart=1, burnin=100, delay=1, jobs=1,
-          create_feature_tables=True):
+          create_feature_tables=True, engine='python', feature_blocks=False,
+          seed=None, sparse_model=False, dtype=np.float64,
+          adaptive_burnin=False, rhat=1.1, checkpoint_dir=None,
+          executor='process', max_memory=None):
     '''Gibb's sampling API.
 
     Notes
@@ -635,10 +2366,12 @@ def gibbs(sources, sinks=None, alpha1=.001, alpha2=.1, beta=10, restarts=10,
     sources : DataFrame
         A dataframe containing source data (rows are sources, columns are
         features). The index must be the names of the sources.
-    sinks : DataFrame or None
+    sinks : DataFrame, SparseFeatureTable or None
         A dataframe containing sink data (rows are sinks, columns are
         features). The index must be the names of the sinks. If `None`,
-        leave-one-out (LOO) prediction will be done.
+        leave-one-out (LOO) prediction will be done. A `SparseFeatureTable`
+        is never densified as a whole: each sink is densified by the task
+        sampling it. Results are identical to those of the dense table.
     alpha1 : float
         Prior counts of each feature in the training environments. Higher
         values decrease the trust in the training environments, and make
@@ -671,15 +2404,96 @@ def gibbs(sources, sinks=None, alpha1=.001, alpha2=.1, beta=10, restarts=10,
         additional samples will be drawn every `delay` number of passes. This
         is also known as 'thinning'. Thinning helps reduce the impact of
         correlation between adjacent states of the Markov chain.
-    jobs : int
+    jobs : int or 'auto'
         The number of jobs to start. Typically not more than n-1 available
-        processors
+        processors. With a `seed` and fewer sinks than jobs, the restarts of
+        each sink are split between jobs (see `_schedule_restart_chunks`).
+        With an executor object, this should be its number of workers.
+        'auto' starts one job per available CPU (or uses every worker of an
+        executor object), but no more jobs than there are tasks or than fit
+        in `max_memory`.
     create_feature_tables : boolean
         If `True` create a feature table for each sink. The feature table
         records the average count of each feature from each source for this
         sink. This option can consume large amounts of memory if there are many
         source, sinks, and features. If `False`, feature tables are not
         created.
+    engine : str
+        Implementation of the innermost loop of the sampler. 'python' (the
+        default) is the reference implementation. 'numba' compiles the loop
+        and is typically one to two orders of magnitude faster; it requires
+        the optional numba dependency. Both engines give identical results
+        for the same PRNG state. 'vectorized' advances all `restarts` chains
+        of a sink in lockstep with array operations, which pays off as the
+        number of restarts grows. Without LOO it also batches the sinks of
+        each job that have equal depth (e.g. rarefied sinks) into one
+        lockstep run sharing a single precalculated source model, see
+        `gibbs_sampler_batch`. It draws the same random numbers in a
+        different order, so its results are statistically equivalent to
+        (but not identical with) the other engines for a given PRNG state.
+    feature_blocks : boolean
+        If `True`, each pass of the sampler reassigns all sequences of a
+        feature together with a single multinomial draw instead of one
+        sequence at a time. The cost of a pass then scales with the number of
+        distinct features in a sink rather than its depth, which makes deep
+        sinks much cheaper. This is an approximation of the standard sampler;
+        see `feature_block_gibbs_sampler`. Requires `engine='python'`.
+    seed : int, np.random.SeedSequence, np.random.Generator or None
+        Seed for the PRNG. If given, every sink (or source with LOO) and
+        every restart within it draws from its own independent stream derived
+        from `seed` (see `spawn_seeds`), so results are reproducible
+        regardless of `jobs` and identical across engines. A generator is
+        drawn from once per call for the root of these streams, and so is
+        advanced by it. If `None` (the default) the global `np.random` state
+        is used as in earlier versions.
+    sparse_model : boolean
+        If `True`, the source model is precalculated for each sink only over
+        the features present in that sink rather than over all features.
+        This reduces the time and memory spent per sink by orders of
+        magnitude for wide, sparse tables. Results are identical.
+    dtype : str or np.dtype
+        Floating point type of the source model, 'float64' (the default) or
+        'float32'. float32 halves the memory of the source model, which is
+        copied to every job. See `ConditionalProbability` for its accuracy.
+    adaptive_burnin : boolean
+        If `True`, `burnin` is an upper bound on the number of burn-in passes.
+        The restarts of each sink are grown together and each sink stops
+        burning in as soon as the Gelman-Rubin R-hat between its restarts,
+        over the second half of the passes made so far, is below `rhat` for
+        every environment. Requires `restarts` >= 2 and cannot be combined
+        with `feature_blocks`.
+    rhat : float
+        Convergence threshold of adaptive burn-in, greater than 1.
+    checkpoint_dir : str or None
+        If given, the result of every sink is saved in this directory as soon
+        as it is done, together with a manifest of the inputs and parameters.
+        Rerunning with the same inputs and parameters (a `seed` should be
+        given for the results to be reproducible) loads the saved sinks and
+        only samples the rest. A checkpoint of a run with different inputs or
+        parameters raises a ValueError. `jobs` and `executor` may differ.
+    executor : str or Executor
+        What runs the tasks (sinks, or chunks of their restarts). 'process'
+        (the default) runs them on a pool of `jobs` processes, 'thread' on a
+        pool of `jobs` threads and 'serial' one after another in this
+        process. 'socket' starts `jobs` local workers of a `SocketExecutor`,
+        which stands in for workers on other machines. Any object with the
+        `submit` method of a `concurrent.futures.Executor` is used as it is
+        (and is not shut down), e.g. a persistent process pool or a
+        `SocketExecutor` connected to workers on other machines. Given a
+        `seed`, the results are identical whichever executor is used.
+        Threads share one copy of the source model. The compiled loop of the
+        'numba' engine releases the GIL, so with it 'thread' samples in
+        parallel without the start-up cost and memory of extra processes;
+        the 'python' engine holds the GIL and gains little from threads.
+    max_memory : int, str or None
+        Memory budget of the run, in bytes or as a string like '16G'. The
+        memory of every task is estimated from the depth of its sinks, its
+        restarts and the size of the model (see `_task_memory`), and tasks
+        are only started while the estimates of the running tasks, the
+        models of the workers and the shared source data fit in the budget.
+        A task that does not fit on its own is run alone. The estimates are
+        approximate, so leave some headroom. With `jobs='auto'` it also caps
+        the number of jobs. If `None` (the default), there is no budget.
 
     Returns
     -------
@@ -693,6 +2507,9 @@ def gibbs(sources, sinks=None, alpha1=.001, alpha2=.1, beta=10, restarts=10,
     fas : list
         ith item is a pd.DataFrame of the average feature assignments from each
         source for the ith sink (in the same order as rows of `mpm` and `mps`).
+    passes : Series
+        Only returned if `adaptive_burnin` is `True`. The number of passes
+        made by each restart of each sink (rows of `mpm`).
 
     Examples
     --------
@@ -745,57 +2562,655 @@ def gibbs(sources, sinks=None, alpha1=.001, alpha2=.1, beta=10, restarts=10,
     ...       beta=beta,restarts=restarts, draws_per_restart=draws_per_restart,
     ...        burnin=burnin, delay=delay,jobs=1, create_feature_tables=True)
     '''
+    sources, sinks = _validate_gibbs(sources, sinks, alpha1, alpha2, beta,
+                                     restarts, draws_per_restart, burnin,
+                                     delay, engine, feature_blocks,
+                                     adaptive_burnin, rhat, executor, jobs,
+                                     max_memory)
+    results = _sample_sinks(sources, sinks, alpha1, alpha2, beta, restarts,
+                            draws_per_restart, burnin, delay, jobs, engine,
+                            feature_blocks, seed, sparse_model, dtype,
+                            adaptive_burnin, rhat, checkpoint_dir, executor,
+                            max_memory)
+    return _collate_sinks(results, sources, sinks, create_feature_tables,
+                          adaptive_burnin)
+
+
+def gibbs_replicates(replicates, alpha1=.001, alpha2=.1, beta=10,
+                     restarts=10, draws_per_restart=1, burnin=100, delay=1,
+                     jobs=1, create_feature_tables=True, engine='python',
+                     feature_blocks=False, seed=None, sparse_model=False,
+                     dtype=np.float64, adaptive_burnin=False, rhat=1.1,
+                     executor='process', max_memory=None):
+    '''Run `gibbs` on replicates of the data and pool their draws.
+
+    Parameters
+    ----------
+    replicates : list
+        (sources, sinks) tuples, e.g. rarefactions of the same sources and
+        sinks (see `subsample_dataframe`). All sources must have the same
+        IDs and features, and so must all sinks. The sinks are `None` for
+        LOO predictions, see `gibbs`.
+    alpha1, alpha2, beta, restarts, draws_per_restart, burnin, delay, jobs
+    create_feature_tables, engine, feature_blocks, sparse_model, dtype
+    adaptive_burnin, rhat, executor, max_memory
+        See `gibbs`.
+    seed : int, np.random.SeedSequence, np.random.Generator or None
+        Root seed. The ith replicate is sampled with the ith seed that
+        `spawn_seeds` derives from it, see `gibbs`.
+
+    Returns
+    -------
+    tuple
+        See `gibbs`. The mixing proportions and their standard deviations of
+        a sink are those of the draws of all replicates together, and its
+        feature table is the sum of those of the replicates. With
+        `adaptive_burnin`, the passes of a sink are the most made in any
+        replicate.
+
+    Raises
+    ------
+    ValueError
+        If the replicates do not have the same sources, sinks and features.
+
+    Notes
+    -----
+    The tasks of every replicate and sink are run on a single executor (see
+    `_execute_runs`), with a model of the sources of each replicate.
+
+    Examples
+    --------
+    >>> replicates = [(subsample_dataframe(source_df, 1000, seed=i),
+    ...                subsample_dataframe(sink_df, 1000, seed=i))
+    ...               for i in range(5)]
+    >>> mpm, mps, fas = gibbs_replicates(replicates, jobs=4, seed=0)
+    '''
+    validated = _validate_replicates(replicates, alpha1, alpha2, beta,
+                                     restarts, draws_per_restart, burnin,
+                                     delay, engine, feature_blocks,
+                                     adaptive_burnin, rhat, executor, jobs,
+                                     max_memory)
+    results = _sample_replicates(validated, alpha1, alpha2, beta, restarts,
+                                 draws_per_restart, burnin, delay, jobs,
+                                 engine, feature_blocks, seed, sparse_model,
+                                 dtype, adaptive_burnin, rhat, executor,
+                                 max_memory)
+    sources, sinks = validated[0]
+    return _collate_sinks(results, sources, sinks, create_feature_tables,
+                          adaptive_burnin)
+
+
+def iter_gibbs_replicates(replicates, alpha1=.001, alpha2=.1, beta=10,
+                          restarts=10, draws_per_restart=1, burnin=100,
+                          delay=1, jobs=1, create_feature_tables=True,
+                          engine='python', feature_blocks=False, seed=None,
+                          sparse_model=False, dtype=np.float64,
+                          adaptive_burnin=False, rhat=1.1,
+                          executor='process', max_memory=None):
+    '''Yield the pooled results of each sink once all replicates are done.
+
+    Parameters
+    ----------
+    replicates, alpha1, alpha2, beta, restarts, draws_per_restart, burnin
+    delay, jobs, create_feature_tables, engine, feature_blocks, seed
+    sparse_model, dtype, adaptive_burnin, rhat, executor, max_memory
+        See `gibbs_replicates`.
+
+    Returns
+    -------
+    generator
+        Yields a `SinkResult` for every sink, see `iter_gibbs`. Its
+        `envcounts` are the draws of all replicates, replicate after
+        replicate.
+    '''
+    validated = _validate_replicates(replicates, alpha1, alpha2, beta,
+                                     restarts, draws_per_restart, burnin,
+                                     delay, engine, feature_blocks,
+                                     adaptive_burnin, rhat, executor, jobs,
+                                     max_memory)
+    results = _sample_replicates(validated, alpha1, alpha2, beta, restarts,
+                                 draws_per_restart, burnin, delay, jobs,
+                                 engine, feature_blocks, seed, sparse_model,
+                                 dtype, adaptive_burnin, rhat, executor,
+                                 max_memory)
+    sources, sinks = validated[0]
+    return (_sink_result(i, result, sources, sinks, create_feature_tables)
+            for i, result in results)
+
+
+def _validate_replicates(replicates, *args):
+    '''Validate the replicates of `gibbs_replicates`, see `_validate_gibbs`.'''
+    if not replicates:
+        raise ValueError('At least one replicate is required.')
+    validated = [_validate_gibbs(sources, sinks, *args)
+                 for sources, sinks in replicates]
+    sources, sinks = validated[0]
+    for r_sources, r_sinks in validated[1:]:
+        if (not r_sources.index.equals(sources.index) or
+                not r_sources.columns.equals(sources.columns) or
+                (r_sinks is None) != (sinks is None) or
+                (sinks is not None and
+                 not r_sinks.index.equals(sinks.index))):
+            raise ValueError('The replicates must have the same sources, '
+                             'sinks and features.')
+    return validated
+
+
+def _sample_replicates(replicates, alpha1, alpha2, beta, restarts,
+                       draws_per_restart, burnin, delay, jobs, engine,
+                       feature_blocks, seed, sparse_model, dtype,
+                       adaptive_burnin, rhat, executor, max_memory):
+    '''Yield (i, result) for every sink, pooled over the `replicates`.
+
+    The result is that of `_sample_sinks`, with the draws of every replicate
+    and the sum of their feature counts. A sink is yielded as soon as all its
+    replicates are done.
+    '''
+    sources, sinks = replicates[0]
+    num_sinks = (sources if sinks is None else sinks).shape[0]
+    runs = [_prepare_run(r_sources, r_sinks, list(range(num_sinks)),
+                         restarts, draws_per_restart, burnin, delay, jobs,
+                         engine, feature_blocks, r_seed, sparse_model, dtype,
+                         adaptive_burnin, rhat, executor, max_memory)
+            for (r_sources, r_sinks), r_seed in
+            zip(replicates, spawn_seeds(seed, len(replicates)))]
+    pooled = [{} for i in range(num_sinks)]
+    for r, i, result in _execute_runs(runs, alpha1, alpha2, beta, dtype,
+                                      executor):
+        pooled[i][r] = result
+        if len(pooled[i]) < len(runs):
+            continue
+        sink_results = [pooled[i][r] for r in range(len(runs))]
+        pooled[i] = None
+        result = (np.concatenate([x[0] for x in sink_results]),
+                  sum(x[1] for x in sink_results))
+        if adaptive_burnin:
+            result += (max(x[2] for x in sink_results),)
+        yield i, result
+
+
+def _collate_sinks(results, sources, sinks, create_feature_tables,
+                   adaptive_burnin):
+    '''Collect the (i, result) of every sink into the results of `gibbs`.'''
+    loo = sinks is None
+    if loo:
+        sinks = sources
+    ordered = [None] * sinks.shape[0]
+    for i, result in results:
+        ordered[i] = result
+
+    # Workers return a (V, features) table of the accumulated draws rather
+    # than the per-draw assignments, which keeps what is sent back from each
+    # task independent of the sink depth and the number of draws.
+    collated = collate_gibbs_results([i[0] for i in ordered], None, None,
+                                     sinks.index, sources.index,
+                                     sources.columns,
+                                     create_feature_tables, loo=loo,
+                                     all_feature_counts=[i[1] for i in
+                                                         ordered])
+    if adaptive_burnin:
+        passes = pd.Series([i[2] for i in ordered], index=sinks.index,
+                           name='passes')
+        return collated + (passes,)
+    return collated
+
+
+SinkResult = namedtuple('SinkResult', ['sink_id', 'proportions',
+                                       'proportions_std', 'feature_table',
+                                       'envcounts', 'passes'])
+
+
+def iter_gibbs(sources, sinks=None, alpha1=.001, alpha2=.1, beta=10,
+               restarts=10, draws_per_restart=1, burnin=100, delay=1, jobs=1,
+               create_feature_tables=True, engine='python',
+               feature_blocks=False, seed=None, sparse_model=False,
+               dtype=np.float64, adaptive_burnin=False, rhat=1.1,
+               checkpoint_dir=None, executor='process', max_memory=None):
+    '''Gibb's sampling API yielding the results of each sink as it finishes.
+
+    Parameters
+    ----------
+    sources, sinks, alpha1, alpha2, beta, restarts, draws_per_restart, burnin
+    delay, jobs, create_feature_tables, engine, feature_blocks, seed
+    sparse_model, dtype, adaptive_burnin, rhat, checkpoint_dir, executor
+    max_memory
+        See `gibbs`.
+
+    Returns
+    -------
+    generator
+        Yields a `SinkResult` for every sink (or source with LOO), in the
+        order in which they finish, with the fields
+        sink_id : the ID of the sink.
+        proportions : pd.Series of floats, the mixing proportions of each
+            source in the sink, i.e. the row of the sink in the first result
+            of `gibbs`.
+        proportions_std : pd.Series of floats, the standard deviation of each
+            entry in `proportions`.
+        feature_table : pd.DataFrame of ints, see `gibbs`, or `None` if
+            `create_feature_tables` is `False`.
+        envcounts : np.array, the count of sequences assigned to each
+            environment in each draw (see `gibbs_sampler`). With LOO the
+            column of the held out source is omitted.
+        passes : int, the passes made by each restart, or `None` if
+            `adaptive_burnin` is `False`.
+
+    Notes
+    -----
+    The arguments are validated when this function is called, the sampling
+    starts when the first result is requested. Only the results of the sinks
+    that have finished but have not yet been consumed are held in memory, so
+    results can be written out as a long run progresses. Given a `seed`, the
+    results are identical to those of `gibbs`.
+
+    Examples
+    --------
+    >>> for result in iter_gibbs(source_df, sink_df, seed=0, jobs=4):
+    ...     result.feature_table.to_csv(result.sink_id + '.txt', sep='\\t')
+    '''
+    sources, sinks = _validate_gibbs(sources, sinks, alpha1, alpha2, beta,
+                                     restarts, draws_per_restart, burnin,
+                                     delay, engine, feature_blocks,
+                                     adaptive_burnin, rhat, executor, jobs,
+                                     max_memory)
+    results = _sample_sinks(sources, sinks, alpha1, alpha2, beta, restarts,
+                            draws_per_restart, burnin, delay, jobs, engine,
+                            feature_blocks, seed, sparse_model, dtype,
+                            adaptive_burnin, rhat, checkpoint_dir, executor,
+                            max_memory)
+    return (_sink_result(i, result, sources, sinks, create_feature_tables)
+            for i, result in results)
+
+
+def _sink_result(i, result, sources, sinks, create_feature_tables):
+    '''Collate the result of the ith sink like `collate_gibbs_results`.'''
+    envcounts, feature_counts = result[:2]
+    source_ids = list(sources.index) + ['Unknown']
+    props = envcounts.sum(0) / envcounts.sum()
+    props_std = (envcounts / envcounts.sum()).std(0)
+    if sinks is None:
+        # The held out source contributes nothing to itself.
+        sink_id = sources.index[i]
+        props = np.insert(props, i, 0)
+        props_std = np.insert(props_std, i, 0)
+        feature_counts = np.insert(feature_counts, i, 0, axis=0)
+    else:
+        sink_id = sinks.index[i]
+    feature_table = None
+    if create_feature_tables:
+        feature_table = pd.DataFrame(feature_counts, index=source_ids,
+                                     columns=sources.columns)
+    return SinkResult(sink_id, pd.Series(props, index=source_ids,
+                                         name=sink_id),
+                      pd.Series(props_std, index=source_ids, name=sink_id),
+                      feature_table, envcounts,
+                      result[2] if len(result) > 2 else None)
+
+
+def _validate_gibbs(sources, sinks, alpha1, alpha2, beta, restarts,
+                    draws_per_restart, burnin, delay, engine, feature_blocks,
+                    adaptive_burnin, rhat, executor='process', jobs=1,
+                    max_memory=None):
+    '''Validate the arguments of `gibbs` and return the validated data.'''
     if not validate_gibbs_parameters(alpha1, alpha2, beta, restarts,
                                      draws_per_restart, burnin, delay):
         raise ValueError('The supplied Gibbs parameters are not acceptable. '
                          'Please review the `gibbs` doc string or call the '
                          'help function in the CLI.')
+    # Fail before any work is done if the engine is unavailable.
+    get_sampler_engine(engine)
+    if feature_blocks:
+        _validate_feature_blocks_engine(engine)
+    if adaptive_burnin:
+        _validate_adaptive_burnin(restarts, rhat, feature_blocks)
+    validate_executor(executor)
+    _validate_jobs(jobs)
+    parse_memory(max_memory)
+
+    # The model of the sources is dense, so sparse sources are densified.
+    # Sparse sinks stay sparse, each is densified by the task sampling it.
+    if isinstance(sources, SparseFeatureTable):
+        sources = sources.to_dataframe()
 
     # Validate the input source and sink data. Error if the data do not meet
     # the critical assumptions or cannot be cast to the proper type.
     if sinks is not None:
-        sources, sinks = validate_gibbs_input(sources, sinks)
-    else:
-        sources = validate_gibbs_input(sources)
+        return validate_gibbs_input(sources, sinks)
+    return validate_gibbs_input(sources), None
+
+
+def _sample_sinks(sources, sinks, alpha1, alpha2, beta, restarts,
+                  draws_per_restart, burnin, delay, jobs, engine,
+                  feature_blocks, seed, sparse_model, dtype, adaptive_burnin,
+                  rhat, checkpoint_dir=None, executor='process',
+                  max_memory=None):
+    '''Run the sampler of `gibbs` on every sink.
+
+    Parameters
+    ----------
+    sources, sinks
+        Validated source and sink data (see `gibbs`). If `sinks` is `None`,
+        LOO prediction is done on `sources`.
+    alpha1, alpha2, beta, restarts, draws_per_restart, burnin, delay, jobs
+    engine, feature_blocks, seed, sparse_model, dtype, adaptive_burnin, rhat
+    checkpoint_dir, executor, max_memory
+        See `gibbs`.
+
+    Returns
+    -------
+    generator
+        Yields (i, result) for every sink as it finishes, where i is the
+        position of the sink in `sinks` (or of the source in `sources`) and
+        result is the result of `gibbs_sampler` with
+        `accumulate_draws=True`. Sinks already in the checkpoint are yielded
+        first.
+
+    Raises
+    ------
+    ValueError
+        If `checkpoint_dir` holds the checkpoint of a different run. This is
+        checked when the function is called.
+    '''
+    num_sinks = (sources if sinks is None else sinks).shape[0]
+    # A generator is drawn from once, before it is recorded in the manifest.
+    seed = _root_seed(seed)
+    done = {}
+    if checkpoint_dir is not None:
+        # `jobs`, `executor` and `max_memory` are left out since they do not
+        # change the results.
+        parameters = {'alpha1': alpha1, 'alpha2': alpha2, 'beta': beta,
+                      'restarts': restarts,
+                      'draws_per_restart': draws_per_restart,
+                      'burnin': burnin, 'delay': delay, 'engine': engine,
+                      'feature_blocks': feature_blocks, 'seed': seed,
+                      'sparse_model': sparse_model,
+                      'dtype': np.dtype(dtype).name,
+                      'adaptive_burnin': adaptive_burnin, 'rhat': rhat}
+        open_checkpoint(checkpoint_dir,
+                        create_manifest(sources, sinks, parameters))
+        done = load_sinks(checkpoint_dir, num_sinks)
+    todo = [i for i in range(num_sinks) if i not in done]
+    return chain(sorted(done.items()),
+                 _run_sinks(sources, sinks, todo, alpha1, alpha2, beta,
+                            restarts, draws_per_restart, burnin, delay, jobs,
+                            engine, feature_blocks, seed, sparse_model, dtype,
+                            adaptive_burnin, rhat, checkpoint_dir, executor,
+                            max_memory))
+
+
+_RunPlan = namedtuple('_RunPlan', ['jobs', 'units', 'tasks', 'memory',
+                                   'task_budget', 'worker_memory',
+                                   'shared_memory'])
+
+
+def _plan_run(sources, sinks, todo, restarts, total_passes, jobs, engine,
+              seed, sparse_model, dtype, adaptive_burnin, executor,
+              max_memory):
+    '''Split the sampling of the sinks at positions `todo` into tasks.
 
+    Parameters
+    ----------
+    sources, sinks, todo
+        See `_run_sinks`. The sinks are not used if they are `None` (LOO).
+    restarts, jobs, engine, seed, sparse_model, dtype, adaptive_burnin
+    executor, max_memory
+        See `gibbs`.
+    total_passes : int
+        Number of passes made by each restart.
+
+    Returns
+    -------
+    _RunPlan
+        jobs : the number of jobs to run, see `_resolve_jobs`.
+        units : list of lists, the positions of the sinks sampled together.
+        tasks : list of (unit, start, stop), see `_schedule_restart_chunks`.
+        memory : the estimated bytes of each task, see `_unit_memory`.
+        task_budget : the bytes the running tasks may take, or `None`.
+        worker_memory : the estimated bytes of the model of each worker.
+        shared_memory : the estimated bytes of the shared source model.
+    '''
+    max_memory = parse_memory(max_memory)
+    counts = _count_matrix(sources if sinks is None else sinks)
+    depths = np.asarray(counts.sum(1)).ravel()
+    columns = np.full(counts.shape[0], counts.shape[1])
+    if sparse_model and sinks is not None:
+        columns = _row_nonzeros(counts)
+    num_sources = sources.shape[0] + 1
+    itemsize = np.dtype(dtype).itemsize
+    chains_together = engine in LOCKSTEP_ENGINES or adaptive_burnin
+    split_restarts = seed is not None and not adaptive_burnin
+
+    # Size the run from estimates of the memory of its parts (see
+    # `_task_memory`): every worker precalculates its own model, on top of
+    # the single shared copy of the source data, and every running task
+    # holds the chains of its sinks.
+    worker_memory = _model_memory(num_sources, columns[todo].max(), itemsize)
+    sink_memory = max(_unit_memory(depths, columns, [i], restarts,
+                                   num_sources, chains_together)
+                      for i in todo)
+    shared_memory = _model_memory(num_sources, counts.shape[1], itemsize)
+    jobs = _resolve_jobs(jobs, executor,
+                         len(todo) * (restarts if split_restarts else 1),
+                         worker_memory, sink_memory,
+                         None if max_memory is None else
+                         max_memory - shared_memory)
+    task_budget = None
+    if max_memory is not None:
+        task_budget = max_memory - shared_memory - jobs * worker_memory
+
+    # Normal prediction with a lockstep engine runs batches of sinks, one
+    # batch per job, or more if that many batches running at once would not
+    # fit in `max_memory`.
+    if sinks is not None and engine in LOCKSTEP_ENGINES:
+        num_batches = jobs
+        while True:
+            units = [list(idx) for idx in np.array_split(todo, num_batches)
+                     if idx.size > 0]
+            if (task_budget is None or num_batches >= len(todo) or
+                    jobs * max(_unit_memory(depths, columns, unit, restarts,
+                                            num_sources, True)
+                               for unit in units) <= task_budget):
+                break
+            num_batches = min(2 * num_batches, len(todo))
+    else:
+        units = [[i] for i in todo]
+
+    # With a seed, every sink (or batch) is split into chunks of restarts when
+    # there are fewer sinks than jobs. Restart i of a sink draws from the ith
+    # stream of its seed whichever chunk it is in, so the results do not
+    # depend on the split. Without a seed the restarts of a sink share the
+    # global PRNG and stay in one task, as does adaptive burn-in, which
+    # compares all restarts of a sink.
+    tasks = _schedule_restart_chunks(
+        [depths[unit].sum() for unit in units], restarts, total_passes,
+        jobs, split_restarts=split_restarts)
+    memory = [_unit_memory(depths, columns, units[unit], stop - start,
+                           num_sources, chains_together)
+              for unit, start, stop in tasks]
+    return _RunPlan(jobs, units, tasks, memory, task_budget, worker_memory,
+                    shared_memory)
+
+
+def _run_sinks(sources, sinks, todo, alpha1, alpha2, beta, restarts,
+               draws_per_restart, burnin, delay, jobs, engine, feature_blocks,
+               seed, sparse_model, dtype, adaptive_burnin, rhat,
+               checkpoint_dir, executor, max_memory=None, model=None):
+    '''Yield the results of the sinks at positions `todo`, see `_sample_sinks`.
+
+    If `model` is given, it is the handle of the model of `sources` already
+    published on `executor` (see `_publish_model`), which is then used as it
+    is rather than published for this run.
+    '''
+    if not todo:
+        return
+    run = _prepare_run(sources, sinks, todo, restarts, draws_per_restart,
+                       burnin, delay, jobs, engine, feature_blocks, seed,
+                       sparse_model, dtype, adaptive_burnin, rhat, executor,
+                       max_memory)
+    for _, i, result in _execute_runs([run], alpha1, alpha2, beta, dtype,
+                                      executor, checkpoint_dir,
+                                      None if model is None else [model]):
+        yield i, result
+
+
+_Run = namedtuple('_Run', ['sources', 'loo', 'f', 'args', 'tasks', 'units',
+                           'memory', 'batched', 'jobs', 'task_budget',
+                           'share_known_p_tv'])
+
+
+def _prepare_run(sources, sinks, todo, restarts, draws_per_restart, burnin,
+                 delay, jobs, engine, feature_blocks, seed, sparse_model,
+                 dtype, adaptive_burnin, rhat, executor, max_memory):
+    '''Plan the tasks of the sinks at positions `todo` for `_execute_runs`.'''
+    total_passes = burnin + (draws_per_restart - 1) * delay + 1
+    jobs, units, tasks, memory, task_budget = _plan_run(
+        sources, sinks, todo, restarts, total_passes, jobs, engine, seed,
+        sparse_model, dtype, adaptive_burnin, executor, max_memory)[:5]
     kwargs = {
-            'restarts': restarts,
             'draws_per_restart': draws_per_restart,
             'burnin': burnin,
-            'delay': delay
+            'delay': delay,
+            'engine': engine,
+            'feature_blocks': feature_blocks,
+            'sparse_model': sparse_model,
+            'adaptive_burnin': adaptive_burnin,
+            'rhat': rhat,
+            'accumulate_draws': True
             }
 
-    # Run LOO predictions on `sources`.
-    if sinks is None:
-        cps_and_sinks = []
-        for source in sources.index:
-            _sources = sources[lambda x: x != source]
-            cp = ConditionalProbability(alpha1, alpha2, beta, _sources.values)
-            sink = sources.loc[source, :].values
-            cps_and_sinks.append((cp, sink))
-
-        f = partial(_gibbs_loo, **kwargs)
-
-        args = cps_and_sinks
+    batched = False
+    # Run LOO predictions on `sources`. Each task holds one source out of the
+    # shared model (see `ConditionalProbability.hold_out`).
+    loo = sinks is None
+    if loo:
         sinks = sources
-        loo = True
+        f = partial(_gibbs_loo, **kwargs)
 
-    # Run normal prediction on `sinks`.
     else:
-        cp = ConditionalProbability(alpha1, alpha2, beta, sources.values)
-        f = partial(gibbs_sampler, cp=cp, **kwargs)
-        args = sinks.values
-        loo = False
+        # Run normal prediction on `sinks` in lockstep batches of sinks (see
+        # `_plan_run`).
+        if engine in LOCKSTEP_ENGINES:
+            kwargs.pop('feature_blocks')
+            f = partial(_gibbs_batch, **kwargs)
+            batched = True
+
+        # Run normal prediction on `sinks`.
+        else:
+            f = partial(_gibbs_sink, **kwargs)
+
+    seeds = spawn_seeds(seed, sinks.shape[0])
+    counts = _count_matrix(sinks)
+    args = []
+    for unit, start, stop in tasks:
+        unit_seeds = [_chunk_seeds(seeds[i], restarts, start, stop) for i in
+                      units[unit]]
+        if loo:
+            args.append((units[unit][0], counts[units[unit][0]],
+                         unit_seeds[0], stop - start))
+        elif batched:
+            args.append((counts[units[unit]], unit_seeds, stop - start))
+        else:
+            args.append((counts[units[unit][0]], unit_seeds[0],
+                         stop - start))
+    return _Run(sources, loo, f, args, tasks, units, memory, batched, jobs,
+                task_budget, not sparse_model or loo)
+
 
-    with Pool(jobs) as p:
-        results = p.map(f, args)
+def _execute_runs(runs, alpha1, alpha2, beta, dtype, executor,
+                  checkpoint_dir=None, models=None):
+    '''Run the tasks of `runs` (see `_prepare_run`) on a single executor.
 
-    return collate_gibbs_results([i[0] for i in results],
-                                 [i[1] for i in results],
-                                 [i[2] for i in results],
-                                 sinks.index, sources.index,
-                                 sources.columns,
-                                 create_feature_tables, loo=loo)
+    Yields (r, i, result) for every sink as it finishes, where r is the
+    position of its run in `runs`. The tasks are submitted run after run, so
+    that a worker rarely switches between models. If `models` is given, it
+    holds the handle of the published model of each run.
+    '''
+    # The tasks of all runs, with the run of each.
+    queue = [(r, t) for r, run in enumerate(runs)
+             for t in range(len(run.args))]
+    jobs = max(run.jobs for run in runs)
+    budgets = [run.task_budget for run in runs
+               if run.task_budget is not None]
+    task_budget = min(budgets) if budgets else None
+    num_chunks = [np.bincount([unit for unit, start, stop in run.tasks],
+                              minlength=len(run.units)) for run in runs]
+    chunks = [[[] for unit in run.units] for run in runs]
+
+    # A single model of all sources is shared by every task of a run. It is
+    # published once per run (see `_publish_model`), so tasks carry only
+    # their sink, and workers started for the runs load the model of the
+    # first before their first task.
+    closes = []
+    owned = False
+    pending = set()
+    try:
+        if models is None:
+            models = []
+            for run in runs:
+                cp = ConditionalProbability(alpha1, alpha2, beta,
+                                            run.sources.values, dtype=dtype)
+                model, close = _publish_model(
+                    cp, executor, share_known_p_tv=run.share_known_p_tv)
+                models.append(model)
+                closes.append(close)
+        executor, owned = get_executor(executor, jobs,
+                                       initializer=_load_model,
+                                       initargs=(models[0],))
+        fs = [partial(_model_task, run.f, model)
+              for run, model in zip(runs, models)]
+        in_flight = {}
+        submitted = 0
+        while True:
+            # Tasks are submitted in the order of `tasks`, so that they are
+            # started longest first, keeping a few more in flight than there
+            # are jobs so that no worker waits for its next task. With
+            # `max_memory`, a task is only submitted once the estimated
+            # memory of the tasks in flight leaves room for it. A task that
+            # does not fit on its own is run alone.
+            while submitted < len(queue) and len(pending) < 2 * jobs:
+                r, t = queue[submitted]
+                cost = runs[r].memory[t]
+                if (task_budget is not None and pending and
+                        sum(in_flight.values()) + cost > task_budget):
+                    break
+                future = executor.submit(fs[r], ((r, t), runs[r].args[t]))
+                in_flight[future] = cost
+                pending.add(future)
+                submitted += 1
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                del in_flight[future]
+            for (r, t), result in sorted((future.result() for future in
+                                          finished), key=lambda x: x[0]):
+                run = runs[r]
+                unit, start, stop = run.tasks[t]
+                chunks[r][unit].append((start, result if run.batched
+                                        else [result]))
+                if len(chunks[r][unit]) < num_chunks[r][unit]:
+                    continue
+                # Merge the chunks of every sink of the unit in the order of
+                # their restarts.
+                unit_chunks = [chunk for start, chunk in
+                               sorted(chunks[r][unit], key=lambda x: x[0])]
+                chunks[r][unit] = None
+                for j, i in enumerate(run.units[unit]):
+                    result = _merge_restart_chunks([chunk[j] for chunk in
+                                                    unit_chunks])
+                    if checkpoint_dir is not None:
+                        save_sink(checkpoint_dir, i, result)
+                    yield r, i, result
+    finally:
+        # Tasks still running when the results are abandoned (e.g. on an
+        # error) are waited for before their models are released.
+        for future in pending:
+            future.cancel()
+        wait(pending)
+        if owned:
+            executor.shutdown()
+        for close in closes:
+            close()
 
 
 def cumulative_proportions(all_envcounts, sink_ids, source_ids):
@@ -899,7 +3314,8 @@ def single_sink_feature_table(final_env_assignments, final_taxon_assignments,
 
 def collate_gibbs_results(all_envcounts, all_env_assignments,
                           all_taxon_assignments, sink_ids, source_ids,
-                          feature_ids, create_feature_tables, loo):
+                          feature_ids, create_feature_tables, loo,
+                          all_feature_counts=None):
     '''Collate `gibbs_sampler` output, optionally including feature tables.
 
     Parameters
@@ -933,6 +3349,11 @@ def collate_gibbs_results(all_envcounts, all_env_assignments,
     loo : boolean
         If `True`, collate data based on the assumption that input data was
         generated by a `gibbs_loo` call.
+    all_feature_counts : list, optional
+        Each entry is a 2D array of ints, the `feature_counts` returned by
+        `gibbs_sampler` with `accumulate_draws=True` for the ith sink. If
+        given, the feature tables are built from these tables and
+        `all_env_assignments` and `all_taxon_assignments` may be `None`.
 
     Notes
     -----
@@ -982,9 +3403,14 @@ def collate_gibbs_results(all_envcounts, all_env_assignments,
             fts = []
             for i, sink_id in enumerate(source_ids):
                 r_source_ids = source_ids[source_ids != sink_id]
-                ft = single_sink_feature_table(all_env_assignments[i],
-                                               all_taxon_assignments[i],
-                                               r_source_ids, feature_ids)
+                if all_feature_counts is not None:
+                    ft = pd.DataFrame(all_feature_counts[i],
+                                      index=list(r_source_ids) + ['Unknown'],
+                                      columns=feature_ids)
+                else:
+                    ft = single_sink_feature_table(all_env_assignments[i],
+                                                   all_taxon_assignments[i],
+                                                   r_source_ids, feature_ids)
                 tmp = ft.T
                 tmp.insert(i, sink_id, 0)
                 fts.append(tmp.T)
@@ -998,9 +3424,14 @@ def collate_gibbs_results(all_envcounts, all_env_assignments,
         if create_feature_tables:
             fts = []
             for i, sink_id in enumerate(sink_ids):
-                ft = single_sink_feature_table(all_env_assignments[i],
-                                               all_taxon_assignments[i],
-                                               source_ids, feature_ids)
+                if all_feature_counts is not None:
+                    ft = pd.DataFrame(all_feature_counts[i],
+                                      index=list(source_ids) + ['Unknown'],
+                                      columns=feature_ids)
+                else:
+                    ft = single_sink_feature_table(all_env_assignments[i],
+                                                   all_taxon_assignments[i],
+                                                   source_ids, feature_ids)
                 fts.append(ft)
         else:
             fts = None
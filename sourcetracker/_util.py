@@ -8,7 +8,9 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
+import numpy as np
 import pandas as pd
+import scipy.sparse
 
 
 def parse_sample_metadata(f):
@@ -32,19 +34,108 @@ def parse_sample_metadata(f):
     return sample_metadata
 
 
-def biom_to_df(biom_table):
+def biom_to_df(biom_table, sparse=False):
     '''Turn biom table into dataframe.
 
     Parameters
     ----------
     biom_table : biom.table.Table
         Biom table.
+    sparse : bool, optional
+        If `True`, return a `SparseFeatureTable` holding the counts of the
+        biom table without densifying them.
 
     Returns
     -------
-    feature_table : pd.DataFrame
+    feature_table : pd.DataFrame or SparseFeatureTable
         Contingency table with rows, columns = samples, features.
     '''
+    if sparse:
+        return SparseFeatureTable(biom_table.matrix_data.T,
+                                  biom_table.ids(axis='sample'),
+                                  biom_table.ids(axis='observation'))
     return pd.DataFrame(biom_table._data.toarray().T,
                         index=biom_table.ids(axis='sample'),
                         columns=biom_table.ids(axis='observation'))
+
+
+class SparseFeatureTable(object):
+    '''Contingency table of counts held as a scipy CSR matrix.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse matrix or np.array
+        Rows are samples, columns are features. Converted to CSR.
+    index : iterable
+        The sample IDs.
+    columns : iterable
+        The feature IDs.
+
+    Raises
+    ------
+    ValueError
+        If the shape of `matrix` does not match `index` and `columns`.
+
+    Notes
+    -----
+    Stands in for the dense feature table of the input pipeline:
+    `validate_gibbs_input`, `intersect_and_sort_samples`,
+    `collapse_source_data`, `subsample_dataframe` and the sinks of `gibbs`
+    accept it, so that a table of many samples and features is never held
+    densely. `gibbs` densifies one sink at a time, in the worker sampling it.
+    '''
+
+    def __init__(self, matrix, index, columns):
+        self.matrix = scipy.sparse.csr_matrix(matrix)
+        self.index = pd.Index(index)
+        self.columns = pd.Index(columns)
+        if self.matrix.shape != (len(self.index), len(self.columns)):
+            raise ValueError('A matrix of shape %r does not match %d samples '
+                             'and %d features.' % (self.matrix.shape,
+                                                   len(self.index),
+                                                   len(self.columns)))
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def take(self, rows):
+        '''Return the samples at positions `rows`.'''
+        rows = np.asarray(rows, dtype=np.intp)
+        return SparseFeatureTable(self.matrix[rows], self.index[rows],
+                                  self.columns)
+
+    def select(self, samples):
+        '''Return the samples with IDs `samples`, in that order.
+
+        Raises
+        ------
+        KeyError
+            If any of `samples` is not in the table.
+        '''
+        rows = self.index.get_indexer(samples)
+        if (rows < 0).any():
+            raise KeyError('%d samples are not in the feature table.'
+                           % (rows < 0).sum())
+        return self.take(rows)
+
+    def take_features(self, columns):
+        '''Return the table of the features at positions `columns`.'''
+        columns = np.asarray(columns, dtype=np.intp)
+        return SparseFeatureTable(self.matrix[:, columns], self.index,
+                                  self.columns[columns])
+
+    def sum(self, axis=0):
+        '''Return the total counts of every feature (or sample if axis=1).'''
+        totals = np.asarray(self.matrix.sum(axis)).ravel()
+        return pd.Series(totals, index=self.columns if axis == 0 else
+                         self.index)
+
+    def astype(self, dtype, copy=True):
+        return SparseFeatureTable(self.matrix.astype(dtype, copy=copy),
+                                  self.index, self.columns)
+
+    def to_dataframe(self):
+        '''Return the table as a dense `pd.DataFrame`.'''
+        return pd.DataFrame(self.matrix.toarray(), index=self.index,
+                            columns=self.columns)
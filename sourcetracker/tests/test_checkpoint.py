@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, Biota Technology.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import division
+
+import os
+import tempfile
+from unittest import TestCase, main
+
+import numpy as np
+import pandas as pd
+
+from sourcetracker._checkpoint import (create_manifest, open_checkpoint,
+                                       save_sink, load_sinks, MANIFEST)
+from sourcetracker._sourcetracker import gibbs
+
+
+class TestCheckpoint(TestCase):
+
+    def setUp(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        self.sources = pd.DataFrame([[10, 10, 10, 0, 0, 0],
+                                     [0, 0, 0, 10, 10, 10],
+                                     [1, 2, 3, 4, 5, 6]], columns=features,
+                                    index=['source1', 'source2', 'source3'])
+        self.sinks = pd.DataFrame([[5, 5, 5, 1, 0, 0], [0, 1, 2, 3, 4, 5],
+                                   [3, 3, 3, 3, 3, 3]],
+                                  index=['sink1', 'sink2', 'sink3'],
+                                  columns=features)
+        self.kwargs = {'alpha1': .001, 'alpha2': .01, 'beta': 1,
+                       'restarts': 3, 'draws_per_restart': 2, 'burnin': 5,
+                       'delay': 2, 'seed': 7}
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = os.path.join(self.tmp.name, 'checkpoint')
+
+    def assert_results_equal(self, obs, exp):
+        pd.util.testing.assert_frame_equal(obs[0], exp[0])
+        pd.util.testing.assert_frame_equal(obs[1], exp[1])
+        for obs_ft, exp_ft in zip(obs[2], exp[2]):
+            pd.util.testing.assert_frame_equal(obs_ft, exp_ft)
+
+    def test_manifest(self):
+        manifest = create_manifest(self.sources, None,
+                                   {'seed': np.random.SeedSequence(1),
+                                    'restarts': 3})
+        self.assertIsNone(manifest['sinks'])
+        self.assertIsInstance(manifest['parameters']['seed'], str)
+        open_checkpoint(self.dir, manifest)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, MANIFEST)))
+        # Reopening the checkpoint of the same run is fine.
+        open_checkpoint(self.dir, manifest)
+        # A different table or parameter is not.
+        sources = self.sources.copy()
+        sources.iloc[0, 0] += 1
+        other = create_manifest(sources, None,
+                                {'seed': np.random.SeedSequence(1),
+                                 'restarts': 4})
+        with self.assertRaisesRegex(ValueError, 'sources, restarts'):
+            open_checkpoint(self.dir, other)
+
+    def test_save_and_load_sinks(self):
+        os.makedirs(self.dir)
+        envcounts = np.arange(12).reshape(3, 4)
+        feature_counts = np.ones((4, 6), dtype=np.int64)
+        save_sink(self.dir, 0, (envcounts, feature_counts))
+        save_sink(self.dir, 2, (envcounts, feature_counts, 17))
+        results = load_sinks(self.dir, 3)
+        self.assertEqual(sorted(results), [0, 2])
+        self.assertEqual(len(results[0]), 2)
+        np.testing.assert_array_equal(results[0][0], envcounts)
+        np.testing.assert_array_equal(results[0][1], feature_counts)
+        self.assertEqual(results[2][2], 17)
+        # No temporary files are left behind.
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         ['sink_0.npz', 'sink_2.npz'])
+
+    def test_gibbs_resume(self):
+        exp = gibbs(self.sources, self.sinks, **self.kwargs)
+        obs = gibbs(self.sources, self.sinks, checkpoint_dir=self.dir,
+                    **self.kwargs)
+        self.assert_results_equal(obs, exp)
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         [MANIFEST, 'sink_0.npz', 'sink_1.npz',
+                          'sink_2.npz'])
+
+        # Interrupted runs are resumed where they stopped: only the missing
+        # sink is sampled again, and the number of jobs may change.
+        os.remove(os.path.join(self.dir, 'sink_1.npz'))
+        mtime = os.path.getmtime(os.path.join(self.dir, 'sink_0.npz'))
+        obs = gibbs(self.sources, self.sinks, checkpoint_dir=self.dir,
+                    jobs=2, **self.kwargs)
+        self.assert_results_equal(obs, exp)
+        self.assertEqual(
+            os.path.getmtime(os.path.join(self.dir, 'sink_0.npz')), mtime)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'sink_1.npz')))
+
+    def test_gibbs_resume_loo(self):
+        exp = gibbs(self.sources, **self.kwargs)
+        gibbs(self.sources, checkpoint_dir=self.dir, **self.kwargs)
+        os.remove(os.path.join(self.dir, 'sink_0.npz'))
+        obs = gibbs(self.sources, checkpoint_dir=self.dir, **self.kwargs)
+        self.assert_results_equal(obs, exp)
+
+    def test_gibbs_mismatch(self):
+        gibbs(self.sources, self.sinks, checkpoint_dir=self.dir,
+              **self.kwargs)
+        kwargs = dict(self.kwargs, seed=8)
+        self.assertRaises(ValueError, gibbs, self.sources, self.sinks,
+                          checkpoint_dir=self.dir, **kwargs)
+        self.assertRaises(ValueError, gibbs, self.sources, self.sinks.iloc[:2],
+                          checkpoint_dir=self.dir, **self.kwargs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, Biota Technology.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import division
+
+from unittest import TestCase, main
+
+import numpy as np
+import pandas as pd
+
+from sourcetracker._estimate import (estimate_gibbs, calibrate_sampler,
+                                     _makespan)
+
+
+class TestEstimateGibbs(TestCase):
+
+    def setUp(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        self.sources = pd.DataFrame([[10, 10, 10, 0, 0, 0],
+                                     [0, 0, 0, 10, 10, 10],
+                                     [1, 2, 3, 4, 5, 6]], columns=features,
+                                    index=['source1', 'source2', 'source3'])
+        self.sinks = pd.DataFrame([[5, 5, 5, 1, 0, 0], [0, 1, 2, 3, 4, 5],
+                                   [3, 3, 3, 3, 3, 3]],
+                                  index=['sink1', 'sink2', 'sink3'],
+                                  columns=features)
+        self.kwargs = {'alpha1': .001, 'alpha2': .01, 'beta': 1,
+                       'restarts': 4, 'draws_per_restart': 2, 'burnin': 5,
+                       'delay': 2}
+
+    def test_calibrate_sampler(self):
+        state = np.random.get_state()
+        rate = calibrate_sampler(self.sources.values, self.sinks.values[0],
+                                 depth=10, passes=2)
+        self.assertGreater(rate, 0)
+        # The global PRNG is not used.
+        np.testing.assert_array_equal(np.random.get_state()[1], state[1])
+
+    def test_makespan(self):
+        self.assertEqual(_makespan([5, 4, 3, 3], 2), 8)
+        self.assertEqual(_makespan([5, 4, 3, 3], 1), 15)
+        self.assertEqual(_makespan([5, 4, 3, 3], 8), 5)
+
+    def test_estimate_gibbs(self):
+        obs = estimate_gibbs(self.sources, self.sinks, jobs=2, **self.kwargs)
+        self.assertEqual(obs.jobs, 2)
+        self.assertEqual(obs.tasks, 3)
+        # 49 sequences, 8 passes and 4 restarts.
+        self.assertEqual(obs.updates, 49 * 8 * 4)
+        self.assertAlmostEqual(obs.cpu_seconds,
+                               obs.updates / obs.updates_per_second)
+        self.assertLess(obs.wall_seconds, obs.cpu_seconds)
+        self.assertGreater(obs.peak_memory, 0)
+
+        # Feature tables add to the output.
+        without = estimate_gibbs(self.sources, self.sinks,
+                                 create_feature_tables=False, **self.kwargs)
+        self.assertLess(without.output_bytes, obs.output_bytes)
+
+        # With a seed the restarts are split between jobs.
+        obs = estimate_gibbs(self.sources, self.sinks.iloc[:1], jobs=4,
+                             seed=0, **self.kwargs)
+        self.assertEqual(obs.tasks, 4)
+
+    def test_loo(self):
+        obs = estimate_gibbs(self.sources, jobs=1, **self.kwargs)
+        self.assertEqual(obs.tasks, 3)
+        self.assertEqual(obs.updates, 81 * 8 * 4)
+        self.assertAlmostEqual(obs.wall_seconds, obs.cpu_seconds)
+
+    def test_validation(self):
+        self.assertRaises(ValueError, estimate_gibbs, self.sources,
+                          self.sinks, restarts=0)
+        self.assertRaises(ValueError, estimate_gibbs, self.sources,
+                          self.sinks, max_memory='lots')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, Biota Technology.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import division
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest import TestCase, main, skipIf
+
+import numpy as np
+import pandas as pd
+
+from sourcetracker._executors import (SerialExecutor, SocketExecutor,
+                                      get_executor)
+from sourcetracker._kernels import numba, gibbs_pass
+from sourcetracker._sourcetracker import (gibbs, iter_gibbs,
+                                          ConditionalProbability,
+                                          _publish_model, _get_model)
+
+
+def _divide(a, b):
+    return a / b
+
+
+class TestExecutors(TestCase):
+
+    def test_serial_executor(self):
+        executor = SerialExecutor()
+        self.assertEqual(executor.submit(_divide, 1, b=2).result(), .5)
+        future = executor.submit(_divide, 1, 0)
+        self.assertIsInstance(future.exception(), ZeroDivisionError)
+        self.assertEqual(list(executor.map(_divide, [2, 4], [2, 2])), [1, 2])
+        executor.shutdown()
+        self.assertRaises(RuntimeError, executor.submit, _divide, 1, 2)
+
+    def test_socket_executor(self):
+        with SocketExecutor(workers=2) as executor:
+            self.assertEqual(executor.num_workers, 2)
+            self.assertEqual(list(executor.map(_divide, range(6), [2] * 6)),
+                             [0, .5, 1, 1.5, 2, 2.5])
+            future = executor.submit(_divide, 1, 0)
+            self.assertIsInstance(future.exception(), ZeroDivisionError)
+            # Workers keep going after a failed task.
+            self.assertEqual(executor.submit(_divide, 1, 4).result(), .25)
+        self.assertRaises(RuntimeError, executor.submit, _divide, 1, 2)
+        self.assertRaises(ValueError, SocketExecutor)
+        self.assertRaises(ValueError, SocketExecutor, [('localhost', 1)])
+
+    def test_get_executor(self):
+        for name, cls in [('process', ProcessPoolExecutor),
+                          ('thread', ThreadPoolExecutor),
+                          ('serial', SerialExecutor)]:
+            executor, owned = get_executor(name, 2)
+            self.assertIsInstance(executor, cls)
+            self.assertTrue(owned)
+            executor.shutdown()
+        executor = SerialExecutor()
+        self.assertEqual(get_executor(executor, 2), (executor, False))
+        self.assertRaises(ValueError, get_executor, 'cluster', 2)
+        self.assertRaises(ValueError, get_executor, object(), 2)
+
+    def test_publish_model(self):
+        cp = ConditionalProbability(.01, .1, 10, np.array([[1, 2, 3],
+                                                           [3, 2, 1]]))
+        executors = [SerialExecutor(), ThreadPoolExecutor(1),
+                     ProcessPoolExecutor(1), SocketExecutor(workers=1)]
+        for executor, kind in zip(executors, ['local', 'local', 'shared',
+                                              'pickled']):
+            model, close = _publish_model(cp, executor,
+                                          share_known_p_tv=True)
+            self.assertEqual(model[0], kind)
+            obs = _get_model(model)
+            # Every thread gets a model of its own with the same sources.
+            self.assertIsNot(obs, cp)
+            np.testing.assert_array_equal(obs.m_xivs, cp.m_xivs)
+            np.testing.assert_array_equal(obs.m_vs, cp.m_vs)
+            if kind == 'local':
+                # The threads of this process share the arrays.
+                self.assertIs(obs.m_xivs, cp.m_xivs)
+                self.assertIs(obs.known_p_tv, cp.known_p_tv)
+            elif kind == 'shared':
+                # The processes share read-only views of the arrays,
+                # including `known_p_tv` computed once by the parent.
+                np.testing.assert_array_equal(obs.known_p_tv, cp.known_p_tv)
+                self.assertFalse(obs.known_p_tv.flags.writeable)
+                self.assertFalse(obs.m_xivs.flags.writeable)
+            self.assertIs(_get_model(model), obs)
+            close()
+            executor.shutdown()
+
+
+class TestGibbsExecutors(TestCase):
+
+    def setUp(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        self.sources = pd.DataFrame([[10, 10, 10, 0, 0, 0],
+                                     [0, 0, 0, 10, 10, 10],
+                                     [1, 2, 3, 4, 5, 6]], columns=features,
+                                    index=['source1', 'source2', 'source3'])
+        self.sinks = pd.DataFrame([[5, 5, 5, 1, 0, 0], [0, 1, 2, 3, 4, 5],
+                                   [3, 3, 3, 3, 3, 3]],
+                                  index=['sink1', 'sink2', 'sink3'],
+                                  columns=features)
+        self.kwargs = {'alpha1': .001, 'alpha2': .01, 'beta': 1,
+                       'restarts': 3, 'draws_per_restart': 2, 'burnin': 5,
+                       'delay': 2, 'seed': 7, 'jobs': 2}
+
+    def assert_results_equal(self, obs, exp):
+        pd.testing.assert_frame_equal(obs[0], exp[0])
+        pd.testing.assert_frame_equal(obs[1], exp[1])
+        for obs_ft, exp_ft in zip(obs[2], exp[2]):
+            pd.testing.assert_frame_equal(obs_ft, exp_ft)
+
+    def test_builtin_executors(self):
+        for sinks in [self.sinks, None]:
+            exp = gibbs(self.sources, sinks, **self.kwargs)
+            for executor in ['thread', 'serial', 'socket']:
+                obs = gibbs(self.sources, sinks, executor=executor,
+                            **self.kwargs)
+                self.assert_results_equal(obs, exp)
+
+    def test_engines(self):
+        engines = ['python', 'vectorized']
+        if numba is not None:
+            engines.append('numba')
+        for engine in engines:
+            for sparse_model in [False, True]:
+                exp = gibbs(self.sources, self.sinks, engine=engine,
+                            sparse_model=sparse_model, **self.kwargs)
+                obs = gibbs(self.sources, self.sinks, engine=engine,
+                            sparse_model=sparse_model, executor='thread',
+                            **self.kwargs)
+                self.assert_results_equal(obs, exp)
+
+    @skipIf(numba is None, 'numba is not installed.')
+    def test_compiled_pass_releases_gil(self):
+        self.assertTrue(gibbs_pass.targetoptions['nogil'])
+
+    def test_executor_object(self):
+        exp = gibbs(self.sources, self.sinks, **self.kwargs)
+        # Executors that are passed in are reused and left running.
+        for executor in [ProcessPoolExecutor(2), SocketExecutor(workers=2)]:
+            with executor:
+                for _ in range(2):
+                    obs = gibbs(self.sources, self.sinks, executor=executor,
+                                **self.kwargs)
+                    self.assert_results_equal(obs, exp)
+
+    def test_invalid_executor(self):
+        self.assertRaises(ValueError, gibbs, self.sources, self.sinks,
+                          executor='cluster')
+        self.assertRaises(ValueError, iter_gibbs, self.sources, self.sinks,
+                          executor=object())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# ----------------------------------------------------------------------------
+# Copyright (c) 2016--, Biota Technology.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+from __future__ import division
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, main
+
+import numpy as np
+import pandas as pd
+
+from sourcetracker._session import SourceTrackerSession
+from sourcetracker._sourcetracker import gibbs
+
+
+class TestSourceTrackerSession(TestCase):
+
+    def setUp(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        self.sources = pd.DataFrame([[10, 10, 10, 0, 0, 0],
+                                     [0, 0, 0, 10, 10, 10],
+                                     [1, 2, 3, 4, 5, 6]], columns=features,
+                                    index=['source1', 'source2', 'source3'])
+        self.sinks = pd.DataFrame([[5, 5, 5, 1, 0, 0], [0, 1, 2, 3, 4, 5],
+                                   [3, 3, 3, 3, 3, 3]],
+                                  index=['sink1', 'sink2', 'sink3'],
+                                  columns=features)
+        self.kwargs = {'alpha1': .001, 'alpha2': .01, 'beta': 1,
+                       'restarts': 3, 'draws_per_restart': 2, 'burnin': 5,
+                       'delay': 2, 'jobs': 2}
+
+    def assert_results_equal(self, obs, exp):
+        self.assertEqual(len(obs), len(exp))
+        pd.testing.assert_frame_equal(obs[0], exp[0])
+        pd.testing.assert_frame_equal(obs[1], exp[1])
+        for obs_ft, exp_ft in zip(obs[2], exp[2]):
+            pd.testing.assert_frame_equal(obs_ft, exp_ft)
+
+    def test_predict(self):
+        for engine in ['python', 'vectorized']:
+            for executor in ['process', 'serial']:
+                with SourceTrackerSession(self.sources, engine=engine,
+                                          executor=executor,
+                                          **self.kwargs) as session:
+                    # The session serves any number of sink batches.
+                    for sinks in [self.sinks, self.sinks.iloc[1:]]:
+                        exp = gibbs(self.sources, sinks, engine=engine,
+                                    seed=3, **self.kwargs)
+                        obs = session.predict(sinks, seed=3)
+                        self.assert_results_equal(obs, exp)
+
+    def test_generator_seed(self):
+        exp = gibbs(self.sources, self.sinks,
+                    seed=np.random.default_rng(0), **self.kwargs)
+        with SourceTrackerSession(self.sources, **self.kwargs) as session:
+            obs = session.predict(self.sinks, seed=np.random.default_rng(0))
+        self.assert_results_equal(obs, exp)
+
+    def test_adaptive_burnin(self):
+        kwargs = dict(self.kwargs, adaptive_burnin=True, burnin=50)
+        exp = gibbs(self.sources, self.sinks, seed=3, **kwargs)
+        with SourceTrackerSession(self.sources, **kwargs) as session:
+            obs = session.predict(self.sinks, seed=3)
+        self.assert_results_equal(obs, exp)
+        pd.testing.assert_series_equal(obs[3], exp[3])
+
+    def test_auto_jobs(self):
+        exp = gibbs(self.sources, self.sinks, seed=3, **self.kwargs)
+        kwargs = dict(self.kwargs, jobs='auto', max_memory='1M')
+        with SourceTrackerSession(self.sources, **kwargs) as session:
+            obs = session.predict(self.sinks, seed=3)
+        self.assert_results_equal(obs, exp)
+
+    def test_iter_predict(self):
+        exp = gibbs(self.sources, self.sinks, seed=3, **self.kwargs)
+        with SourceTrackerSession(self.sources, **self.kwargs) as session:
+            results = list(session.iter_predict(self.sinks, seed=3))
+        self.assertEqual(sorted(r.sink_id for r in results),
+                         list(self.sinks.index))
+        for result in results:
+            pd.testing.assert_series_equal(result.proportions,
+                                           exp[0].loc[result.sink_id])
+
+    def test_executor_object(self):
+        exp = gibbs(self.sources, self.sinks, seed=3, **self.kwargs)
+        with ThreadPoolExecutor(2) as executor:
+            with SourceTrackerSession(self.sources, executor=executor,
+                                      **self.kwargs) as session:
+                obs = session.predict(self.sinks, seed=3)
+            self.assert_results_equal(obs, exp)
+            # The executor is not shut down with the session.
+            self.assertEqual(executor.submit(abs, -1).result(), 1)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, SourceTrackerSession, self.sources,
+                          restarts=0)
+        self.assertRaises(ValueError, SourceTrackerSession, self.sources,
+                          executor='cluster')
+        session = SourceTrackerSession(self.sources, executor='serial')
+        self.assertRaises(ValueError, session.predict,
+                          self.sinks.iloc[:, ::-1])
+        self.assertRaises(ValueError, session.predict, -self.sinks)
+        session.close()
+        self.assertRaises(ValueError, session.predict, self.sinks)
+        # Closing is idempotent.
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
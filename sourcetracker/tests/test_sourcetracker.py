@@ -8,15 +8,19 @@
 # ----------------------------------------------------------------------------
 from __future__ import division
 
-from unittest import TestCase, main
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, main, skipIf
 
 import numpy as np
 import pandas as pd
+import scipy.sparse
 import matplotlib.pyplot as plt
 
 from sourcetracker._sourcetracker import (intersect_and_sort_samples,
                                           collapse_source_data,
-                                          subsample_dataframe,
+                                          subsample_dataframe, rarefy,
+                                          prune_features,
                                           validate_gibbs_input,
                                           validate_gibbs_parameters,
                                           collate_gibbs_results,
@@ -25,8 +29,23 @@ from sourcetracker._sourcetracker import (intersect_and_sort_samples,
                                           cumulative_proportions,
                                           single_sink_feature_table,
                                           ConditionalProbability,
-                                          gibbs_sampler, gibbs)
+                                          gibbs_sampler, gibbs, iter_gibbs,
+                                          gibbs_replicates,
+                                          iter_gibbs_replicates,
+                                          get_sampler_engine,
+                                          feature_block_gibbs_sampler,
+                                          gibbs_sampler_batch, spawn_seeds,
+                                          _potential_scale_reduction,
+                                          _share_arrays,
+                                          _attach_shared_model,
+                                          _gibbs_sink, _gibbs_loo,
+                                          _model_columns,
+                                          _schedule_restart_chunks,
+                                          parse_memory, _resolve_jobs,
+                                          _task_memory, _available_cpus)
+from sourcetracker._kernels import numba
 from sourcetracker._plot import plot_heatmap
+from sourcetracker._util import SparseFeatureTable
 
 
 class TestValidateGibbsInput(TestCase):
@@ -146,6 +165,41 @@ class TestValidateGibbsInput(TestCase):
         sinks.iloc[2, 2] = '3'
         self.assertRaises(ValueError, validate_gibbs_input, sources, sinks)
 
+    def test_mixed_dtypes(self):
+        # Columns of different dtypes are checked one by one, and object
+        # columns pass if all their values are numbers.
+        sources = pd.DataFrame({'f0': [1, 2], 'f1': [1.5, 2.],
+                                'f2': [True, False],
+                                'f3': pd.Series([4, 5], dtype=object)})
+        exp = pd.DataFrame({'f0': [1, 2], 'f1': [1, 2], 'f2': [1, 0],
+                            'f3': [4, 5]}, dtype=np.int32)
+        pd.testing.assert_frame_equal(validate_gibbs_input(sources), exp)
+        sources['f1'] = [1., -1.]
+        self.assertRaises(ValueError, validate_gibbs_input, sources)
+        sources['f1'] = ['1', 2]
+        self.assertRaises(ValueError, validate_gibbs_input, sources)
+
+    def test_out_of_range_data(self):
+        # Counts that do not fit `np.int32` are not wrapped around.
+        for value in [np.inf, 2. ** 31, 2 ** 40]:
+            sources = pd.DataFrame(np.ones((5, 4)), index=self.index,
+                                   columns=self.columns)
+            sources = sources.astype(type(value))
+            sources.iloc[4, 3] = value
+            self.assertRaises(ValueError, validate_gibbs_input, sources)
+
+    def test_large_data(self):
+        # The values are scanned in chunks, so errors in any chunk are found
+        # and int32 input is returned without a copy.
+        data = np.random.randint(0, 10, size=(100, 3000)).astype(np.int32)
+        sources = pd.DataFrame(data)
+        obs = validate_gibbs_input(sources)
+        self.assertTrue(np.shares_memory(obs.values, sources.values))
+        for value in [np.nan, -1]:
+            bad = sources.astype(np.float64)
+            bad.iloc[99, 2999] = value
+            self.assertRaises(ValueError, validate_gibbs_input, bad)
+
     def test_columns_identical(self):
         # Columns are identical, no error expected.
         data = np.random.randint(0, 10, size=20).reshape(5, 4)
@@ -430,6 +484,207 @@ class TestSubsampleDataframe(TestCase):
         self.assertTrue((obs.sum(axis=1) == n).all())
         self.assertEqual(obs.shape, ftable.shape)
 
+    def test_seeded(self):
+        # With a seed the rows are rarefied in bulk, with the same results
+        # for any number of jobs and for sparse tables.
+        counts = np.random.RandomState(0).randint(0, 4, size=(600, 50))
+        ftable = pd.DataFrame(counts)
+        sparse = SparseFeatureTable(counts, ftable.index, ftable.columns)
+        for replace in [False, True]:
+            exp = subsample_dataframe(ftable, 20, replace, seed=5)
+            self.assertTrue((exp.sum(axis=1) == 20).all())
+            # Only features present in a sample are drawn.
+            self.assertFalse(((exp > 0) & (ftable == 0)).values.any())
+            if not replace:
+                self.assertTrue((exp <= ftable).values.all())
+            obs = subsample_dataframe(ftable, 20, replace, seed=5, jobs=2)
+            pd.util.testing.assert_frame_equal(obs, exp)
+            obs = subsample_dataframe(sparse, 20, replace, seed=5)
+            pd.util.testing.assert_frame_equal(obs.to_dataframe(), exp)
+            obs = subsample_dataframe(ftable, 20, replace, seed=6)
+            self.assertFalse(obs.equals(exp))
+            # Generators seeded alike give the same rarefactions.
+            exp = subsample_dataframe(ftable, 20, replace,
+                                      seed=np.random.default_rng(5))
+            obs = subsample_dataframe(ftable, 20, replace, jobs=2,
+                                      seed=np.random.default_rng(5))
+            pd.util.testing.assert_frame_equal(obs, exp)
+        # The sparse table is left as it was.
+        self.assertEqual(sparse.matrix.nnz, np.count_nonzero(counts))
+
+    def test_rarefy(self):
+        counts = np.array([[10, 50, 10, 70], [0, 0, 0, 0]])
+        self.assertRaises(ValueError, rarefy, counts, 30)
+        self.assertRaises(ValueError, rarefy, counts, 30, True)
+        self.assertRaises(ValueError, rarefy, counts[:1], 141)
+        # With replacement, a sample may be rarefied beyond its depth.
+        obs = rarefy(counts[:1], 1000, True, seed=0)
+        self.assertEqual(obs.sum(), 1000)
+        # The draws follow the hypergeometric and multinomial means.
+        for replace in [False, True]:
+            obs = rarefy(np.repeat(counts[:1], 2000, axis=0), 28, replace,
+                         seed=0)
+            np.testing.assert_allclose(obs.mean(0), [2, 10, 2, 14],
+                                       atol=.3)
+
+
+class TestPruneFeatures(TestCase):
+
+    def setUp(self):
+        features = ['f%d' % i for i in range(5)]
+        self.sources = pd.DataFrame([[4, 0, 0, 1, 0], [2, 0, 3, 0, 0]],
+                                    index=['a', 'b'], columns=features)
+        self.sinks = pd.DataFrame([[1, 0, 0, 0, 0], [5, 0, 0, 0, 2]],
+                                  index=['x', 'y'], columns=features)
+
+    def test_absent_features(self):
+        sparse = SparseFeatureTable(self.sinks.values, self.sinks.index,
+                                    self.sinks.columns)
+        for sinks in [self.sinks, sparse]:
+            (obs,), report = prune_features([(self.sources, sinks)])
+            self.assertEqual(list(obs[0].columns), ['f0', 'f2', 'f3', 'f4'])
+            self.assertEqual(list(obs[1].columns), ['f0', 'f2', 'f3', 'f4'])
+            self.assertEqual(list(report.index), ['f1'])
+            self.assertEqual(report.loc['f1', 'abundance'], 0)
+        np.testing.assert_array_equal(obs[1].matrix.toarray(),
+                                      [[1, 0, 0, 0], [5, 0, 0, 2]])
+
+    def test_thresholds(self):
+        (obs,), report = prune_features([(self.sources, self.sinks)],
+                                        min_prevalence=.5)
+        self.assertEqual(list(obs[0].columns), ['f0'])
+        np.testing.assert_allclose(report['prevalence'],
+                                   [0, .25, .25, .25])
+        (obs,), report = prune_features([(self.sources, self.sinks)],
+                                        min_abundance=3)
+        self.assertEqual(list(obs[0].columns), ['f0', 'f2'])
+        np.testing.assert_allclose(report['abundance'], [0, 1, 2])
+        # Without any feature to prune the tables are left as they are.
+        sources = self.sources[['f0', 'f2', 'f3']]
+        obs, report = prune_features([(sources, None)], 0, 0)
+        self.assertIs(obs[0][0], sources)
+        self.assertEqual(len(report), 0)
+
+    def test_replicates(self):
+        # The same features are pruned from every replicate, and the
+        # abundance is averaged over the replicates.
+        other = self.sinks.copy()
+        other['f1'] = [0, 4]
+        replicates, report = prune_features([(self.sources, self.sinks),
+                                             (self.sources, other)],
+                                            min_abundance=2)
+        for sources, sinks in replicates:
+            self.assertEqual(list(sources.columns), ['f0', 'f1', 'f2', 'f4'])
+            self.assertEqual(list(sinks.columns), ['f0', 'f1', 'f2', 'f4'])
+        self.assertEqual(list(report.index), ['f3'])
+
+    def test_errors(self):
+        self.assertRaises(ValueError, prune_features,
+                          [(self.sources, self.sinks)], min_prevalence=2)
+        self.assertRaises(ValueError, prune_features,
+                          [(self.sources, self.sinks)], min_abundance=-1)
+
+    def test_emptied_samples(self):
+        # A sink, or source, left without counts is named in the error.
+        sinks = self.sinks.copy()
+        sinks.loc['x'] = [0, 0, 1, 0, 0]
+        with self.assertRaisesRegex(ValueError, r'the sinks x\.'):
+            prune_features([(self.sources, sinks)], min_prevalence=.6)
+        sparse = SparseFeatureTable(sinks.values, sinks.index, sinks.columns)
+        with self.assertRaisesRegex(ValueError, 'the sinks x'):
+            prune_features([(self.sources, sparse)], min_prevalence=.6)
+        sources = self.sources.copy()
+        sources.loc['b'] = [0, 0, 3, 0, 0]
+        with self.assertRaisesRegex(ValueError, r'the sources b\.'):
+            prune_features([(sources, None)], min_abundance=4)
+
+    def test_no_features_left(self):
+        with self.assertRaisesRegex(ValueError, 'all 5 features'):
+            prune_features([(self.sources, self.sinks)], min_abundance=1000)
+
+
+class TestSparseFeatureTable(TestCase):
+
+    def setUp(self):
+        self.metadata = pd.DataFrame(
+            [['source', 'a'], ['sink', 'x'], ['source', 'b'],
+             ['source', 'a'], ['sink', 'x'], ['source', None]],
+            index=['s%d' % i for i in range(6)], columns=['type', 'env'])
+        data = np.array([[0, 3, 0, 2, 0, 9],
+                         [1, 0, 0, 0, 4, 0],
+                         [0, 0, 7, 0, 0, 1],
+                         [5, 1, 0, 0, 0, 0],
+                         [0, 0, 2, 2, 2, 2],
+                         [1, 1, 1, 1, 1, 1]], dtype=np.int32)
+        self.dense = pd.DataFrame(data, index=self.metadata.index,
+                                  columns=['f%d' % i for i in range(6)])
+        self.sparse = SparseFeatureTable(data, self.dense.index,
+                                         self.dense.columns)
+
+    def assert_tables_equal(self, obs, exp):
+        self.assertIsInstance(obs, SparseFeatureTable)
+        pd.util.testing.assert_frame_equal(obs.to_dataframe(), exp,
+                                           check_dtype=False)
+
+    def test_validate_gibbs_input(self):
+        obs = validate_gibbs_input(self.sparse.astype(np.float64))
+        self.assertEqual(obs.matrix.dtype, np.int32)
+        self.assert_tables_equal(obs, self.dense)
+        bad = self.sparse.astype(np.float64)
+        bad.matrix.data[0] = np.nan
+        self.assertRaises(ValueError, validate_gibbs_input, bad)
+        bad.matrix.data[0] = -1
+        self.assertRaises(ValueError, validate_gibbs_input, bad)
+
+    def test_intersect_and_sort_samples(self):
+        metadata = self.metadata.iloc[[4, 0, 2]]
+        exp_md, exp_ft = intersect_and_sort_samples(metadata, self.dense)
+        obs_md, obs_ft = intersect_and_sort_samples(metadata, self.sparse)
+        pd.util.testing.assert_frame_equal(obs_md, exp_md)
+        self.assert_tables_equal(obs_ft, exp_ft)
+
+    def test_collapse_source_data(self):
+        sources = ['s0', 's2', 's3', 's5']
+        for method in ['sum', 'mean', 'median']:
+            exp = collapse_source_data(self.metadata, self.dense, sources,
+                                       'env', method)
+            obs = collapse_source_data(self.metadata, self.sparse, sources,
+                                       'env', method)
+            pd.util.testing.assert_frame_equal(obs, exp)
+
+    def test_subsample_dataframe(self):
+        # The same random numbers are drawn as for the dense table.
+        for replace in [False, True]:
+            np.random.seed(0)
+            exp = subsample_dataframe(self.dense.iloc[:5], 4, replace)
+            np.random.seed(0)
+            obs = subsample_dataframe(self.sparse.take(range(5)), 4, replace)
+            self.assert_tables_equal(obs, exp)
+            self.assertFalse((obs.matrix.data == 0).any())
+
+    def test_gibbs(self):
+        sources = collapse_source_data(self.metadata, self.dense,
+                                       ['s0', 's2', 's3'], 'env', 'sum')
+        kwargs = {'restarts': 3, 'burnin': 5, 'draws_per_restart': 2,
+                  'seed': 1, 'jobs': 2}
+        dense_sinks = self.dense.loc[['s1', 's4']]
+        sparse_sinks = self.sparse.select(['s1', 's4'])
+        for engine in ['python', 'vectorized']:
+            for sparse_model in [False, True]:
+                exp = gibbs(sources, dense_sinks, engine=engine,
+                            sparse_model=sparse_model, **kwargs)
+                obs = gibbs(sources, sparse_sinks, engine=engine,
+                            sparse_model=sparse_model, **kwargs)
+                pd.util.testing.assert_frame_equal(obs[0], exp[0])
+                pd.util.testing.assert_frame_equal(obs[1], exp[1])
+                for o, e in zip(obs[2], exp[2]):
+                    pd.util.testing.assert_frame_equal(o, e)
+        # Sparse sources are densified.
+        exp = gibbs(sources, **kwargs)
+        obs = gibbs(SparseFeatureTable(sources.values, sources.index,
+                                       sources.columns), **kwargs)
+        pd.util.testing.assert_frame_equal(obs[0], exp[0])
+
 
 class TestDataAggregationFunctions(TestCase):
     '''Test that returned data is collated and written correctly.'''
@@ -841,6 +1096,106 @@ class ConditionalProbabilityTests(TestCase):
         np.testing.assert_array_almost_equal(cp.known_source_cp,
                                              exp_known_source_cp)
 
+    def test_precalculate_reused_for_equal_depths(self):
+        self.cp.set_n(500)
+        self.cp.precalculate()
+        known_p_tv = self.cp.known_p_tv
+        known_source_cp = self.cp.known_source_cp
+        # Same depth, nothing is recomputed.
+        self.cp.precalculate()
+        self.assertIs(self.cp.known_source_cp, known_source_cp)
+        # New depth, only the depth dependent quantities are recomputed.
+        self.cp.set_n(600)
+        self.cp.precalculate()
+        self.assertIs(self.cp.known_p_tv, known_p_tv)
+        self.assertEqual(self.cp.denominator_p_v, 599 + 10 * 3)
+        np.testing.assert_array_almost_equal(self.cp.known_source_cp,
+                                             known_p_tv / (599 + 10 * 3))
+
+    def test_precalculate_features(self):
+        self.cp.set_n(500)
+        self.cp.precalculate()
+        full = self.cp.known_source_cp
+        self.cp.precalculate(np.array([1, 4]))
+        np.testing.assert_array_equal(self.cp.known_p_tv.shape, (2, 2))
+        np.testing.assert_array_equal(self.cp.known_source_cp, full[:, [1, 4]])
+        # Column i of the restricted model is feature features[i].
+        n_vnoti = np.array([305, 1, 193])
+        obs = self.cp.calculate_cp_slice(1, 25, 193, n_vnoti).copy()
+        self.cp.precalculate()
+        np.testing.assert_array_equal(self.cp.known_source_cp, full)
+        exp = self.cp.calculate_cp_slice(4, 25, 193, n_vnoti)
+        np.testing.assert_array_equal(obs, exp)
+
+    def test_hold_out(self):
+        cp = self.cp.hold_out(0)
+        exp = ConditionalProbability(self.alpha1, self.alpha2, self.beta,
+                                     self.source_data[1:])
+        self.assertEqual(cp.V, exp.V)
+        # The source arrays are shared with the full model, not copied.
+        self.assertTrue(cp.m_xivs is self.cp.m_xivs)
+        self.assertTrue(cp.known_p_tv is self.cp.known_p_tv)
+        n_vnoti = np.array([305, 193])
+        for features in [None, np.array([1, 4])]:
+            for n in [500, 20]:
+                for model in [cp, exp]:
+                    model.set_n(n)
+                    model.precalculate(features)
+                np.testing.assert_array_equal(cp.known_source_cp,
+                                              exp.known_source_cp)
+                np.testing.assert_array_equal(
+                    cp.calculate_cp_slice(1, 25, 193, n_vnoti),
+                    exp.calculate_cp_slice(1, 25, 193, n_vnoti))
+        # The full model is unchanged.
+        self.assertEqual(self.cp.V, 3)
+        self.assertEqual(self.cp.known_p_tv.shape, (2, 6))
+        self.assertRaises(ValueError, self.cp.hold_out, 2)
+
+    def test_float32_accuracy(self):
+        # The float32 model agrees with the float64 model to float32
+        # precision, and seeded runs of the sampler give the same mixing
+        # proportions.
+        cp32 = ConditionalProbability(self.alpha1, self.alpha2, self.beta,
+                                      self.source_data, dtype=np.float32)
+        self.cp.set_n(500)
+        self.cp.precalculate()
+        cp32.set_n(500)
+        cp32.precalculate()
+        self.assertEqual(cp32.known_source_cp.dtype, np.float32)
+        np.testing.assert_allclose(cp32.known_source_cp,
+                                   self.cp.known_source_cp, rtol=1e-6)
+        n_vnoti = np.array([305, 1, 193])
+        for xi in range(6):
+            np.testing.assert_allclose(
+                cp32.calculate_cp_slice(xi, 25, 193, n_vnoti),
+                self.cp.calculate_cp_slice(xi, 25, 193, n_vnoti), rtol=1e-6)
+
+        sink = np.array([50, 40, 60, 5, 0, 20])
+        proportions = []
+        for dtype in [np.float64, np.float32]:
+            cp = ConditionalProbability(self.alpha1, self.alpha2, self.beta,
+                                        self.source_data, dtype=dtype)
+            ec, _, _ = gibbs_sampler(sink, cp, restarts=3,
+                                     draws_per_restart=5, burnin=20, delay=2,
+                                     seed=0)
+            proportions.append(ec.sum(0) / ec.sum())
+        np.testing.assert_allclose(proportions[0], proportions[1], atol=.01)
+
+        self.assertRaises(ValueError, ConditionalProbability, self.alpha1,
+                          self.alpha2, self.beta, self.source_data,
+                          dtype=np.int32)
+
+    def test_draw(self):
+        self.cp.set_n(500)
+        self.cp.precalculate()
+        n_vnoti = np.array([305, 1, 193])
+        for xi, u in [(0, 0.), (0, .5), (3, .001), (5, .6), (2, .999999)]:
+            cs = self.cp.calculate_cp_slice(xi, 25, 193, n_vnoti).cumsum()
+            exp = np.searchsorted(cs, cs[-1] * u)
+            self.assertEqual(self.cp.draw(xi, 25, 193, n_vnoti, u), exp)
+        # Feature 3 is only found in the first source.
+        self.assertEqual(self.cp.draw(3, 0, 193, n_vnoti, .5), 0)
+
     def test_calculate_cp_slice(self):
         # test with non overlapping two component mixture.
         n = 500
@@ -1179,6 +1534,40 @@ class TestGibbs(TestCase):
         for obs_fts, exp_fts in zip(obs_fts, exp_fts):
             pd.util.testing.assert_frame_equal(obs_fts, exp_fts)
 
+    def test_gibbs_generator_seed(self):
+        # A generator seed gives the same results whatever the number of
+        # jobs, for generators seeded alike, and advances the generator.
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        sources = pd.DataFrame([[10, 10, 10, 0, 0, 0],
+                                [0, 0, 0, 10, 10, 10]],
+                               index=['source1', 'source2'],
+                               columns=features)
+        sinks = pd.DataFrame([[5, 5, 5, 5, 5, 5], [0, 2, 4, 6, 8, 10],
+                              [9, 1, 0, 0, 1, 9]],
+                             index=['sink1', 'sink2', 'sink3'],
+                             columns=features)
+        kwargs = {'alpha1': .001, 'alpha2': .01, 'beta': 1, 'restarts': 3,
+                  'draws_per_restart': 2, 'burnin': 5, 'delay': 2}
+        # With LOO, the sinks serve as the sources.
+        for srcs, snks in [(sources, sinks), (sinks, None)]:
+            exp = gibbs(srcs, snks, jobs=1, seed=np.random.default_rng(0),
+                        **kwargs)
+            rng = np.random.default_rng(0)
+            obs = gibbs(srcs, snks, jobs=3, executor='process', seed=rng,
+                        **kwargs)
+            for o, e in zip(obs[:2], exp[:2]):
+                pd.testing.assert_frame_equal(o, e)
+            for o, e in zip(obs[2], exp[2]):
+                pd.testing.assert_frame_equal(o, e)
+            self.assertNotEqual(rng.integers(2**63),
+                                np.random.default_rng(0).integers(2**63))
+        # It is equivalent to the root seed drawn from the generator.
+        seed = np.random.SeedSequence(
+            np.random.default_rng(0).integers(2**63, size=4).tolist())
+        obs = gibbs(sources, sinks, seed=seed, **kwargs)
+        exp = gibbs(sources, sinks, seed=np.random.default_rng(0), **kwargs)
+        pd.testing.assert_frame_equal(obs[0], exp[0])
+
     def test_gibbs_close_to_sourcetracker_1(self):
         '''This test is stochastic; occasional errors might occur.
 
@@ -1234,6 +1623,864 @@ class TestGibbs(TestCase):
         np.testing.assert_allclose(obs_mpm.values, exp_mpm.values, atol=.01)
 
 
+class TestSamplerEngines(TestCase):
+    '''Tests that the sampler engines are interchangeable.'''
+
+    def setUp(self):
+        self.source_data = np.array([[10, 10, 10, 0, 0, 0],
+                                     [0, 0, 0, 10, 10, 10],
+                                     [1, 5, 0, 3, 0, 2]])
+        self.sink = np.array([5, 5, 5, 5, 5, 4])
+        self.kwargs = {'restarts': 3, 'draws_per_restart': 4, 'burnin': 5,
+                       'delay': 2}
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, get_sampler_engine, 'fortran')
+        self.assertRaises(ValueError, gibbs_sampler, self.sink,
+                          ConditionalProbability(.01, .1, 10,
+                                                 self.source_data),
+                          engine='fortran', **self.kwargs)
+
+    @skipIf(numba is None, 'numba is not installed.')
+    def test_numba_matches_python(self):
+        results = []
+        for engine in ['python', 'numba']:
+            np.random.seed(123)
+            cp = ConditionalProbability(.01, .1, 10, self.source_data)
+            results.append(gibbs_sampler(self.sink, cp, engine=engine,
+                                         **self.kwargs))
+        for obs, exp in zip(*results):
+            np.testing.assert_array_equal(obs, exp)
+
+    def test_vectorized_single_restart_matches_python(self):
+        # With a single chain the PRNG is consumed in the same order.
+        results = []
+        for engine in ['python', 'vectorized']:
+            np.random.seed(7)
+            cp = ConditionalProbability(.01, .1, 10, self.source_data)
+            results.append(gibbs_sampler(self.sink, cp, restarts=1,
+                                         draws_per_restart=3, burnin=4,
+                                         delay=2, engine=engine))
+        for obs, exp in zip(*results):
+            np.testing.assert_array_equal(obs, exp)
+
+    def test_vectorized_bookkeeping(self):
+        cp = ConditionalProbability(.01, .1, 10, self.source_data)
+        ec, ea, ta = gibbs_sampler(self.sink, cp, engine='vectorized',
+                                   **self.kwargs)
+        self.assertEqual(ec.shape, (12, 4))
+        np.testing.assert_array_equal(ec.sum(1), np.repeat(29, 12))
+        for i in range(12):
+            np.testing.assert_array_equal(np.bincount(ea[i], minlength=4),
+                                          ec[i])
+            np.testing.assert_array_equal(np.bincount(ta[i], minlength=6),
+                                          self.sink)
+        # Restarts are independent chains.
+        self.assertFalse((ea[0] == ea[4]).all())
+
+    @skipIf(numba is None, 'numba is not installed.')
+    def test_gibbs_numba_matches_python(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        sources = pd.DataFrame(self.source_data, columns=features,
+                               index=['source1', 'source2', 'source3'])
+        sinks = pd.DataFrame(np.vstack((self.sink, self.sink[::-1])),
+                             index=['sink1', 'sink2'], columns=features)
+        results = []
+        for engine in ['python', 'numba']:
+            np.random.seed(42)
+            results.append(gibbs(sources, sinks, alpha1=.001, alpha2=.01,
+                                 beta=1, engine=engine, **self.kwargs))
+        pd.util.testing.assert_frame_equal(results[0][0], results[1][0])
+        pd.util.testing.assert_frame_equal(results[0][1], results[1][1])
+        for obs, exp in zip(results[0][2], results[1][2]):
+            pd.util.testing.assert_frame_equal(obs, exp)
+
+    def test_seed_gives_identical_results_across_engines(self):
+        engines = ['python', 'vectorized']
+        if numba is not None:
+            engines.append('numba')
+        results = []
+        for engine in engines:
+            cp = ConditionalProbability(.01, .1, 10, self.source_data)
+            results.append(gibbs_sampler(self.sink, cp, engine=engine,
+                                         seed=11, **self.kwargs))
+        for result in results[1:]:
+            for obs, exp in zip(result, results[0]):
+                np.testing.assert_array_equal(obs, exp)
+        # The global state is neither used nor modified.
+        np.random.seed(0)
+        cp = ConditionalProbability(.01, .1, 10, self.source_data)
+        gibbs_sampler(self.sink, cp, seed=11, **self.kwargs)
+        self.assertEqual(np.random.randint(1000), 684)
+        # Different seeds give different chains.
+        cp = ConditionalProbability(.01, .1, 10, self.source_data)
+        obs = gibbs_sampler(self.sink, cp, seed=12, **self.kwargs)
+        self.assertFalse((obs[1] == results[0][1]).all())
+
+    def test_gibbs_seed_independent_of_jobs_and_engine(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        sources = pd.DataFrame(self.source_data, columns=features,
+                               index=['source1', 'source2', 'source3'])
+        sinks = pd.DataFrame(np.vstack((self.sink, self.sink[::-1],
+                                        self.sink + 1)),
+                             index=['sink1', 'sink2', 'sink3'],
+                             columns=features)
+        results = []
+        for engine, jobs in [('python', 1), ('python', 2),
+                             ('vectorized', 1), ('vectorized', 3)]:
+            results.append(gibbs(sources, sinks, alpha1=.001, alpha2=.01,
+                                 beta=1, engine=engine, jobs=jobs, seed=5,
+                                 **self.kwargs))
+        for result in results[1:]:
+            pd.util.testing.assert_frame_equal(result[0], results[0][0])
+            pd.util.testing.assert_frame_equal(result[1], results[0][1])
+        # LOO predictions are reproducible too.
+        loo = [gibbs(sources, alpha1=.001, alpha2=.01, beta=1, jobs=jobs,
+                     seed=5, **self.kwargs)[0] for jobs in [1, 2]]
+        pd.util.testing.assert_frame_equal(loo[0], loo[1])
+
+
+class TestSparseModel(TestCase):
+    '''Tests that restricting the model to a sink's features is exact.'''
+
+    def setUp(self):
+        self.source_data = np.array([[10, 10, 10, 0, 0, 0, 4, 1],
+                                     [0, 0, 0, 10, 10, 10, 0, 2],
+                                     [1, 5, 0, 3, 0, 2, 7, 0]])
+        self.sinks = np.array([[5, 0, 5, 0, 5, 0, 0, 5],
+                               [0, 2, 0, 8, 0, 0, 10, 0],
+                               [0, 0, 9, 0, 0, 11, 0, 0]])
+        self.kwargs = {'restarts': 3, 'draws_per_restart': 2, 'burnin': 4,
+                       'delay': 2, 'seed': 9}
+
+    def assert_results_equal(self, obs, exp):
+        for o, e in zip(obs, exp):
+            np.testing.assert_array_equal(o, e)
+
+    def test_gibbs_sampler(self):
+        engines = ['python', 'vectorized']
+        if numba is not None:
+            engines.append('numba')
+        for engine in engines:
+            for sink in self.sinks:
+                results = []
+                for sparse_model in [False, True]:
+                    cp = ConditionalProbability(.01, .1, 10, self.source_data)
+                    results.append(gibbs_sampler(sink, cp, engine=engine,
+                                                 sparse_model=sparse_model,
+                                                 **self.kwargs))
+                self.assert_results_equal(*results)
+
+    def test_float32_engines_identical(self):
+        engines = ['python', 'vectorized']
+        if numba is not None:
+            engines.append('numba')
+        results = []
+        for engine in engines:
+            cp = ConditionalProbability(.01, .1, 10, self.source_data,
+                                        dtype=np.float32)
+            results.append(gibbs_sampler(self.sinks[0], cp, engine=engine,
+                                         sparse_model=True, **self.kwargs))
+        for result in results[1:]:
+            self.assert_results_equal(result, results[0])
+
+    def test_feature_blocks(self):
+        results = []
+        for sparse_model in [False, True]:
+            cp = ConditionalProbability(.01, .1, 10, self.source_data)
+            results.append(feature_block_gibbs_sampler(
+                self.sinks[0], cp, sparse_model=sparse_model, **self.kwargs))
+        self.assert_results_equal(*results)
+
+    def test_batch(self):
+        seeds = spawn_seeds(1, 3)
+        kwargs = self.kwargs.copy()
+        kwargs.pop('seed')
+        results = []
+        for sparse_model in [False, True]:
+            cp = ConditionalProbability(.01, .1, 10, self.source_data)
+            results.append(gibbs_sampler_batch(self.sinks, cp, seeds=seeds,
+                                               sparse_model=sparse_model,
+                                               **kwargs))
+        for obs, exp in zip(*results):
+            self.assert_results_equal(obs, exp)
+
+    def test_csr_sinks(self):
+        # CSR sinks (as sent to the tasks of a sparse table) give the
+        # results of the dense sinks, whether or not they are densified.
+        sinks = scipy.sparse.csr_matrix(self.sinks)
+        engines = ['python', 'vectorized']
+        if numba is not None:
+            engines.append('numba')
+        for engine in engines:
+            for sparse_model in [False, True]:
+                for i, sink in enumerate(self.sinks):
+                    exp = gibbs_sampler(sink, ConditionalProbability(
+                        .01, .1, 10, self.source_data), engine=engine,
+                        sparse_model=sparse_model, **self.kwargs)
+                    obs = gibbs_sampler(sinks[i], ConditionalProbability(
+                        .01, .1, 10, self.source_data), engine=engine,
+                        sparse_model=sparse_model, **self.kwargs)
+                    self.assert_results_equal(obs, exp)
+        seeds = spawn_seeds(1, 3)
+        kwargs = self.kwargs.copy()
+        kwargs.pop('seed')
+        for engine in engines:
+            for sparse_model in [False, True]:
+                exp = gibbs_sampler_batch(self.sinks, ConditionalProbability(
+                    .01, .1, 10, self.source_data), seeds=seeds,
+                    engine=engine, sparse_model=sparse_model, **kwargs)
+                obs = gibbs_sampler_batch(sinks, ConditionalProbability(
+                    .01, .1, 10, self.source_data), seeds=seeds,
+                    engine=engine, sparse_model=sparse_model, **kwargs)
+                for o, e in zip(obs, exp):
+                    self.assert_results_equal(o, e)
+
+    def test_csr_model_columns(self):
+        # Only the features present in CSR sinks are densified, explicit
+        # zeros included.
+        sinks = scipy.sparse.csr_matrix(self.sinks)
+        features, taxon_sequences = _model_columns(sinks[[1]], True)
+        np.testing.assert_array_equal(features, [1, 3, 6])
+        np.testing.assert_array_equal(taxon_sequences,
+                                      [[0] * 2 + [1] * 8 + [2] * 10])
+        sink = sinks[0]
+        sink.data[0] = 0
+        features, taxon_sequences = _model_columns(sink, True)
+        np.testing.assert_array_equal(features, [2, 4, 7])
+        np.testing.assert_array_equal(taxon_sequences,
+                                      [[0] * 5 + [1] * 5 + [2] * 5])
+
+
+class TestAdaptiveBurnin(TestCase):
+
+    def setUp(self):
+        self.source_data = np.array([[100, 100, 100, 0, 0, 0],
+                                     [0, 0, 0, 100, 100, 100],
+                                     [10, 50, 0, 30, 0, 20]])
+        self.sinks = np.array([[50, 50, 50, 0, 0, 0],
+                               [10, 20, 30, 40, 50, 0],
+                               [0, 0, 5, 60, 60, 25]])
+        self.kwargs = {'restarts': 4, 'draws_per_restart': 3, 'burnin': 200,
+                       'delay': 2, 'adaptive_burnin': True, 'seed': 2}
+
+    def test_potential_scale_reduction(self):
+        chains = np.random.RandomState(0).uniform(size=(4, 50, 3))
+        chains[1, :, 2] += 1
+        n = chains.shape[1]
+        means = chains.mean(1)
+        W = chains.var(1, ddof=1).mean(0)
+        B = n * means.var(0, ddof=1)
+        exp = np.sqrt(((n - 1) / n * W + B / n) / W)
+        obs = _potential_scale_reduction(chains.sum(1),
+                                         (chains ** 2).sum(1), n)
+        np.testing.assert_array_almost_equal(obs, exp)
+        self.assertTrue(obs[2] > 1.5)
+        # Identical, constant chains have converged; constant chains which
+        # disagree have not.
+        ones = np.ones((3, 10, 2))
+        np.testing.assert_array_equal(
+            _potential_scale_reduction(ones.sum(1), ones.sum(1), 10), [1, 1])
+        ones[0] = 0
+        np.testing.assert_array_equal(
+            _potential_scale_reduction(ones.sum(1), ones.sum(1), 10),
+            [np.inf, np.inf])
+
+    def test_gibbs_sampler(self):
+        cp = ConditionalProbability(.001, .01, 1, self.source_data)
+        ec, ea, ta, passes = gibbs_sampler(self.sinks[0], cp, **self.kwargs)
+        # A sink drawn from a single source converges long before the cap.
+        self.assertTrue(passes < 200)
+        self.assertEqual(ec.shape, (12, 4))
+        for i in range(12):
+            np.testing.assert_array_equal(np.bincount(ea[i], minlength=4),
+                                          ec[i])
+        self.assertTrue((ec[:, 0] > ec[:, 1:].sum(1)).all())
+        # With a threshold that can not be met the cap is used.
+        obs = gibbs_sampler(self.sinks[0], cp, rhat=1 + 1e-12,
+                            **dict(self.kwargs, burnin=15))
+        self.assertEqual(obs[3], 15 + 2 * 2 + 1)
+
+    def test_engines_identical(self):
+        engines = ['python', 'vectorized']
+        if numba is not None:
+            engines.append('numba')
+        results = []
+        for engine in engines:
+            cp = ConditionalProbability(.001, .01, 1, self.source_data)
+            results.append(gibbs_sampler(self.sinks[1], cp, engine=engine,
+                                         **self.kwargs))
+        for result in results[1:]:
+            for obs, exp in zip(result, results[0]):
+                np.testing.assert_array_equal(obs, exp)
+
+    def test_batch(self):
+        kwargs = self.kwargs.copy()
+        seed = kwargs.pop('seed')
+        seeds = spawn_seeds(seed, 3)
+        cp = ConditionalProbability(.001, .01, 1, self.source_data)
+        # Sinks of equal depth burn in together but stop on their own.
+        sinks = np.vstack((self.sinks, self.sinks[[0]]))
+        obs = gibbs_sampler_batch(sinks, cp, seeds=seeds + seeds[:1],
+                                  **kwargs)
+        for sink, s, result in zip(self.sinks, seeds, obs):
+            cp = ConditionalProbability(.001, .01, 1, self.source_data)
+            exp = gibbs_sampler(sink, cp, engine='vectorized', seed=s,
+                                **kwargs)
+            for o, e in zip(result, exp):
+                np.testing.assert_array_equal(o, e)
+
+    def test_gibbs(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        sources = pd.DataFrame(self.source_data, columns=features,
+                               index=['source1', 'source2', 'source3'])
+        sinks = pd.DataFrame(self.sinks, columns=features,
+                             index=['sink1', 'sink2', 'sink3'])
+        mpm, mps, fas, passes = gibbs(sources, sinks, alpha1=.001,
+                                      alpha2=.01, beta=1, jobs=2,
+                                      **self.kwargs)
+        self.assertEqual(list(passes.index), ['sink1', 'sink2', 'sink3'])
+        self.assertTrue((passes <= 205).all())
+        self.assertTrue(mpm.loc['sink1', 'source1'] > .8)
+
+        kwargs = self.kwargs.copy()
+        kwargs.pop('restarts')
+        self.assertRaises(ValueError, gibbs, sources, sinks, restarts=1,
+                          **kwargs)
+        self.assertRaises(ValueError, gibbs, sources, sinks, rhat=1.,
+                          **self.kwargs)
+        self.assertRaises(ValueError, gibbs, sources, sinks,
+                          feature_blocks=True, **self.kwargs)
+
+
+class TestAccumulateDraws(TestCase):
+    '''Tests that accumulated feature counts match the per-draw output.'''
+
+    def setUp(self):
+        self.source_data = np.array([[10, 10, 10, 0, 0, 0, 4, 1],
+                                     [0, 0, 0, 10, 10, 10, 0, 2]])
+        self.sinks = np.array([[5, 0, 5, 0, 5, 0, 0, 5],
+                               [0, 2, 0, 8, 0, 0, 10, 0]])
+        self.kwargs = {'restarts': 2, 'draws_per_restart': 3, 'burnin': 4,
+                       'delay': 2, 'seed': 5}
+        self.source_ids = np.array(['source1', 'source2'])
+        self.feature_ids = np.array(['o%d' % i for i in range(8)])
+
+    def expected(self, result):
+        return single_sink_feature_table(result[1], result[2],
+                                         self.source_ids,
+                                         self.feature_ids).values
+
+    def test_gibbs_sampler(self):
+        engines = ['python', 'vectorized']
+        if numba is not None:
+            engines.append('numba')
+        for engine in engines:
+            for sparse_model in [False, True]:
+                for sink in self.sinks:
+                    cp = ConditionalProbability(.01, .1, 10, self.source_data)
+                    exp = gibbs_sampler(sink, cp, engine=engine,
+                                        sparse_model=sparse_model,
+                                        **self.kwargs)
+                    cp = ConditionalProbability(.01, .1, 10, self.source_data)
+                    obs = gibbs_sampler(sink, cp, engine=engine,
+                                        sparse_model=sparse_model,
+                                        accumulate_draws=True, **self.kwargs)
+                    self.assertEqual(len(obs), 2)
+                    np.testing.assert_array_equal(obs[0], exp[0])
+                    np.testing.assert_array_equal(obs[1], self.expected(exp))
+
+    def test_feature_blocks(self):
+        for sink in self.sinks:
+            cp = ConditionalProbability(.01, .1, 10, self.source_data)
+            exp = feature_block_gibbs_sampler(sink, cp, **self.kwargs)
+            cp = ConditionalProbability(.01, .1, 10, self.source_data)
+            obs = feature_block_gibbs_sampler(sink, cp, accumulate_draws=True,
+                                              **self.kwargs)
+            np.testing.assert_array_equal(obs[0], exp[0])
+            np.testing.assert_array_equal(obs[1], self.expected(exp))
+
+    def test_batch(self):
+        kwargs = self.kwargs.copy()
+        seeds = spawn_seeds(kwargs.pop('seed'), 2)
+        cp = ConditionalProbability(.01, .1, 10, self.source_data)
+        exp = gibbs_sampler_batch(self.sinks, cp, seeds=seeds, **kwargs)
+        cp = ConditionalProbability(.01, .1, 10, self.source_data)
+        obs = gibbs_sampler_batch(self.sinks, cp, seeds=seeds,
+                                  accumulate_draws=True, **kwargs)
+        for o, e in zip(obs, exp):
+            np.testing.assert_array_equal(o[0], e[0])
+            np.testing.assert_array_equal(o[1], self.expected(e))
+
+    def test_collate_gibbs_results(self):
+        results = []
+        for sink in self.sinks:
+            cp = ConditionalProbability(.01, .1, 10, self.source_data)
+            results.append(gibbs_sampler(sink, cp, **self.kwargs))
+        sink_ids = np.array(['sink1', 'sink2'])
+        exp = collate_gibbs_results([i[0] for i in results],
+                                    [i[1] for i in results],
+                                    [i[2] for i in results], sink_ids,
+                                    self.source_ids, self.feature_ids, True,
+                                    False)
+        obs = collate_gibbs_results([i[0] for i in results], None, None,
+                                    sink_ids, self.source_ids,
+                                    self.feature_ids, True, False,
+                                    all_feature_counts=[self.expected(i) for
+                                                        i in results])
+        pd.testing.assert_frame_equal(obs[0], exp[0])
+        for o, e in zip(obs[2], exp[2]):
+            pd.testing.assert_frame_equal(o, e)
+
+
+class TestSharedModel(TestCase):
+
+    def setUp(self):
+        self.source_data = np.array([[10, 10, 10, 0, 0, 0],
+                                     [0, 0, 0, 10, 10, 10],
+                                     [1, 2, 3, 4, 5, 6]])
+        self.sink = np.array([5, 5, 5, 1, 0, 0])
+        self.kwargs = {'restarts': 2, 'draws_per_restart': 2, 'burnin': 3,
+                       'delay': 2}
+
+    def attach(self, dtype=np.float64):
+        cp = ConditionalProbability(.01, .1, 10, self.source_data,
+                                    dtype=dtype)
+        blocks, specs = _share_arrays({'m_xivs': cp.m_xivs, 'm_vs': cp.m_vs})
+        for shm in blocks:
+            self.addCleanup(shm.unlink)
+            self.addCleanup(shm.close)
+        cp.m_xivs = cp.m_vs = None
+        cp, attached = _attach_shared_model(cp, specs)
+        for shm in attached:
+            self.addCleanup(shm.close)
+        self.assertFalse(cp.m_xivs.flags.writeable)
+        return cp
+
+    def test_gibbs_sink(self):
+        cp = ConditionalProbability(.01, .1, 10, self.source_data,
+                                    dtype=np.float32)
+        exp = gibbs_sampler(self.sink, cp, seed=4, **self.kwargs)
+        shared_cp = self.attach(np.float32)
+        kwargs = self.kwargs.copy()
+        obs = _gibbs_sink((self.sink, 4, kwargs.pop('restarts')), shared_cp,
+                          **kwargs)
+        for o, e in zip(obs, exp):
+            np.testing.assert_array_equal(o, e)
+
+    def test_gibbs_loo(self):
+        cp = ConditionalProbability(.01, .1, 10, self.source_data[[0, 2]])
+        exp = gibbs_sampler(self.source_data[1], cp, seed=4, **self.kwargs)
+        shared_cp = self.attach()
+        kwargs = self.kwargs.copy()
+        obs = _gibbs_loo((1, self.source_data[1], 4, kwargs.pop('restarts')),
+                         shared_cp, **kwargs)
+        for o, e in zip(obs, exp):
+            np.testing.assert_array_equal(o, e)
+
+
+class TestRestartChunks(TestCase):
+
+    def test_schedule_restart_chunks(self):
+        # One unit per job: the units are ordered by depth.
+        obs = _schedule_restart_chunks([10, 30, 20], 4, 5, 3)
+        self.assertEqual(obs, [(1, 0, 4), (2, 0, 4), (0, 0, 4)])
+        # Fewer units than jobs: restarts are split, deepest chunks first.
+        obs = _schedule_restart_chunks([10, 30], 5, 5, 4)
+        self.assertEqual(obs, [(1, 0, 3), (1, 3, 5), (0, 0, 3), (0, 3, 5)])
+        # Never more chunks than restarts, and none when not splitting.
+        obs = _schedule_restart_chunks([10], 2, 5, 8)
+        self.assertEqual(obs, [(0, 0, 1), (0, 1, 2)])
+        obs = _schedule_restart_chunks([10], 2, 5, 8, split_restarts=False)
+        self.assertEqual(obs, [(0, 0, 2)])
+
+    def test_gibbs_seeded_results_independent_of_chunks(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        sources = pd.DataFrame([[10, 10, 10, 0, 0, 0],
+                                [0, 0, 0, 10, 10, 10],
+                                [1, 2, 3, 4, 5, 6]], columns=features,
+                               index=['source1', 'source2', 'source3'])
+        sinks = pd.DataFrame([[5, 5, 5, 1, 0, 0], [0, 1, 2, 3, 4, 5]],
+                             index=['sink1', 'sink2'], columns=features)
+        kwargs = {'alpha1': .001, 'alpha2': .01, 'beta': 1, 'restarts': 5,
+                  'draws_per_restart': 2, 'burnin': 5, 'delay': 2, 'seed': 7}
+        for engine in ['python', 'vectorized']:
+            exp = gibbs(sources, sinks, engine=engine, jobs=1, **kwargs)
+            obs = gibbs(sources, sinks, engine=engine, jobs=4, **kwargs)
+            pd.util.testing.assert_frame_equal(obs[0], exp[0])
+            pd.util.testing.assert_frame_equal(obs[1], exp[1])
+            for o, e in zip(obs[2], exp[2]):
+                pd.util.testing.assert_frame_equal(o, e)
+        exp = gibbs(sources, jobs=1, **kwargs)
+        obs = gibbs(sources, jobs=4, **kwargs)
+        for o, e in zip(obs[:2], exp[:2]):
+            pd.util.testing.assert_frame_equal(o, e)
+
+
+class _CountingExecutor(ThreadPoolExecutor):
+    '''Thread pool recording the most tasks that ran at once.'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most_running = 0
+
+    def _run(self, fn, *args):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        try:
+            return fn(*args)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def submit(self, fn, *args):
+        return super().submit(self._run, fn, *args)
+
+
+class TestJobSizing(TestCase):
+
+    def setUp(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        self.sources = pd.DataFrame([[10, 10, 10, 0, 0, 0],
+                                     [0, 0, 0, 10, 10, 10],
+                                     [1, 2, 3, 4, 5, 6]], columns=features,
+                                    index=['source1', 'source2', 'source3'])
+        self.sinks = pd.DataFrame([[5, 5, 5, 1, 0, 0], [0, 1, 2, 3, 4, 5],
+                                   [3, 3, 3, 3, 3, 3]],
+                                  index=['sink1', 'sink2', 'sink3'],
+                                  columns=features)
+        self.kwargs = {'alpha1': .001, 'alpha2': .01, 'beta': 1,
+                       'restarts': 3, 'draws_per_restart': 2, 'burnin': 5,
+                       'delay': 2, 'seed': 7}
+
+    def test_parse_memory(self):
+        self.assertEqual(parse_memory(None), None)
+        self.assertEqual(parse_memory(1000), 1000)
+        self.assertEqual(parse_memory('512'), 512)
+        self.assertEqual(parse_memory('2k'), 2048)
+        self.assertEqual(parse_memory('1.5G'), 1536 * 1024 ** 2)
+        self.assertEqual(parse_memory('16GB'), 16 * 1024 ** 3)
+        for memory in ['16X', 'G', '', -1, 0, 1.5]:
+            self.assertRaises(ValueError, parse_memory, memory)
+
+    def test_task_memory(self):
+        # Deeper sinks, more model columns and chains grown together need
+        # more memory.
+        exp = _task_memory(100, 1, 4, 3, 10, False)
+        self.assertGreater(_task_memory(200, 1, 4, 3, 10, False), exp)
+        self.assertGreater(_task_memory(100, 1, 4, 3, 20, False), exp)
+        self.assertGreater(_task_memory(100, 1, 4, 3, 10, True), exp)
+        self.assertEqual(_task_memory(100, 2, 4, 3, 10, False), 2 * exp)
+
+    def test_resolve_jobs(self):
+        cpus = _available_cpus()
+        self.assertEqual(_resolve_jobs(3, 'process', 1, 10, 10, 1), 3)
+        self.assertEqual(_resolve_jobs('auto', 'process', 1000, 10, 10, None),
+                         cpus)
+        self.assertEqual(_resolve_jobs('auto', 'process', 1, 10, 10, None), 1)
+        # The workers of an executor object are all used.
+        with ThreadPoolExecutor(5) as executor:
+            self.assertEqual(_resolve_jobs('auto', executor, 1000, 10, 10,
+                                           None), 5)
+            self.assertEqual(_resolve_jobs('auto', executor, 1000, 10, 10,
+                                           60), 3)
+        # At least one job is run whatever the budget.
+        self.assertEqual(_resolve_jobs('auto', 'process', 1000, 10, 10, 5), 1)
+
+    def test_auto_jobs_and_max_memory(self):
+        for engine in ['python', 'vectorized']:
+            exp = gibbs(self.sources, self.sinks, engine=engine, jobs=1,
+                        **self.kwargs)
+            for jobs, max_memory in [('auto', None), ('auto', '1K'),
+                                     (3, 1)]:
+                obs = gibbs(self.sources, self.sinks, engine=engine,
+                            jobs=jobs, max_memory=max_memory, **self.kwargs)
+                pd.util.testing.assert_frame_equal(obs[0], exp[0])
+                pd.util.testing.assert_frame_equal(obs[1], exp[1])
+                for o, e in zip(obs[2], exp[2]):
+                    pd.util.testing.assert_frame_equal(o, e)
+
+    def test_max_memory_limits_running_tasks(self):
+        kwargs = dict(self.kwargs, burnin=500, jobs=3)
+        with _CountingExecutor(3) as executor:
+            gibbs(self.sources, self.sinks, executor=executor, max_memory=1,
+                  **kwargs)
+        # No task fits in the budget, so they run one at a time.
+        self.assertEqual(executor.most_running, 1)
+
+    def test_invalid(self):
+        for jobs in [0, -1, 1.5, 'all']:
+            self.assertRaises(ValueError, gibbs, self.sources, self.sinks,
+                              jobs=jobs)
+        self.assertRaises(ValueError, iter_gibbs, self.sources, self.sinks,
+                          max_memory='lots')
+
+
+class TestIterGibbs(TestCase):
+
+    def setUp(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        self.sources = pd.DataFrame([[10, 10, 10, 0, 0, 0],
+                                     [0, 0, 0, 10, 10, 10],
+                                     [1, 2, 3, 4, 5, 6]], columns=features,
+                                    index=['source1', 'source2', 'source3'])
+        self.sinks = pd.DataFrame([[5, 5, 5, 1, 0, 0], [0, 1, 2, 3, 4, 5],
+                                   [3, 3, 3, 3, 3, 3]],
+                                  index=['sink1', 'sink2', 'sink3'],
+                                  columns=features)
+        self.kwargs = {'alpha1': .001, 'alpha2': .01, 'beta': 1,
+                       'restarts': 3, 'draws_per_restart': 2, 'burnin': 5,
+                       'delay': 2, 'seed': 7, 'jobs': 2}
+
+    def assert_matches_gibbs(self, results, exp, sink_ids, num_envs):
+        self.assertEqual(sorted(r.sink_id for r in results), sorted(sink_ids))
+        for result in results:
+            i = list(sink_ids).index(result.sink_id)
+            pd.util.testing.assert_series_equal(
+                result.proportions, exp[0].loc[result.sink_id])
+            pd.util.testing.assert_series_equal(
+                result.proportions_std, exp[1].loc[result.sink_id])
+            np.testing.assert_array_equal(result.feature_table.values,
+                                          exp[2][i].values)
+            self.assertEqual(list(result.feature_table.index),
+                             list(exp[2][i].index))
+            self.assertEqual(result.envcounts.shape, (6, num_envs))
+
+    def test_matches_gibbs(self):
+        for engine in ['python', 'vectorized']:
+            exp = gibbs(self.sources, self.sinks, engine=engine,
+                        **self.kwargs)
+            results = list(iter_gibbs(self.sources, self.sinks, engine=engine,
+                                      **self.kwargs))
+            self.assert_matches_gibbs(results, exp, self.sinks.index, 4)
+            self.assertTrue(all(r.passes is None for r in results))
+
+    def test_loo(self):
+        exp = gibbs(self.sources, **self.kwargs)
+        results = list(iter_gibbs(self.sources, **self.kwargs))
+        # The held out source has no column in the envcounts.
+        self.assert_matches_gibbs(results, exp, self.sources.index, 3)
+        for result in results:
+            self.assertEqual(result.proportions[result.sink_id], 0)
+
+    def test_adaptive_burnin(self):
+        kwargs = dict(self.kwargs, adaptive_burnin=True, burnin=50)
+        exp = gibbs(self.sources, self.sinks, **kwargs)
+        for result in iter_gibbs(self.sources, self.sinks, **kwargs):
+            self.assertEqual(result.passes, exp[3][result.sink_id])
+
+    def test_validation_is_eager(self):
+        self.assertRaises(ValueError, iter_gibbs, self.sources, self.sinks,
+                          restarts=0)
+        # Without feature tables nothing but the proportions is collated.
+        results = iter_gibbs(self.sources, self.sinks,
+                             create_feature_tables=False, **self.kwargs)
+        self.assertTrue(next(results).feature_table is None)
+        results.close()
+
+
+class TestGibbsReplicates(TestCase):
+
+    def setUp(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        self.sources = pd.DataFrame([[10, 10, 10, 0, 0, 0],
+                                     [0, 0, 0, 10, 10, 10],
+                                     [1, 2, 3, 4, 5, 6]], columns=features,
+                                    index=['source1', 'source2', 'source3'])
+        self.sinks = pd.DataFrame([[5, 5, 5, 1, 0, 0], [0, 1, 2, 3, 4, 5],
+                                   [3, 3, 3, 3, 3, 3]],
+                                  index=['sink1', 'sink2', 'sink3'],
+                                  columns=features)
+        self.replicates = [(subsample_dataframe(self.sources, 12, seed=i),
+                            subsample_dataframe(self.sinks, 8, seed=i))
+                           for i in range(3)]
+        self.kwargs = {'alpha1': .001, 'alpha2': .01, 'beta': 1,
+                       'restarts': 3, 'draws_per_restart': 2, 'burnin': 5,
+                       'delay': 2, 'jobs': 2}
+
+    def test_pooled_draws(self):
+        # The draws of each replicate are those of `gibbs` on it, with the
+        # seed derived for the replicate.
+        seeds = spawn_seeds(7, 3)
+        for loo in [False, True]:
+            replicates = [(sources, None if loo else sinks)
+                          for sources, sinks in self.replicates]
+            exp = [list(iter_gibbs(sources, sinks, seed=seed, **self.kwargs))
+                   for (sources, sinks), seed in zip(replicates, seeds)]
+            mpm, mps, fas = gibbs_replicates(replicates, seed=7,
+                                             **self.kwargs)
+            results = list(iter_gibbs_replicates(replicates, seed=7,
+                                                 executor='thread',
+                                                 **self.kwargs))
+            self.assertEqual(len(results), 3)
+            for result in results:
+                i = list(mpm.index).index(result.sink_id)
+                parts = [[r for r in replicate if
+                          r.sink_id == result.sink_id][0] for replicate in exp]
+                envcounts = np.concatenate([r.envcounts for r in parts])
+                np.testing.assert_array_equal(result.envcounts, envcounts)
+                props = envcounts.sum(0) / envcounts.sum()
+                if loo:
+                    props = np.insert(props, i, 0)
+                np.testing.assert_allclose(mpm.iloc[i], props)
+                np.testing.assert_allclose(result.proportions, props)
+                pd.util.testing.assert_series_equal(
+                    result.proportions_std, mps.iloc[i])
+                np.testing.assert_array_equal(
+                    fas[i].values, sum(r.feature_table.values for r in parts))
+
+    def test_single_replicate(self):
+        exp = gibbs(*self.replicates[0], seed=spawn_seeds(7, 1)[0],
+                    **self.kwargs)
+        obs = gibbs_replicates(self.replicates[:1], seed=7, **self.kwargs)
+        for obs_table, exp_table in zip(obs[:2], exp[:2]):
+            pd.util.testing.assert_frame_equal(obs_table, exp_table)
+
+    def test_adaptive_burnin(self):
+        kwargs = dict(self.kwargs, adaptive_burnin=True, burnin=50)
+        passes = [gibbs(sources, sinks, seed=seed, **kwargs)[3]
+                  for (sources, sinks), seed in zip(self.replicates,
+                                                    spawn_seeds(7, 3))]
+        obs = gibbs_replicates(self.replicates, seed=7, **kwargs)
+        pd.util.testing.assert_series_equal(obs[3],
+                                            pd.concat(passes, axis=1).max(1),
+                                            check_names=False)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, gibbs_replicates, [])
+        sources, sinks = self.replicates[0]
+        for replicate in [(sources.iloc[::-1], sinks),
+                          (sources, sinks.iloc[::-1]),
+                          (sources, None)]:
+            self.assertRaises(ValueError, gibbs_replicates,
+                              [self.replicates[0], replicate])
+        self.assertRaises(ValueError, iter_gibbs_replicates,
+                          self.replicates, restarts=0)
+
+
+class TestGibbsSamplerBatch(TestCase):
+
+    def setUp(self):
+        self.source_data = np.array([[10, 10, 10, 0, 0, 0],
+                                     [0, 0, 0, 10, 10, 10]])
+        self.sinks = np.array([[5, 5, 5, 0, 0, 0],
+                               [0, 0, 0, 5, 5, 5],
+                               [1, 2, 3, 4, 5, 6],
+                               [3, 3, 3, 2, 2, 2]])
+        self.kwargs = {'restarts': 2, 'draws_per_restart': 3, 'burnin': 10,
+                       'delay': 2}
+
+    def test_bookkeeping(self):
+        cp = ConditionalProbability(.001, .01, 1, self.source_data)
+        results = gibbs_sampler_batch(self.sinks, cp, **self.kwargs)
+        self.assertEqual(len(results), 4)
+        for sink, (ec, ea, ta) in zip(self.sinks, results):
+            self.assertEqual(ec.shape, (6, 3))
+            self.assertEqual(ea.shape, (6, sink.sum()))
+            for i in range(6):
+                np.testing.assert_array_equal(np.bincount(ta[i], minlength=6),
+                                              sink)
+                np.testing.assert_array_equal(
+                    np.bincount(ea[i], minlength=3), ec[i])
+        # Sinks drawn entirely from one source are mostly assigned to it.
+        self.assertTrue((results[0][0][:, 0] > results[0][0][:, 1]).all())
+        self.assertTrue((results[1][0][:, 1] > results[1][0][:, 0]).all())
+
+    def test_single_sink_matches_gibbs_sampler(self):
+        results = []
+        np.random.seed(3)
+        cp = ConditionalProbability(.001, .01, 1, self.source_data)
+        results.append(gibbs_sampler_batch(self.sinks[2:3], cp,
+                                           **self.kwargs)[0])
+        np.random.seed(3)
+        cp = ConditionalProbability(.001, .01, 1, self.source_data)
+        results.append(gibbs_sampler(self.sinks[2], cp, engine='vectorized',
+                                     **self.kwargs))
+        for obs, exp in zip(*results):
+            np.testing.assert_array_equal(obs, exp)
+
+    def test_other_engines(self):
+        np.random.seed(3)
+        cp = ConditionalProbability(.001, .01, 1, self.source_data)
+        obs = gibbs_sampler_batch(self.sinks, cp, engine='python',
+                                  **self.kwargs)
+        np.random.seed(3)
+        for sink, result in zip(self.sinks, obs):
+            cp = ConditionalProbability(.001, .01, 1, self.source_data)
+            exp = gibbs_sampler(sink, cp, **self.kwargs)
+            for o, e in zip(result, exp):
+                np.testing.assert_array_equal(o, e)
+
+    def test_gibbs(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        sources = pd.DataFrame(self.source_data, index=['source1', 'source2'],
+                               columns=features)
+        sinks = pd.DataFrame(self.sinks, columns=features,
+                             index=['sink%d' % i for i in range(4)])
+        mpm, mps, fts = gibbs(sources, sinks, alpha1=.001, alpha2=.01, beta=1,
+                              engine='vectorized', jobs=2, **self.kwargs)
+        self.assertEqual(mpm.shape, (4, 3))
+        self.assertTrue(mpm.loc['sink0', 'source1'] > .8)
+        self.assertTrue(mpm.loc['sink1', 'source2'] > .8)
+        for sink, ft in zip(self.sinks, fts):
+            np.testing.assert_array_equal(ft.sum(0).values, sink * 6)
+
+
+class TestFeatureBlockGibbsSampler(TestCase):
+
+    def setUp(self):
+        self.source_data = np.array([[100, 100, 100, 0, 0, 0],
+                                     [0, 0, 0, 100, 100, 100]])
+        self.sink = np.array([300, 0, 300, 0, 0, 400])
+
+    def test_bookkeeping(self):
+        cp = ConditionalProbability(.01, .1, 10, self.source_data)
+        ec, ea, ta = feature_block_gibbs_sampler(self.sink, cp, restarts=2,
+                                                 draws_per_restart=3,
+                                                 burnin=2, delay=2)
+        self.assertEqual(ec.shape, (6, 3))
+        self.assertEqual(ea.shape, (6, 1000))
+        self.assertEqual(ta.shape, (6, 1000))
+        np.testing.assert_array_equal(ec.sum(1), np.repeat(1000, 6))
+        for i in range(6):
+            # Every draw accounts for each sequence of the sink exactly once.
+            np.testing.assert_array_equal(np.bincount(ta[i], minlength=6),
+                                          self.sink)
+            np.testing.assert_array_equal(np.bincount(ea[i], minlength=3),
+                                          ec[i])
+
+    def test_agrees_with_gibbs_sampler(self):
+        # This test is stochastic, but the expected proportions are far
+        # apart relative to the tolerance.
+        sinks = [self.sink, np.array([150, 150, 150, 50, 50, 50])]
+        for sink in sinks:
+            proportions = []
+            for sampler in [gibbs_sampler, feature_block_gibbs_sampler]:
+                cp = ConditionalProbability(.001, .1, 10, self.source_data)
+                ec, _, _ = sampler(sink, cp, restarts=3, draws_per_restart=5,
+                                   burnin=20, delay=2)
+                proportions.append(ec.sum(0) / ec.sum())
+            np.testing.assert_allclose(proportions[0], proportions[1],
+                                       atol=.1)
+
+    def test_gibbs(self):
+        features = ['o1', 'o2', 'o3', 'o4', 'o5', 'o6']
+        sources = pd.DataFrame(self.source_data, index=['source1', 'source2'],
+                               columns=features)
+        sinks = pd.DataFrame(self.sink.reshape(1, 6), index=['sink1'],
+                             columns=features)
+        mpm, mps, fts = gibbs(sources, sinks, restarts=2, burnin=5,
+                              feature_blocks=True)
+        self.assertEqual(mpm.shape, (1, 3))
+        np.testing.assert_allclose(mpm.values.sum(), 1)
+        np.testing.assert_array_equal(fts[0].sum(0).values, self.sink * 2)
+        self.assertRaises(ValueError, gibbs, sources, sinks,
+                          feature_blocks=True, engine='numba')
+
+
 class PlotHeatmapTests(TestCase):
 
     def setUp(self):
@@ -18,7 +18,8 @@ import numpy as np
 import pandas as pd
 import pandas.util.testing as pdt
 
-from sourcetracker._util import parse_sample_metadata, biom_to_df
+from sourcetracker._util import (parse_sample_metadata, biom_to_df,
+                                 SparseFeatureTable)
 
 
 class ParseSampleMetadata(unittest.TestCase):
@@ -46,6 +47,46 @@ class BiomToDF(unittest.TestCase):
         obs = biom_to_df(Table(data, oids, sids))
         pd.util.testing.assert_frame_equal(obs, exp)
 
+    def test_convert_sparse(self):
+        data = np.arange(200).reshape(20, 10).astype(np.float64)
+        oids = ['o%s' % i for i in range(20)]
+        sids = ['s%s' % i for i in range(10)]
+        table = Table(data, oids, sids)
+        obs = biom_to_df(table, sparse=True)
+        self.assertIsInstance(obs, SparseFeatureTable)
+        pd.util.testing.assert_frame_equal(obs.to_dataframe(),
+                                           biom_to_df(table))
+
+
+class SparseFeatureTableTests(unittest.TestCase):
+
+    def setUp(self):
+        self.table = SparseFeatureTable(np.array([[0, 1, 2], [3, 0, 0]]),
+                                        ['s1', 's2'], ['o1', 'o2', 'o3'])
+
+    def test_shape_and_sum(self):
+        self.assertEqual(self.table.shape, (2, 3))
+        pdt.assert_series_equal(self.table.sum(1),
+                                pd.Series([3, 3], index=['s1', 's2']))
+        pdt.assert_series_equal(self.table.sum(),
+                                pd.Series([3, 1, 2], index=['o1', 'o2', 'o3']))
+
+    def test_select(self):
+        obs = self.table.select(['s2', 's1'])
+        self.assertEqual(list(obs.index), ['s2', 's1'])
+        np.testing.assert_array_equal(obs.matrix.toarray(),
+                                      [[3, 0, 0], [0, 1, 2]])
+        self.assertRaises(KeyError, self.table.select, ['s3'])
+
+    def test_take_features(self):
+        obs = self.table.take_features([2, 0])
+        self.assertEqual(list(obs.columns), ['o3', 'o1'])
+        np.testing.assert_array_equal(obs.matrix.toarray(), [[2, 0], [0, 3]])
+
+    def test_shape_mismatch(self):
+        self.assertRaises(ValueError, SparseFeatureTable, np.ones((2, 2)),
+                          ['s1', 's2'], ['o1', 'o2', 'o3'])
+
 
 if __name__ == "__main__":
     unittest.main()